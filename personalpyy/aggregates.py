@@ -0,0 +1,197 @@
+"""Incrementally maintained per-user aggregates.
+
+category_monthly_totals holds total/count per (user, month, category) and
+daily_balances holds the net amount per (user, day); the running balance is
+a window sum over the daily rows. Every write to transactions must call
+apply_rows inside the same SQLite transaction so the two never disagree.
+Amounts are integer cents throughout, so the totals are exact and are only
+converted to currency units on the way out.
+
+Usage: python aggregates.py rebuild|check
+"""
+from collections import defaultdict
+
+from models import from_cents
+
+# Uncategorized rows are stored under '' so they can be part of the primary key
+UNCATEGORIZED = ""
+
+AGGREGATE_TABLES = ("category_monthly_totals", "daily_balances")
+
+
+def create_tables(cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_monthly_totals (
+            user_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            total_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, month, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_balances (
+            user_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            net_cents INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, date)
+        ) WITHOUT ROWID
+    ''')
+
+
+
+def drop_tables(cursor):
+    for table in AGGREGATE_TABLES:
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def apply_rows(conn, user_id, rows, sign=1):
+    # rows: iterable of (date, amount_cents, category); sign=-1 removes them again
+    categories = defaultdict(lambda: [0, 0])
+    days = defaultdict(lambda: [0, 0])
+    for date, cents, category in rows:
+        key = (date[:7], category or UNCATEGORIZED)
+        categories[key][0] += sign * cents
+        categories[key][1] += sign
+        days[date][0] += sign * cents
+        days[date][1] += sign
+    if not days:
+        return
+    conn.executemany('''
+        INSERT INTO category_monthly_totals (user_id, month, category, total_cents, count)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (user_id, month, category)
+        DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count
+    ''', [(user_id, month, category, total, count) for (month, category), (total, count) in categories.items()])
+    conn.executemany('''
+        INSERT INTO daily_balances (user_id, date, net_cents, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, date)
+        DO UPDATE SET net_cents = net_cents + excluded.net_cents, count = count + excluded.count
+    ''', [(user_id, date, net, count) for date, (net, count) in days.items()])
+    if sign < 0:
+        conn.executemany(
+            "DELETE FROM category_monthly_totals WHERE user_id = ? AND month = ? AND category = ? AND count <= 0",
+            [(user_id, month, category) for month, category in categories]
+        )
+        conn.executemany(
+            "DELETE FROM daily_balances WHERE user_id = ? AND date = ? AND count <= 0",
+            [(user_id, date) for date in days]
+        )
+
+
+def rebuild(conn, user_id=None):
+    # Recomputes the aggregates from transactions in a single transaction
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for table in AGGREGATE_TABLES:
+            conn.execute(f"DELETE FROM {table} {where}", params)
+        conn.execute(f'''
+            INSERT INTO category_monthly_totals (user_id, month, category, total_cents, count)
+            SELECT user_id, substr(date, 1, 7), COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+            FROM transactions {where}
+            GROUP BY user_id, substr(date, 1, 7), COALESCE(category, '')
+        ''', params)
+        conn.execute(f'''
+            INSERT INTO daily_balances (user_id, date, net_cents, count)
+            SELECT user_id, date, SUM(amount_cents), COUNT(*)
+            FROM transactions {where}
+            GROUP BY user_id, date
+        ''', params)
+
+
+def check_consistency(conn):
+    # Returns a list of human-readable mismatches; empty means consistent
+    problems = []
+    expected = {
+        (row[0], row[1], row[2]): (row[3], row[4])
+        for row in conn.execute('''
+            SELECT user_id, substr(date, 1, 7), COALESCE(category, ''), SUM(amount_cents), COUNT(*)
+            FROM transactions GROUP BY 1, 2, 3
+        ''')
+    }
+    actual = {
+        (row[0], row[1], row[2]): (row[3], row[4])
+        for row in conn.execute("SELECT user_id, month, category, total_cents, count FROM category_monthly_totals")
+    }
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key, (0, 0)), actual.get(key, (0, 0))
+        if want != got:
+            problems.append(f"category_monthly_totals {key}: expected {want}, found {got}")
+    expected = {
+        (row[0], row[1]): (row[2], row[3])
+        for row in conn.execute("SELECT user_id, date, SUM(amount_cents), COUNT(*) FROM transactions GROUP BY 1, 2")
+    }
+    actual = {
+        (row[0], row[1]): (row[2], row[3])
+        for row in conn.execute("SELECT user_id, date, net_cents, count FROM daily_balances")
+    }
+    for key in expected.keys() | actual.keys():
+        want, got = expected.get(key, (0, 0)), actual.get(key, (0, 0))
+        if want != got:
+            problems.append(f"daily_balances {key}: expected {want}, found {got}")
+    return problems
+
+
+def category_totals(conn, user_id=None, month_from=None, month_to=None, by_month=False):
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if month_from is not None:
+        clauses.append("month >= ?")
+        params.append(month_from)
+    if month_to is not None:
+        clauses.append("month <= ?")
+        params.append(month_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    group = "month, category" if by_month else "category"
+    rows = conn.execute(f'''
+        SELECT {group}, SUM(total_cents) AS total, SUM(count) AS count
+        FROM category_monthly_totals {where}
+        GROUP BY {group} ORDER BY {group}
+    ''', params).fetchall()
+    return [
+        dict(row, category=row["category"] or None, total=from_cents(row["total"])) for row in rows
+    ]
+
+
+def balance_series(conn, user_id=None, bucket="day"):
+    # Running balance at the end of each day (or month) that has transactions
+    period = "date" if bucket == "day" else "substr(date, 1, 7)"
+    where, params = ("WHERE user_id = ?", (user_id,)) if user_id is not None else ("", ())
+    rows = conn.execute(f'''
+        SELECT {period} AS period, SUM(SUM(net_cents)) OVER (ORDER BY {period}) AS balance
+        FROM daily_balances {where}
+        GROUP BY {period} ORDER BY {period}
+    ''', params).fetchall()
+    return [{"date": row["period"], "balance": from_cents(row["balance"])} for row in rows]
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import connection, database_paths, init_db
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    if command not in ("rebuild", "check"):
+        print(__doc__.strip().splitlines()[-1])
+        sys.exit(2)
+    init_db()
+    problems = []
+    for path in database_paths():
+        with connection(path=path) as conn:
+            if command == "rebuild":
+                rebuild(conn)
+            else:
+                problems += check_consistency(conn)
+    if command == "rebuild":
+        print("Aggregates rebuilt.")
+    else:
+        for problem in problems:
+            print(problem)
+        print("Aggregates consistent." if not problems else f"{len(problems)} mismatches found.")
+        sys.exit(1 if problems else 0)
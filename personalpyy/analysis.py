@@ -1,32 +1,280 @@
-import pandas as pd
-import plotly.express as px
-import sqlite3
-from dotenv import load_dotenv
+import multiprocessing
 import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from database import connection, get_data_version, shard_paths, sharded
+from settings import settings
+import aggregates
+import timeseries
+
+TRANSACTION_COLUMNS = ("id", "user_id", "date", "description", "amount", "amount_cents", "category")
+DEFAULT_COLUMNS = ("id", "user_id", "date", "description", "amount", "category")
+LOAD_BATCH_SIZE = 50000
+# Number of loaded DataFrames kept, keyed by (user_id, data_version, window, columns)
+ANALYSIS_CACHE_SIZE = settings.analysis_cache_size
+# Processes loading shards in parallel for all-user loads (default: one per
+# shard, at most one per CPU)
+ANALYSIS_WORKERS = settings.analysis_workers
+
+_frame_cache = OrderedDict()
+_frame_cache_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_transactions_df(source=None, user_id=None, date_from=None, date_to=None, columns=None):
+    # source: optional Arrow IPC stream (bytes or binary file object), e.g.
+    # the body of GET /transactions/export?format=arrow. Otherwise rows are
+    # read from the database with typed columns; see load_transactions.
+    if source is not None:
+        return read_transactions_arrow(source)
+    return load_transactions(user_id, date_from, date_to, columns)
+
+def load_transactions(user_id=None, date_from=None, date_to=None, columns=None):
+    """Typed DataFrame of transactions, optionally for one user and date window.
+
+    Only the requested columns are selected. Dates become datetime64,
+    amount_cents int64 (exact; sum/cumsum on it rather than on amount),
+    amount float64 currency units and categories a pandas Categorical; arrays
+    are filled from fetchmany chunks instead of going through object-dtype
+    rows. Results are cached per data version, so repeated calls are free
+    until the user's transactions change.
+    """
+    columns = tuple(columns or DEFAULT_COLUMNS)
+    unknown = [c for c in columns if c not in TRANSACTION_COLUMNS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    key = (user_id, _data_version(user_id), date_from, date_to, columns)
+    with _frame_cache_lock:
+        df = _frame_cache.get(key)
+        if df is not None:
+            _frame_cache.move_to_end(key)
+            return df.copy(deep=False)
+    if user_id is None and sharded():
+        df = _load_sharded(date_from, date_to, columns)
+    else:
+        with connection(user_id) as conn:
+            df = _load_frame(conn, user_id, date_from, date_to, columns)
+    with _frame_cache_lock:
+        _frame_cache[key] = df
+        _frame_cache.move_to_end(key)
+        while len(_frame_cache) > ANALYSIS_CACHE_SIZE:
+            _frame_cache.popitem(last=False)
+    return df.copy(deep=False)
+
+def clear_frame_cache():
+    with _frame_cache_lock:
+        _frame_cache.clear()
+
+def _data_version(user_id):
+    if user_id is not None:
+        with connection(user_id) as conn:
+            return get_data_version(conn, user_id)
+    # Versions only grow, so their sum changes whenever any user's data does
+    versions = []
+    for path in shard_paths():
+        with connection(path=path) as conn:
+            versions.append(conn.execute("SELECT COUNT(*), COALESCE(SUM(data_version), 0) FROM users").fetchone()[:])
+    return tuple(versions)
 
-load_dotenv()
-DB_PATH = os.getenv("DATABASE_URL", "finance.db")
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = ANALYSIS_WORKERS or min(len(shard_paths()), os.cpu_count() or 1)
+            # spawn, not fork: the caller may be the threaded API server
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
 
-def get_transactions_df():
-    conn = sqlite3.connect(DB_PATH)
-    df = pd.read_sql_query("SELECT * FROM transactions", conn)
-    conn.close()
+def _load_shard(path, date_from, date_to, columns):
+    # Runs in a worker process, so it opens a plain connection of its own
+    conn = sqlite3.connect(path)
+    try:
+        return _load_frame(conn, None, date_from, date_to, columns)
+    finally:
+        conn.close()
+
+def _load_sharded(date_from, date_to, columns):
+    # Fan-out: every shard is loaded and typed in its own process, then the
+    # column arrays are concatenated; category codes are remapped onto the
+    # union of the shards' categories
+    paths = shard_paths()
+    frames = list(_get_executor().map(_load_shard, paths, repeat(date_from), repeat(date_to), repeat(columns)))
+    data = {}
+    for name in columns:
+        if name == "category":
+            data[name] = pd.api.types.union_categoricals([f[name].array for f in frames])
+        else:
+            data[name] = np.concatenate([f[name].to_numpy() for f in frames])
+    return pd.DataFrame(data, columns=list(columns))
+
+def _load_frame(conn, user_id, date_from, date_to, columns):
+    clauses, params = [], []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if date_from is not None:
+        clauses.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("date <= ?")
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    # Per-user loads come back in (date, id) order from idx_transactions_user_date;
+    # sorting every user's rows would cost more than the load itself
+    order = "ORDER BY date, id" if user_id is not None else ""
+    cursor = conn.cursor()
+    # Plain tuples: building sqlite3.Row objects roughly doubles fetch time
+    cursor.row_factory = None
+    select = ["amount_cents" if c == "amount" else c for c in columns]
+    cursor.execute(f"SELECT {', '.join(select)} FROM transactions {where} {order}", params)
+    chunks = {c: [] for c in columns}
+    category_codes = {}
+    while True:
+        rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+        if not rows:
+            break
+        # One C-level copy into an (n, columns) object array, then a cast per column
+        block = np.array(rows, dtype=object)
+        for i, name in enumerate(columns):
+            chunks[name].append(_column_chunk(name, block[:, i], category_codes))
+    data = {}
+    for name in columns:
+        parts = chunks[name]
+        if name == "category":
+            codes = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+            data[name] = pd.Categorical.from_codes(codes, categories=list(category_codes))
+        elif parts:
+            data[name] = np.concatenate(parts)
+        else:
+            data[name] = np.empty(0, dtype=_EMPTY_DTYPES[name])
+    return pd.DataFrame(data, columns=list(columns))
+
+_EMPTY_DTYPES = {
+    "id": np.int64, "user_id": np.int64, "date": "datetime64[s]",
+    "description": object, "amount": np.float64, "amount_cents": np.int64,
+}
+
+def _column_chunk(name, values, category_codes):
+    # values: 1-D object array holding one column of a fetched chunk
+    if name in ("id", "user_id", "amount_cents"):
+        return values.astype(np.int64)
+    if name == "amount":
+        return values.astype(np.int64) / 100
+    if name == "date":
+        try:
+            return values.astype("datetime64[s]")
+        except ValueError:
+            # Dates are free-form TEXT; unparseable ones become NaT
+            return pd.to_datetime(pd.Series(values), errors="coerce").to_numpy(dtype="datetime64[s]")
+    if name == "category":
+        # Codes are assigned in first-seen order and shared across chunks; None -> -1
+        lookup = category_codes.setdefault
+        return np.fromiter(
+            (-1 if v is None else lookup(v, len(category_codes)) for v in values), dtype=np.int32, count=len(values)
+        )
+    return values.copy()
+
+def read_transactions_arrow(source):
+    import pyarrow as pa
+    if isinstance(source, (bytes, bytearray)):
+        source = pa.BufferReader(source)
+    df = pa.ipc.open_stream(source).read_pandas()
+    if "date" in df.columns:
+        df["date"] = pd.to_datetime(df["date"])
     return df
 
-def plot_expenses_by_category():
-    df = get_transactions_df()
-    if df.empty:
+def apply_changes(df, upserts, deleted):
+    """Merge a GET /transactions/changes delta into a transactions frame.
+
+    upserts is either a list of row objects or the columnar form (one list
+    per field). Rows are matched on id: changed and deleted rows are
+    dropped, changed and new rows appended with the frame's dtypes, and the
+    result is put back in (date, id) order. Only the delta is converted;
+    the existing rows are moved by vectorized pandas operations.
+    """
+    ids = upserts["id"] if isinstance(upserts, dict) else [row["id"] for row in upserts]
+    drop = set(deleted).union(ids)
+    if drop:
+        df = df[~df["id"].isin(drop)]
+    if not ids:
+        return df.reset_index(drop=True)
+    new = pd.DataFrame(upserts, columns=df.columns)
+    for name in df.columns:
+        dtype = df[name].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            categories = dtype.categories.union(pd.Index(new[name].dropna().unique()))
+            df = df.assign(**{name: df[name].cat.set_categories(categories)})
+            new[name] = pd.Categorical(new[name], categories=categories)
+        elif name == "date":
+            new[name] = pd.to_datetime(new[name], errors="coerce").astype(dtype)
+        else:
+            new[name] = new[name].astype(dtype)
+    df = pd.concat([df, new], ignore_index=True)
+    return df.sort_values(["date", "id"], kind="stable", ignore_index=True)
+
+def _per_shard(user_id, query):
+    # query(conn) on the user's shard, or on every shard for all users
+    paths = [None] if user_id is not None else shard_paths()
+    results = []
+    for path in paths:
+        with connection(user_id, path) as conn:
+            results.append(query(conn))
+    return results
+
+def plot_expenses_by_category(user_id=None):
+    # Reads the precomputed monthly category totals instead of every transaction
+    frames = _per_shard(user_id, lambda conn: pd.DataFrame(
+        aggregates.category_totals(conn, user_id), columns=['category', 'total', 'count']
+    ))
+    cat_sum = pd.concat(frames, ignore_index=True).dropna(subset=['category'])
+    if len(frames) > 1:
+        cat_sum = cat_sum.groupby('category', as_index=False)[['total', 'count']].sum()
+    if cat_sum.empty:
         return None
-    cat_sum = df.groupby('category')['amount'].sum().reset_index()
-    fig = px.pie(cat_sum, names='category', values='amount', title='Expenses by Category')
+    # Imported here: loading the frames never needs plotly
+    import plotly.express as px
+    fig = px.pie(cat_sum, names='category', values='total', title='Expenses by Category')
     return fig
 
-def plot_balance_over_time():
-    df = get_transactions_df()
+def load_timeseries(user_id=None, bucket="day", metric="balance", category=None, date_from=None, date_to=None,
+                    max_points=timeseries.DEFAULT_MAX_POINTS):
+    """DataFrame of (date, value) per bucket, at most max_points rows.
+
+    Same series as GET /analytics/timeseries: balance at the end of each
+    bucket, or its total spend or income, downsampled with LTTB.
+    """
+    results = _per_shard(user_id, lambda conn: timeseries.daily_values(
+        conn, user_id, metric, category, date_from, date_to
+    ))
+    rows = results[0][0]
+    if len(results) > 1:
+        # Days are summed across shards before bucketing
+        totals = {}
+        for shard_rows, _ in results:
+            for day, cents in shard_rows:
+                totals[day] = totals.get(day, 0) + cents
+        rows = sorted(totals.items())
+    opening = sum(opening for _, opening in results)
+    data = timeseries.series(rows, opening, bucket, metric, date_from, date_to, max_points)
+    return pd.DataFrame({"date": np.array(data["dates"], dtype="M8[s]"), "value": data["values"]})
+
+def plot_timeseries(user_id=None, bucket="day", metric="balance", category=None, max_points=timeseries.DEFAULT_MAX_POINTS):
+    df = load_timeseries(user_id, bucket, metric, category, max_points=max_points)
     if df.empty:
         return None
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.sort_values('date')
-    df['balance'] = df['amount'].cumsum()
-    fig = px.line(df, x='date', y='balance', title='Balance Over Time')
+    import plotly.express as px
+    title = f"{metric.title()} by {bucket}" + (f" ({category})" if category else "")
+    return px.line(df, x='date', y='value', title=title)
+
+def plot_balance_over_time(user_id=None):
+    # At most DEFAULT_MAX_POINTS points, however long the history
+    fig = plot_timeseries(user_id, "day", "balance")
+    if fig is not None:
+        fig.update_layout(title='Balance Over Time', yaxis_title='balance')
     return fig
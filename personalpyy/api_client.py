@@ -0,0 +1,137 @@
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from settings import settings
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+API_URL = settings.api_url
+# kind="columns" asks for one array per field, so DataFrames are built
+# without a dict per row: MessagePack if installed here, else JSON arrays
+COLUMNS_ACCEPT = "application/vnd.personalpy.columns+json"
+if msgpack is not None:
+    COLUMNS_ACCEPT = f"application/x-msgpack, {COLUMNS_ACCEPT};q=0.9"
+# Decoded bodies kept per browser session by cached_get
+MAX_CACHED_RESPONSES = 64
+
+
+@st.cache_resource
+def get_session():
+    # One keep-alive connection pool shared by every rerun and browser session
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def auth_headers(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def error_detail(resp):
+    try:
+        return resp.json().get("detail", "Unknown error")
+    except Exception:
+        return resp.text
+
+
+def _decode(content, kind, media_type=None):
+    if kind == "arrow":
+        from analysis import get_transactions_df
+        return get_transactions_df(content)
+    if media_type and media_type.startswith("application/x-msgpack"):
+        return msgpack.unpackb(content)
+    import json
+    return json.loads(content)
+
+
+def cached_get(path, token, params=None, kind="json"):
+    """Conditional GET against the API; returns (status_code, data, error).
+
+    The last ETag and decoded body per request are kept together in session
+    state, and the ETag is sent as If-None-Match, so unchanged data costs a
+    304 and no decoding. An ETag is only ever sent while its body is still
+    held, so a 304 always has something to return.
+    """
+    params = params or {}
+    responses = st.session_state.setdefault("responses", {})
+    key = (token, path, tuple(sorted(params.items())))
+    headers = auth_headers(token)
+    if kind == "columns":
+        headers["Accept"] = COLUMNS_ACCEPT
+    cached = responses.get(key)
+    if cached is not None:
+        headers["If-None-Match"] = cached[0]
+    resp = get_session().get(f"{API_URL}{path}", params=params, headers=headers)
+    if resp.status_code == 304 and cached is not None:
+        # Most recently used entries are kept longest
+        responses[key] = responses.pop(key)
+        return 200, cached[1], None
+    if resp.status_code != 200:
+        return resp.status_code, None, error_detail(resp)
+    data = _decode(resp.content, kind, resp.headers.get("Content-Type"))
+    etag = resp.headers.get("ETag")
+    responses.pop(key, None)
+    if etag is not None:
+        responses[key] = (etag, data)
+        while len(responses) > MAX_CACHED_RESPONSES:
+            del responses[next(iter(responses))]
+    return 200, data, None
+
+
+def synced_transactions(token, fields):
+    """Transactions DataFrame kept in session state and updated by deltas.
+
+    The first call loads the Arrow export; later calls fetch only what
+    changed since the cached data version from /transactions/changes, in
+    the columnar encoding, and merge it in, so a rerun costs in proportion
+    to the number of changes rather than the size of the history. The ETag
+    is kept with the ``since`` it was issued for, so once nothing changes
+    the repeated request is answered with a 304. Returns (status_code, df,
+    error) like cached_get.
+    """
+    from analysis import apply_changes
+
+    state = st.session_state.get("tx_sync")
+    if state is None or state["token"] != token or state["fields"] != fields:
+        return _full_sync(token, fields)
+    since = state["version"]
+    headers = dict(auth_headers(token), Accept=COLUMNS_ACCEPT)
+    # A tag from a request with an older since never matches this one
+    etag_since, etag = state["etag"]
+    if etag and etag_since == since:
+        headers["If-None-Match"] = etag
+    resp = get_session().get(
+        f"{API_URL}/transactions/changes", params={"since": since, "fields": fields}, headers=headers
+    )
+    if resp.status_code == 304:
+        return 200, state["df"], None
+    if resp.status_code != 200:
+        return resp.status_code, state["df"], error_detail(resp)
+    delta = _decode(resp.content, "columns", resp.headers.get("Content-Type"))
+    if delta["full"]:
+        return _full_sync(token, fields)
+    state["df"] = apply_changes(state["df"], delta["upserts"], delta["deleted"])
+    state["version"] = delta["version"]
+    state["etag"] = (since, resp.headers.get("ETag"))
+    return 200, state["df"], None
+
+
+def _full_sync(token, fields):
+    resp = get_session().get(
+        f"{API_URL}/transactions/export", params={"format": "arrow", "fields": fields}, headers=auth_headers(token)
+    )
+    if resp.status_code != 200:
+        st.session_state.pop("tx_sync", None)
+        return resp.status_code, None, error_detail(resp)
+    df = _decode(resp.content, "arrow")
+    st.session_state.tx_sync = {
+        "token": token, "fields": fields, "df": df,
+        "version": int(resp.headers["X-Data-Version"]), "etag": (None, None),
+    }
+    return 200, df, None
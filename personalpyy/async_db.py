@@ -0,0 +1,181 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+import aiosqlite
+
+import metrics
+from pool import PRAGMAS
+
+
+class AsyncReadPool:
+    """Fixed set of aiosqlite connections used for reads only."""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self.size = size
+        self._idle = asyncio.Queue()
+        self._conns = []
+
+    async def open(self):
+        for _ in range(self.size):
+            conn = await aiosqlite.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            for pragma in PRAGMAS:
+                await conn.execute(pragma)
+            self._conns.append(conn)
+            self._idle.put_nowait(conn)
+
+    @asynccontextmanager
+    async def connection(self):
+        conn = await self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put_nowait(conn)
+
+    async def close(self):
+        for conn in self._conns:
+            await conn.close()
+        self._conns.clear()
+
+
+class WriteQueue:
+    """Funnels every write through one connection and one task.
+
+    Callers submit a function ``fn(conn, *args)``; the writer task drains
+    whatever has queued up (up to ``max_batch``), runs the functions in one
+    BEGIN IMMEDIATE transaction with a SAVEPOINT around each so a failing
+    write is rolled back alone, and commits the batch once. Under load this
+    turns N fsyncs into one and removes "database is locked" retries between
+    writers. The functions run on the writer's own thread so they can reuse
+    the synchronous helpers in database.py.
+    """
+
+    def __init__(self, path, max_batch=256):
+        self.path = path
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._conn = None
+        self._task = None
+        self._loop = None
+        self.batches = 0
+        self.writes = 0
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._conn = await self._loop.run_in_executor(self._executor, self._connect)
+        self._task = asyncio.create_task(self._run())
+
+    def _connect(self):
+        # Autocommit mode: transactions are managed explicitly in _apply
+        conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return metrics.instrument_connection(conn)
+
+    async def submit(self, fn, *args):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, future))
+        return await future
+
+    def submit_threadsafe(self, fn, *args):
+        # For worker threads (bulk imports, background jobs): blocks until the
+        # batch holding fn commits. Calling it on the event loop deadlocks.
+        return asyncio.run_coroutine_threadsafe(self.submit(fn, *args), self._loop).result()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    self._queue.put_nowait(None)
+                    break
+                batch.append(item)
+            try:
+                results = await loop.run_in_executor(self._executor, self._apply, batch)
+            except Exception as exc:
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            for (_, _, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply(self, batch):
+        conn = self._conn
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for fn, args, _ in batch:
+                conn.execute("SAVEPOINT write_op")
+                try:
+                    results.append((True, fn(conn, *args)))
+                    conn.execute("RELEASE write_op")
+                except Exception as exc:
+                    conn.execute("ROLLBACK TO write_op")
+                    conn.execute("RELEASE write_op")
+                    results.append((False, exc))
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        self.batches += 1
+        self.writes += len(batch)
+        return results
+
+    async def stop(self):
+        if self._task is not None:
+            await self._queue.put(None)
+            await self._task
+            self._task = None
+        if self._conn is not None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=False)
+
+
+read_pool = None
+writer = None
+
+
+async def start(path, read_pool_size=4):
+    global read_pool, writer
+    read_pool = AsyncReadPool(path, size=read_pool_size)
+    await read_pool.open()
+    writer = WriteQueue(path)
+    await writer.start()
+
+
+async def stop():
+    global read_pool, writer
+    if writer is not None:
+        await writer.stop()
+        writer = None
+    if read_pool is not None:
+        await read_pool.close()
+        read_pool = None
+
+
+@metrics.register_collector
+def writer_metrics():
+    if writer is None:
+        return []
+    return [
+        ("db_write_batches_total", "counter", "Transactions committed by the async writer", [({}, writer.batches)]),
+        ("db_writes_total", "counter", "Write operations applied by the async writer", [({}, writer.writes)]),
+    ]
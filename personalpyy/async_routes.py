@@ -0,0 +1,103 @@
+import time
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, status
+from fastapi.routing import APIRoute
+from typing import List, Optional
+
+import async_db
+import database
+import encoding
+from database import delete_transaction_row, insert_transaction, update_transaction_row
+from models import Transaction, TransactionCreate
+
+
+def build_router(api):
+    # api is the main module; its helpers are shared so both modes produce
+    # identical responses.
+    router = APIRouter()
+
+    async def get_current_user(token: str = Depends(api.oauth2_scheme)):
+        user = api.token_cache.get(token)
+        if user is None:
+            async with async_db.read_pool.connection() as conn:
+                async with conn.execute(api.TOKEN_LOOKUP_SQL, (token,)) as cursor:
+                    user = api.user_from_token_row(await cursor.fetchone())
+            if user is None or user.expires_at <= time.time():
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate credentials",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+            api.token_cache.put(token, user)
+        return user
+
+    @router.get("/transactions/", response_model=List[Transaction])
+    async def list_transactions(
+        request: Request,
+        after_id: Optional[int] = None,
+        limit: Optional[int] = Query(None, ge=1, le=api.MAX_PAGE_SIZE),
+        filters=Depends(api.transaction_filters),
+        fields=Depends(api.parse_fields),
+        fmt=Depends(encoding.negotiate),
+        user=Depends(get_current_user),
+    ):
+        async with async_db.read_pool.connection() as conn:
+            async with conn.execute("SELECT data_version FROM users WHERE id = ?", (user[0],)) as cursor:
+                row = await cursor.fetchone()
+            etag, not_modified = api.conditional_for_version(request, user, row[0] if row else 0, fmt)
+            if not_modified is not None:
+                return not_modified
+            after = None
+            if after_id is not None:
+                async with conn.execute(api.CURSOR_LOOKUP_SQL, (after_id, user[0])) as cursor:
+                    cursor_row = await cursor.fetchone()
+                if cursor_row is None:
+                    raise HTTPException(status_code=400, detail="Invalid cursor")
+                after = (cursor_row["date"], after_id)
+            sql, params = api.list_query(user[0], filters, fields, after, limit)
+            async with conn.execute(sql, params) as cursor:
+                rows = await cursor.fetchall()
+        return api.list_response(rows, fields, limit, etag, fmt)
+
+    @router.post("/transactions/", response_model=Transaction)
+    async def add_transaction(tx: TransactionCreate, user=Depends(get_current_user)):
+        tx_id = await async_db.writer.submit(insert_transaction, user[0], tx)
+        return tx.stored(tx_id, user[0])
+
+    @router.delete("/transactions/{tx_id}")
+    async def delete_transaction(tx_id: str, user=Depends(get_current_user)):
+        affected = await async_db.writer.submit(delete_transaction_row, user[0], tx_id)
+        if affected == 0:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        return {"detail": "Transaction deleted"}
+
+    @router.put("/transactions/{tx_id}", response_model=Transaction)
+    async def update_transaction(tx_id: int, tx: TransactionCreate = Body(...), user=Depends(get_current_user)):
+        affected = await async_db.writer.submit(update_transaction_row, user[0], tx_id, tx)
+        if affected == 0:
+            raise HTTPException(status_code=404, detail="Transaction not found or not owned by user")
+        return tx.stored(tx_id, user[0])
+
+    return router
+
+
+def install(app, api, read_pool_size=4):
+    """Swap the sync transaction routes on ``app`` for the async ones."""
+    router = build_router(api)
+    replaced = {(route.path, frozenset(route.methods)) for route in router.routes}
+    app.router.routes = [
+        route for route in app.router.routes
+        if not (isinstance(route, APIRoute) and (route.path, frozenset(route.methods)) in replaced)
+    ]
+    app.include_router(router)
+
+    async def start():
+        await async_db.start(database.DB_PATH, read_pool_size)
+        database.write_through = async_db.writer.submit_threadsafe
+
+    async def stop():
+        database.write_through = None
+        await async_db.stop()
+
+    app.on_event("startup")(start)
+    app.on_event("shutdown")(stop)
@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Compact record kept per token; indexable like the users row (user[0] is the id)
+CachedUser = namedtuple("CachedUser", ["id", "username", "expires_at"])
+
+
+class TokenCache:
+    """Thread-safe LRU mapping token -> CachedUser with a per-entry TTL.
+
+    An entry expires after ``ttl`` seconds or at the token's own expiry,
+    whichever comes first. ``invalidate_user`` drops whatever token a user
+    currently has cached, which is how token rotation revokes the old one.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._tokens_by_user = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, cached_until = entry
+            if cached_until <= now:
+                self._remove(token)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return user
+
+    def __contains__(self, token):
+        # Whether token is cached and unexpired, without counting a lookup
+        # or refreshing its LRU position
+        with self._lock:
+            entry = self._entries.get(token)
+            return entry is not None and entry[1] > time.time()
+
+    def put(self, token, user):
+        if self.maxsize <= 0:
+            return
+        cached_until = min(time.time() + self.ttl, user.expires_at)
+        with self._lock:
+            old_token = self._tokens_by_user.get(user.id)
+            if old_token is not None and old_token != token:
+                self._remove(old_token)
+            self._entries[token] = (user, cached_until)
+            self._entries.move_to_end(token)
+            self._tokens_by_user[user.id] = token
+            while len(self._entries) > self.maxsize:
+                oldest, (evicted, _) = self._entries.popitem(last=False)
+                self._forget_user(evicted.id, oldest)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            token = self._tokens_by_user.get(user_id)
+            if token is not None:
+                self._remove(token)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tokens_by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _remove(self, token):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._forget_user(entry[0].id, token)
+
+    def _forget_user(self, user_id, token):
+        if self._tokens_by_user.get(user_id) == token:
+            del self._tokens_by_user[user_id]
@@ -0,0 +1,6 @@
+import os
+
+# Benchmarks drive one token far harder than a real client; measure the
+# code, not the rate limiter (bench_throttle sets its own limits)
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("LOGIN_RATE_LIMIT_PER_MINUTE", "0")
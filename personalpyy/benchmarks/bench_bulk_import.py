@@ -0,0 +1,86 @@
+"""Rows/sec importing transactions one POST at a time vs POST /transactions/bulk.
+
+Run from the personalpyy directory:
+
+    python -m benchmarks.bench_bulk_import [--rows 5000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from fastapi.testclient import TestClient
+
+import main
+
+CATEGORIES = ["groceries", "rent", "transport", "dining", "utilities", "salary"]
+
+
+def make_rows(n):
+    return [
+        {
+            "date": f"2024-{random.randint(1, 12):02d}-{random.randint(1, 28):02d}",
+            "description": f"statement line {i}",
+            "amount": round(random.uniform(1, 500), 2),
+            "category": random.choice(CATEGORIES),
+        }
+        for i in range(n)
+    ]
+
+
+def to_csv(rows):
+    lines = ["date,description,amount,category"]
+    lines += [f"{r['date']},{r['description']},{r['amount']},{r['category']}" for r in rows]
+    return "\n".join(lines) + "\n"
+
+
+def login(client, name):
+    client.post("/register", json={"username": name, "password": "bench"})
+    token = client.post("/token", data={"username": name, "password": "bench"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=5000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    results = {}
+
+    with TestClient(main.app) as client:
+        headers = login(client, f"single_{time.time_ns()}")
+        start = time.perf_counter()
+        for row in rows:
+            assert client.post("/transactions/", json=row, headers=headers).status_code == 200
+        results["single POST /transactions/"] = time.perf_counter() - start
+
+        headers = login(client, f"bulk_json_{time.time_ns()}")
+        start = time.perf_counter()
+        resp = client.post("/transactions/bulk", json=rows, headers=headers)
+        assert resp.json()["inserted"] == len(rows), resp.text
+        results["bulk JSON"] = time.perf_counter() - start
+
+        headers = login(client, f"bulk_csv_{time.time_ns()}")
+        body = to_csv(rows)
+        start = time.perf_counter()
+        resp = client.post("/transactions/bulk", content=body, headers={**headers, "content-type": "text/csv"})
+        assert resp.json()["inserted"] == len(rows), resp.text
+        results["bulk CSV"] = time.perf_counter() - start
+
+        headers = login(client, f"bulk_dedupe_{time.time_ns()}")
+        client.post("/transactions/bulk", json=rows, headers=headers)
+        start = time.perf_counter()
+        resp = client.post("/transactions/bulk?dedupe=true", json=rows, headers=headers)
+        assert len(resp.json()["duplicates"]) == len(rows), resp.text
+        results["bulk JSON, dedupe (all dup)"] = time.perf_counter() - start
+
+    print(f"{'path':<30}{'seconds':>10}{'rows/s':>12}")
+    for name, elapsed in results.items():
+        print(f"{name:<30}{elapsed:>10.2f}{args.rows / elapsed:>12.0f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,64 @@
+"""Requests/sec on the transaction endpoints with and without the connection pool.
+
+Run from the personalpyy directory:
+
+    python -m benchmarks.bench_connections [--requests 500] [--threads 8]
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from fastapi.testclient import TestClient
+
+import database
+import main
+
+
+def run(client, headers, n_requests, threads):
+    def get(_):
+        return client.get("/transactions/", headers=headers).status_code
+
+    def post(i):
+        tx = {"date": "2024-01-01", "description": f"bench {i}", "amount": 1.5, "category": "bench"}
+        return client.post("/transactions/", json=tx, headers=headers).status_code
+
+    results = {}
+    for name, fn in (("POST /transactions/", post), ("GET /transactions/", get)):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as ex:
+            codes = list(ex.map(fn, range(n_requests)))
+        elapsed = time.perf_counter() - start
+        assert all(code == 200 for code in codes), codes
+        results[name] = n_requests / elapsed
+    return results
+
+
+def bench(pool_size, n_requests, threads):
+    database.close_pool()
+    database.DB_POOL_SIZE = pool_size
+    with TestClient(main.app) as client:
+        username = f"bench_{pool_size}_{time.time_ns()}"
+        client.post("/register", json={"username": username, "password": "bench"})
+        token = client.post("/token", data={"username": username, "password": "bench"}).json()["access_token"]
+        return run(client, {"Authorization": f"Bearer {token}"}, n_requests, threads)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    before = bench(0, args.requests, args.threads)
+    after = bench(8, args.requests, args.threads)
+    print(f"{'endpoint':<22}{'per-call req/s':>16}{'pooled req/s':>16}")
+    for name in before:
+        print(f"{name:<22}{before[name]:>16.1f}{after[name]:>16.1f}")
+
+
+if __name__ == "__main__":
+    main_()
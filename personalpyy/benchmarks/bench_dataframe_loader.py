@@ -0,0 +1,86 @@
+"""Time and memory of the typed transaction loader vs pd.read_sql_query.
+
+Seeds a temp database (default 10 users x 100k = 1M rows) and compares:
+the old path (read_sql_query on SELECT * plus pd.to_datetime on the dates),
+a cold typed load, a cached load, and a one-user/one-year window. Run from
+the personalpyy directory:
+
+    python -m benchmarks.bench_dataframe_loader [--users 10] [--transactions 100000] [--repeat 3]
+"""
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import pandas as pd
+
+import analysis
+import database
+from benchmarks import datagen
+
+
+def legacy_load():
+    with database.connection() as conn:
+        df = pd.read_sql_query("SELECT * FROM transactions", conn)
+    df["date"] = pd.to_datetime(df["date"])
+    return df
+
+
+def measure(fn, repeat):
+    # Best wall time over repeat runs, peak traced allocation of one run, and
+    # the resulting frame's deep memory usage
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        df = fn()
+        times.append(time.perf_counter() - start)
+        del df
+    gc.collect()
+    tracemalloc.start()
+    df = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, int(df.memory_usage(deep=True).sum()), len(df)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--transactions", type=int, default=100000, help="per user")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    database.init_db()
+    start = time.perf_counter()
+    with database.connection() as conn:
+        user_ids = datagen.generate(conn, args.users, args.transactions)
+    print(f"Seeded {args.users * args.transactions} rows in {time.perf_counter() - start:.1f}s\n")
+
+    def cold():
+        analysis.clear_frame_cache()
+        return analysis.load_transactions()
+
+    def window():
+        analysis.clear_frame_cache()
+        return analysis.load_transactions(user_ids[0], "2024-01-01", "2024-12-31", ("date", "amount", "category"))
+
+    analysis.load_transactions()
+    cases = (
+        ("read_sql_query + to_datetime", legacy_load),
+        ("typed loader (cold)", cold),
+        ("typed loader (cached)", analysis.load_transactions),
+        ("typed loader, 1 user/1 year, 3 cols", window),
+    )
+    print(f"{'loader':<38}{'rows':>10}{'time s':>9}{'peak MB':>10}{'frame MB':>10}")
+    for name, fn in cases:
+        elapsed, peak, size, rows = measure(fn, args.repeat)
+        print(f"{name:<38}{rows:>10}{elapsed:>9.3f}{peak / 2**20:>10.1f}{size / 2**20:>10.1f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,92 @@
+"""Concurrent read/write throughput with DB_MODE=sync vs DB_MODE=async.
+
+Each mode runs in its own subprocess (the mode is fixed when main is
+imported) against a fresh temp database. Run from the personalpyy directory:
+
+    python -m benchmarks.bench_db_mode [--clients 32] [--requests 100] [--write-ratio 0.5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def worker(args):
+    os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from fastapi.testclient import TestClient
+
+    import main
+
+    latencies, errors = [], 0
+    with TestClient(main.app) as client:
+        headers = []
+        for i in range(args.clients):
+            name = f"client{i}"
+            client.post("/register", json={"username": name, "password": "bench"})
+            token = client.post("/token", data={"username": name, "password": "bench"}).json()["access_token"]
+            headers.append({"Authorization": f"Bearer {token}"})
+
+        def run_client(i):
+            nonlocal errors
+            h = headers[i]
+            for n in range(args.requests):
+                write = (n * args.write_ratio) % 1 + args.write_ratio >= 1
+                start = time.perf_counter()
+                if write:
+                    tx = {"date": f"2024-01-{n % 28 + 1:02d}", "description": "bench", "amount": 1.0, "category": "bench"}
+                    resp = client.post("/transactions/", json=tx, headers=h)
+                else:
+                    resp = client.get("/transactions/", params={"limit": 50}, headers=h)
+                latencies.append((time.perf_counter() - start) * 1000)
+                if resp.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as ex:
+            list(ex.map(run_client, range(args.clients)))
+        elapsed = time.perf_counter() - start
+        result = {
+            "requests": len(latencies),
+            "errors": errors,
+            "req_per_s": len(latencies) / elapsed,
+            "p50_ms": statistics.median(latencies),
+            "p99_ms": sorted(latencies)[int(len(latencies) * 0.99) - 1],
+        }
+        if main.DB_MODE == "async":
+            import async_db
+            result["write_batches"] = async_db.writer.batches
+            result["writes"] = async_db.writer.writes
+    print(json.dumps(result))
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--write-ratio", type=float, default=0.5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    print(f"{'mode':<8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'commits':>10}")
+    for mode in ("sync", "async"):
+        env = dict(os.environ, DB_MODE=mode)
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_db_mode", "--worker",
+             "--clients", str(args.clients), "--requests", str(args.requests),
+             "--write-ratio", str(args.write_ratio)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        commits = r.get("write_batches", "-")
+        print(f"{mode:<8}{r['req_per_s']:>10.1f}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['errors']:>8}{commits:>10}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,96 @@
+"""Dashboard refresh cost: full Arrow reload vs delta sync.
+
+Seeds one user with --transactions rows, loads the frame once, then after
+each batch of --changes writes (inserts, updates and deletes) refreshes it
+both ways: re-downloading and decoding the whole export, or fetching
+/transactions/changes and merging it with analysis.apply_changes. The app
+runs in-process (httpx ASGITransport, no sockets). Run from the personalpyy
+directory:
+
+    python -m benchmarks.bench_delta_sync [--transactions 100000] [--changes 1 10 100 1000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("JOBS_ENABLED", "0")
+
+import httpx
+
+import database
+import main
+from analysis import apply_changes, get_transactions_df
+from benchmarks import datagen
+
+FIELDS = "id,date,description,amount,category"
+
+
+async def full_reload(client, headers):
+    resp = await client.get("/transactions/export", params={"format": "arrow", "fields": FIELDS}, headers=headers)
+    return get_transactions_df(resp.content), int(resp.headers["X-Data-Version"])
+
+
+async def delta(client, headers, df, version):
+    resp = await client.get("/transactions/changes", params={"since": version, "fields": FIELDS}, headers=headers)
+    body = resp.json()
+    assert not body["full"]
+    return apply_changes(df, body["upserts"], body["deleted"]), body["version"]
+
+
+async def write_changes(client, headers, count, ids):
+    # A third each of inserts, updates and deletes
+    for i in range(count):
+        if i % 3 == 0:
+            await client.post("/transactions/", json={"date": "2024-06-01", "description": "Bench", "amount": -1.5,
+                                                      "category": "Dining"}, headers=headers)
+        elif i % 3 == 1:
+            await client.put(f"/transactions/{ids.pop()}", json={"date": "2024-06-02", "description": "Edited",
+                                                                 "amount": -2.5, "category": "Dining"}, headers=headers)
+        else:
+            await client.delete(f"/transactions/{ids.pop()}", headers=headers)
+
+
+async def run(args):
+    async with main.app.router.lifespan_context(main.app):
+        with database.connection() as conn:
+            datagen.generate(conn, 1, args.transactions)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            resp = await client.post("/token", data={"username": "bench0", "password": datagen.PASSWORD})
+            headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+            df, version = await full_reload(client, headers)
+            ids = list(df["id"])
+            print(f"{args.transactions} rows; median of {args.repeat} refreshes\n")
+            print(f"{'changes':>8}{'full reload ms':>16}{'delta ms':>10}{'speedup':>9}")
+            for count in args.changes:
+                full_times, delta_times = [], []
+                for _ in range(args.repeat):
+                    await write_changes(client, headers, count, ids)
+                    start = time.perf_counter()
+                    df, version = await delta(client, headers, df, version)
+                    delta_times.append(time.perf_counter() - start)
+                    start = time.perf_counter()
+                    fresh, _ = await full_reload(client, headers)
+                    full_times.append(time.perf_counter() - start)
+                    assert len(fresh) == len(df)
+                full_ms, delta_ms = statistics.median(full_times) * 1000, statistics.median(delta_times) * 1000
+                print(f"{count:>8}{full_ms:>16.1f}{delta_ms:>10.1f}{full_ms / delta_ms:>8.1f}x")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=100000)
+    parser.add_argument("--changes", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,93 @@
+"""Cold import time of the entry points, checked against a budget.
+
+Each module is imported --repeat times in a fresh interpreter under
+``python -X importtime``; the median cumulative time is compared with its
+budget and the slowest direct imports are listed. Heavy libraries an entry
+point must only load on first use (see LAZY) fail the check if they are
+imported anyway. Exits non-zero on any failure, so it can gate CI. Run from
+the personalpyy directory:
+
+    python -m benchmarks.bench_import_time [--repeat 5] [--budget main=900 analysis=1200]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Milliseconds, with headroom for slower machines; fastapi alone is most of main's
+BUDGETS_MS = {"main": 900, "analysis": 1200, "hashing": 300, "dashboard": 2500}
+# Libraries each entry point must not import at load time (pandas itself
+# loads pyarrow, and streamlit loads pandas and plotly)
+LAZY = {
+    "main": ("pandas", "numpy", "plotly", "pyarrow", "passlib", "aiosqlite"),
+    "analysis": ("plotly",),
+    "hashing": ("passlib",),
+    "dashboard": ("analysis", "passlib"),
+}
+
+
+def import_once(module, env):
+    # Returns (cumulative ms, {direct import: cumulative ms}, loaded module names)
+    code = f"import sys, json; import {module}; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], env=env, capture_output=True, text=True, check=True,
+    )
+    total, children = None, {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = len(name) - len(name.lstrip())
+        if depth == 1:
+            # Children are printed before their parent: everything since the
+            # previous top-level import belongs to this one
+            if name.strip() == module:
+                total = int(cumulative) / 1000
+                break
+            children = {}
+        elif depth == 3:
+            children[name.strip()] = int(cumulative) / 1000
+    return total, children, json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=list(BUDGETS_MS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", nargs="*", default=[], metavar="MODULE=MS", help="override a budget")
+    parser.add_argument("--top", type=int, default=5, help="slowest direct imports to list")
+    args = parser.parse_args()
+    budgets = dict(BUDGETS_MS, **{k: float(v) for k, v in (b.split("=") for b in args.budget)})
+
+    env = dict(os.environ, DATABASE_URL=os.path.join(tempfile.mkdtemp(), "bench.db"))
+    failures = []
+    print(f"{'module':<12}{'median ms':>11}{'min ms':>9}{'budget':>9}")
+    for module in args.modules:
+        runs = [import_once(module, env) for _ in range(args.repeat)]
+        times = [r[0] for r in runs]
+        median = statistics.median(times)
+        budget = budgets.get(module)
+        over = budget is not None and median > budget
+        print(f"{module:<12}{median:>11.0f}{min(times):>9.0f}{budget or '-':>9}{'  OVER' if over else ''}")
+        if over:
+            failures.append(f"{module}: {median:.0f} ms > {budget:.0f} ms")
+        fastest = min(runs, key=lambda r: r[0])
+        for name, ms in sorted(fastest[1].items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"    {name:<30}{ms:>8.0f}")
+        loaded = set(fastest[2])
+        for lib in LAZY.get(module, ()):
+            if lib in loaded:
+                failures.append(f"{module}: imports {lib} at load time")
+    if failures:
+        print("\nFAILED\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nAll imports within budget.")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,88 @@
+"""p50/p99 latency of GET /transactions/ while logins run concurrently.
+
+Compares bcrypt on the request threadpool (BCRYPT_WORKERS=0) with the
+dedicated hashing process pool. Run from the personalpyy directory:
+
+    python -m benchmarks.bench_login_contention [--seconds 10] [--login-threads 48]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+from fastapi.testclient import TestClient
+
+import hashing
+import main
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench(workers, seconds, login_threads):
+    hashing.shutdown_executor()
+    hashing.BCRYPT_WORKERS = workers
+    with TestClient(main.app) as client:
+        username = f"bench_{workers}_{time.time_ns()}"
+        client.post("/register", json={"username": username, "password": "bench"})
+        # Reads use their own account so logins do not rotate the reader's token
+        reader = username + "_reader"
+        client.post("/register", json={"username": reader, "password": "bench"})
+        token = client.post("/token", data={"username": reader, "password": "bench"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        for i in range(50):
+            tx = {"date": "2024-01-01", "description": f"bench {i}", "amount": 1.5, "category": "bench"}
+            client.post("/transactions/", json=tx, headers=headers)
+
+        stop = threading.Event()
+        logins = [0]
+
+        def login_loop():
+            while not stop.is_set():
+                client.post("/token", data={"username": username, "password": "bench"})
+                logins[0] += 1
+
+        threads = [threading.Thread(target=login_loop) for _ in range(login_threads)]
+        for t in threads:
+            t.start()
+        latencies = []
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            assert client.get("/transactions/", headers=headers).status_code == 200
+            latencies.append((time.perf_counter() - start) * 1000)
+        stop.set()
+        for t in threads:
+            t.join()
+    return {
+        "reads": len(latencies),
+        "logins": logins[0],
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--login-threads", type=int, default=48)
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    args = parser.parse_args()
+
+    results = {
+        "threadpool": bench(0, args.seconds, args.login_threads),
+        f"process pool ({args.workers})": bench(args.workers, args.seconds, args.login_threads),
+    }
+    print(f"{'bcrypt mode':<22}{'reads':>8}{'logins':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<22}{r['reads']:>8}{r['logins']:>8}{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,97 @@
+"""Full-text search (FTS5) vs a LIKE '%q%' scan.
+
+Seeds a temp database (default 10 users x 100k = 1M rows) and times both
+ways of finding one user's matching transactions: the first page of 50
+hits, and a count of all hits. The synthetic descriptions reuse a small
+vocabulary, so common terms match thousands of rows (the worst case for FTS
+ranking, and the best case for LIKE, which stops after 50 recent rows).
+A few rare rows and a term with no hits show the other end. Run from the
+personalpyy directory:
+
+    python -m benchmarks.bench_search [--users 10] [--transactions 100000] [--repeat 5]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import database
+from benchmarks import datagen
+from search import fts_query, search_query
+
+# (FTS query, equivalent LIKE patterns that must all match the description)
+QUERIES = (
+    ("dentist", ("%dentist%",)),
+    ("train ticket", ("%train%", "%ticket%")),
+    ("super*", ("%super%",)),
+    ("piano", ("%piano%",)),
+    ("zeppelin", ("%zeppelin%",)),
+)
+RARE_ROWS = 20
+PAGE = 50
+
+
+def like_where(patterns):
+    return " AND ".join(["user_id = ?"] + ["description LIKE ?"] * len(patterns))
+
+
+def like_query(user_id, patterns):
+    sql = f"SELECT * FROM transactions WHERE {like_where(patterns)} ORDER BY date DESC, id LIMIT ?"
+    return sql, [user_id, *patterns, PAGE]
+
+
+def like_count(user_id, patterns):
+    return f"SELECT COUNT(*) FROM transactions WHERE {like_where(patterns)}", [user_id, *patterns]
+
+
+def fts_count(match):
+    return "SELECT COUNT(*) FROM transactions_fts WHERE transactions_fts MATCH ?", [match]
+
+
+def timed(conn, sql, params, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000, rows
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--transactions", type=int, default=100000, help="per user")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database.init_db()
+    start = time.perf_counter()
+    with database.connection() as conn:
+        user_ids = datagen.generate(conn, args.users, args.transactions)
+    user_id = user_ids[0]
+    with database.connection(user_id) as conn:
+        with conn:
+            conn.executemany(
+                "INSERT INTO transactions (user_id, date, description, amount_cents, category) VALUES (?, ?, ?, ?, ?)",
+                [(user_id, "2023-05-01", "Piano lesson", -4500, "Entertainment")] * RARE_ROWS,
+            )
+    print(f"Seeded {args.users * args.transactions} rows in {time.perf_counter() - start:.1f}s\n")
+
+    print(f"{'query':<16}{'matches':>9}{'page LIKE':>11}{'page FTS':>10}{'count LIKE':>12}{'count FTS':>11}  (ms)")
+    with database.connection(user_id) as conn:
+        for q, patterns in QUERIES:
+            match = fts_query(q, user_id)
+            page_like, _ = timed(conn, *like_query(user_id, patterns), args.repeat)
+            page_fts, _ = timed(conn, *search_query(user_id, match, PAGE), args.repeat)
+            count_like, rows = timed(conn, *like_count(user_id, patterns), args.repeat)
+            count_fts, fts_rows = timed(conn, *fts_count(match), args.repeat)
+            if rows[0][0] != fts_rows[0][0]:
+                print(f"  {q}: LIKE counted {rows[0][0]}, FTS counted {fts_rows[0][0]}")
+            print(f"{q:<16}{rows[0][0]:>9}{page_like:>11.1f}{page_fts:>10.1f}{count_like:>12.1f}{count_fts:>11.1f}")
+
+
+if __name__ == "__main__":
+    main_()
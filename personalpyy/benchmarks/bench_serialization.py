@@ -0,0 +1,99 @@
+"""Transaction list encodings: per-row Pydantic models vs rows encoded directly.
+
+Seeds one user, reads the first N transactions as sqlite3 rows and times
+each way of turning them into a response body and back into a DataFrame:
+
+- ``pydantic``: a Transaction model per row, serialized by JSONResponse
+  (how GET /transactions/ answered before content negotiation)
+- ``json``: row objects straight from the rows (orjson when installed)
+- ``columns``: one JSON array per field
+- ``msgpack``: one MessagePack array per field (skipped without msgpack)
+
+It then times the whole GET /transactions/ list end to end for each Accept
+header. The app runs in-process (TestClient). Run from the personalpyy
+directory:
+
+    python -m benchmarks.bench_serialization [--rows 1000 10000 100000] [--repeat 5]
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("JOBS_ENABLED", "0")
+
+import pandas as pd
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import database
+import encoding
+import main
+from benchmarks import datagen
+from models import Transaction
+
+
+def pydantic_body(rows):
+    return JSONResponse([Transaction(**dict(row)).dict() for row in rows]).body
+
+
+def decode(body, fmt):
+    if fmt == "msgpack":
+        return pd.DataFrame(encoding.msgpack.unpackb(body))
+    return pd.DataFrame(json.loads(body))
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, statistics.median(times) * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    fmts = encoding.available()
+    encoders = {"pydantic": pydantic_body}
+    for fmt in fmts:
+        encoders[fmt] = lambda rows, fmt=fmt: encoding.dumps(encoding.shape_rows(rows, main.TRANSACTION_FIELDS, fmt), fmt)
+    print(f"orjson: {'yes' if encoding.orjson else 'no (stdlib json)'}, "
+          f"msgpack: {'yes' if encoding.msgpack else 'no (skipped)'}\n")
+
+    with TestClient(main.app) as client:
+        with database.connection() as conn:
+            user_id = datagen.generate(conn, 1, max(args.rows))[0]
+        with database.connection(user_id) as conn:
+            all_rows = conn.execute(*main.list_query(user_id, ([], []), None)).fetchall()
+
+        print(f"{'rows':>7}{'encoding':>10}{'encode ms':>11}{'KB':>9}{'decode ms':>11}")
+        for n in args.rows:
+            rows = all_rows[:n]
+            for name, encode in encoders.items():
+                body, encode_ms = timed(lambda: encode(rows), args.repeat)
+                _, decode_ms = timed(lambda: decode(body, "msgpack" if name == "msgpack" else "json"), args.repeat)
+                print(f"{n:>7}{name:>10}{encode_ms:>11.1f}{len(body) / 1024:>9.0f}{decode_ms:>11.1f}")
+
+        # The full list, unpaginated: what a client without ?limit downloads
+        print(f"\nGET /transactions/ ({len(all_rows)} rows), median of {args.repeat}")
+        token = client.post("/token", data={"username": "bench0", "password": datagen.PASSWORD}).json()
+        auth = {"Authorization": f"Bearer {token['access_token']}"}
+        for fmt in fmts:
+            headers = dict(auth, Accept=encoding.MEDIA_TYPES[fmt])
+            resp, ms = timed(lambda: client.get("/transactions/", headers=headers), args.repeat)
+            resp.raise_for_status()
+            print(f"{fmt:>10}{ms:>9.1f} ms")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,97 @@
+"""Write throughput with the data in 1, 2, 4 and 8 SQLite shards.
+
+Each shard count runs in its own subprocess (DB_SHARDS is fixed when
+database is imported) against a fresh temp directory. --writers processes,
+as the workers started by serve.py would be, each insert --inserts
+transactions for their own users, one commit per insert. With one shard
+every commit queues on the same write lock; with N, writers whose users
+live on different shards commit in parallel, which only shows as
+throughput on a machine with several cores and a disk that keeps up. Run
+from the personalpyy directory:
+
+    python -m benchmarks.bench_shards [--shards 1 2 4 8] [--writers 4] [--users 32] [--inserts 500]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def write(user_ids, inserts):
+    # Runs in a writer process; returns (start, end, per-commit latencies)
+    import database
+    from models import TransactionCreate
+
+    latencies = []
+    start = time.time()
+    for n in range(inserts):
+        user_id = user_ids[n % len(user_ids)]
+        tx = TransactionCreate(date=f"2024-01-{n % 28 + 1:02d}", description="bench", amount=-1.25, category="bench")
+        begin = time.perf_counter()
+        with database.connection(user_id) as conn:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                database.insert_transaction(conn, user_id, tx)
+        latencies.append((time.perf_counter() - begin) * 1000)
+    return start, time.time(), latencies
+
+
+def worker(args):
+    import database
+
+    database.init_db()
+    user_ids = []
+    with database.connection() as conn:
+        for i in range(args.users):
+            cursor = conn.execute("INSERT INTO users (username, password_hash) VALUES (?, '')", (f"bench{i}",))
+            database.add_user_to_shard(cursor.lastrowid, f"bench{i}")
+            conn.commit()
+            user_ids.append(cursor.lastrowid)
+    database.close_pool()
+    # Writer w owns users w, w + writers, ...
+    groups = [user_ids[w::args.writers] for w in range(args.writers)]
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(args.writers) as pool:
+        results = pool.starmap(write, [(group, args.inserts) for group in groups])
+    elapsed = max(r[1] for r in results) - min(r[0] for r in results)
+    latencies = sorted(ms for r in results for ms in r[2])
+    print(json.dumps({
+        "inserts": len(latencies),
+        "per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies),
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1],
+    }))
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--users", type=int, default=32)
+    parser.add_argument("--inserts", type=int, default=500, help="per writer")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return worker(args)
+
+    print(f"{args.writers} writer processes, {os.cpu_count()} CPUs\n")
+    print(f"{'shards':>6}{'inserts/s':>11}{'p50 ms':>9}{'p99 ms':>9}")
+    for shards in args.shards:
+        env = dict(os.environ, DB_SHARDS=str(shards), JOBS_ENABLED="0",
+                   DATABASE_URL=os.path.join(tempfile.mkdtemp(), "bench.db"))
+        out = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_shards", "--worker", "--writers", str(args.writers),
+             "--users", str(args.users), "--inserts", str(args.inserts)],
+            env=env, capture_output=True, text=True, check=True,
+        ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{shards:>6}{r['per_s']:>11.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main_()
@@ -0,0 +1,101 @@
+"""Bursty load with and without rate limiting and read coalescing.
+
+Seeds --users users. The first one is noisy: every --interval seconds it
+fires a burst of --burst identical concurrent GET /transactions/ requests,
+like a Streamlit rerun loop or a user hammering "Refresh Data". The others
+are quiet and read their category totals four times a second. Each
+configuration (neither, coalescing, rate limiting, both) runs for
+--seconds. The report shows the quiet users' latency percentiles, how many
+list queries the noisy user caused, and the requests limited and
+coalesced. The app runs in-process (httpx ASGITransport, no sockets). Run
+from the personalpyy directory:
+
+    python -m benchmarks.bench_throttle [--transactions 20000] [--burst 8] [--seconds 5] [--rate 20 --rate-burst 40]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("JOBS_ENABLED", "0")
+
+import httpx
+
+import database
+import main
+from benchmarks import datagen
+from benchmarks.loadtest import percentile
+
+CONFIGS = (("off", False, False), ("coalesce", True, False), ("limit", False, True), ("both", True, True))
+
+
+async def noisy(client, headers, args, stop, counts):
+    while time.perf_counter() < stop:
+        resps = await asyncio.gather(*(client.get("/transactions/", headers=headers) for _ in range(args.burst)))
+        for resp in resps:
+            counts[resp.status_code] = counts.get(resp.status_code, 0) + 1
+        await asyncio.sleep(args.interval)
+
+
+async def quiet(client, headers, stop, latencies):
+    while time.perf_counter() < stop:
+        start = time.perf_counter()
+        resp = await client.get("/summary/categories", headers=headers)
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.25)
+
+
+async def run(args):
+    async with main.app.router.lifespan_context(main.app):
+        with database.connection() as conn:
+            datagen.generate(conn, args.users, args.transactions)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            headers = []
+            for i in range(args.users):
+                resp = await client.post("/token", data={"username": f"bench{i}", "password": datagen.PASSWORD})
+                headers.append({"Authorization": f"Bearer {resp.json()['access_token']}"})
+            print(f"{args.users - 1} quiet users, noisy bursts of {args.burst} every {args.interval}s, "
+                  f"{args.transactions} rows per user, {args.seconds}s per run\n")
+            print(f"{'config':<10}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}{'max ms':>8}"
+                  f"{'noisy 200':>11}{'429':>6}{'queries':>9}{'coalesced':>11}")
+            for name, coalesce, limit in CONFIGS:
+                main.coalescer.enabled = coalesce
+                main.rate_limiter.rate = args.rate if limit else 0
+                main.rate_limiter.burst = args.rate_burst
+                main.rate_limiter.clear()
+                before = main.coalescer.stats()
+                counts, latencies = {}, []
+                stop = time.perf_counter() + args.seconds
+                await asyncio.gather(
+                    noisy(client, headers[0], args, stop, counts),
+                    *(quiet(client, h, stop, latencies) for h in headers[1:]),
+                )
+                after = main.coalescer.stats()
+                coalesced = after["coalesced"] - before["coalesced"]
+                ok = counts.get(200, 0)
+                ms = [v * 1000 for v in sorted(latencies)]
+                print(f"{name:<10}{percentile(ms, 50):>8.1f}{percentile(ms, 95):>8.1f}{percentile(ms, 99):>8.1f}"
+                      f"{ms[-1]:>8.1f}{ok:>11}{counts.get(429, 0):>6}{ok - coalesced:>9}{coalesced:>11}")
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=4, help="including the noisy one")
+    parser.add_argument("--transactions", type=int, default=20000, help="per user")
+    parser.add_argument("--burst", type=int, default=8, help="concurrent identical requests per noisy burst")
+    parser.add_argument("--interval", type=float, default=0.05, help="seconds between noisy bursts")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--rate", type=float, default=20, help="requests per second per token when limiting")
+    parser.add_argument("--rate-burst", type=int, default=40)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main_()
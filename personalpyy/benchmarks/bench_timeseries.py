@@ -0,0 +1,78 @@
+"""Chart payloads: one point per day vs bucketed, downsampled series.
+
+For histories of growing length, seeds one user per history and compares
+GET /summary/balance (a point for every day with transactions) with GET
+/analytics/timeseries (day buckets, LTTB-downsampled to --max-points):
+response size, server time and the size of the Plotly figure built from
+it. The app runs in-process (TestClient). Run from the personalpyy
+directory:
+
+    python -m benchmarks.bench_timeseries [--years 2 10 40] [--transactions 50000] [--max-points 500]
+"""
+import argparse
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "bench.db"))
+os.environ.setdefault("JOBS_ENABLED", "0")
+
+import plotly.express as px
+from fastapi.testclient import TestClient
+
+import database
+import main
+from benchmarks import datagen
+
+
+def timed_get(client, path, params, headers, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        resp = client.get(path, params=params, headers=headers)
+        times.append(time.perf_counter() - start)
+    return resp, statistics.median(times) * 1000
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[2, 10, 40])
+    parser.add_argument("--transactions", type=int, default=50000, help="per history")
+    parser.add_argument("--max-points", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    print(f"{args.transactions} transactions per history\n")
+    print(f"{'years':>5}{'endpoint':>22}{'points':>8}{'KB':>8}{'ms':>8}{'figure KB':>11}")
+    with TestClient(main.app) as client:
+        password_hash = None
+        for i, years in enumerate(args.years):
+            with database.connection() as conn:
+                user_id = datagen.generate(conn, 1, args.transactions, seed=i, days=years * 365,
+                                           password_hash=password_hash)[0]
+                password_hash = conn.execute("SELECT password_hash FROM users WHERE id = ?", (user_id,)).fetchone()[0]
+            # datagen always names its users bench0..., so make room for the next history
+            username = f"years{years}"
+            for path in {database.DB_PATH, database.shard_for(user_id)}:
+                with database.connection(path=path) as conn:
+                    conn.execute("UPDATE users SET username = ? WHERE id = ?", (username, user_id))
+                    conn.commit()
+            token = client.post("/token", data={"username": username, "password": datagen.PASSWORD}).json()
+            headers = {"Authorization": f"Bearer {token['access_token']}"}
+            cases = (
+                ("/summary/balance", {}, lambda b: (b, [p["date"] for p in b], [p["balance"] for p in b])),
+                ("/analytics/timeseries", {"max_points": args.max_points}, lambda b: (b["dates"], b["dates"], b["values"])),
+            )
+            for path, params, unpack in cases:
+                resp, ms = timed_get(client, path, params, headers, args.repeat)
+                points, dates, values = unpack(resp.json())
+                figure = px.line(x=dates, y=values).to_json()
+                print(f"{years:>5}{path:>22}{len(points):>8}{len(resp.content) / 1024:>8.1f}{ms:>8.1f}"
+                      f"{len(figure) / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main_()
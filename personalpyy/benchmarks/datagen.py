@@ -0,0 +1,143 @@
+"""Fill a database with synthetic users and transactions.
+
+Run from the personalpyy directory:
+
+    python -m benchmarks.datagen [--users 10] [--transactions 1000] [--seed 42] [--db finance.db]
+
+Users are named bench0..benchN-1 and all share the password "bench". Data is
+deterministic for a given seed.
+"""
+import argparse
+import contextlib
+import datetime
+import random
+
+# (category, min amount, max amount, relative frequency); negative is spending
+CATEGORIES = (
+    ("Groceries", -150.0, -8.0, 25),
+    ("Dining", -90.0, -6.0, 15),
+    ("Transport", -60.0, -2.5, 12),
+    ("Shopping", -250.0, -5.0, 10),
+    ("Utilities", -180.0, -30.0, 5),
+    ("Entertainment", -80.0, -5.0, 8),
+    ("Health", -200.0, -10.0, 4),
+    ("Travel", -900.0, -40.0, 2),
+    ("Rent", -1800.0, -900.0, 2),
+    ("Salary", 1800.0, 5200.0, 2),
+    (None, -50.0, 50.0, 3),
+)
+DESCRIPTIONS = {
+    "Groceries": ("Supermarket", "Farmers market", "Corner shop"),
+    "Dining": ("Cafe", "Lunch", "Dinner out", "Takeaway"),
+    "Transport": ("Bus fare", "Train ticket", "Fuel", "Taxi"),
+    "Shopping": ("Clothes", "Electronics", "Books", "Household"),
+    "Utilities": ("Electricity", "Water", "Internet", "Phone"),
+    "Entertainment": ("Cinema", "Concert", "Streaming", "Games"),
+    "Health": ("Pharmacy", "Dentist", "Gym"),
+    "Travel": ("Hotel", "Flight", "Car rental"),
+    "Rent": ("Monthly rent",),
+    "Salary": ("Payroll",),
+    None: ("Transfer", "Misc"),
+}
+PASSWORD = "bench"
+DAYS = 730
+
+
+def generate_rows(user_id, count, rng, end=datetime.date(2024, 12, 31), days=DAYS):
+    weights = [c[3] for c in CATEGORIES]
+    for category, low, high, _ in rng.choices(CATEGORIES, weights=weights, k=count):
+        day = end - datetime.timedelta(days=rng.randrange(days))
+        cents = rng.randint(round(low * 100), round(high * 100))
+        yield (user_id, day.isoformat(), rng.choice(DESCRIPTIONS[category]), cents, category)
+
+
+def generate(conn, users, transactions, seed=42, password_hash=None, days=DAYS):
+    """Insert ``users`` users with ``transactions`` rows each; returns user ids.
+
+    Rows are spread over the ``days`` days up to the end of 2024. ``conn``
+    is the directory database. With DB_SHARDS > 1 each user's rows go to
+    their shard. One bcrypt hash is computed and shared by every user
+    so generation is not dominated by hashing.
+    """
+    import aggregates
+    import database
+    from hashing import hash_password
+
+    rng = random.Random(seed)
+    password_hash = password_hash or hash_password(PASSWORD)
+    user_ids = []
+    with contextlib.ExitStack() as stack:
+        if database.sharded():
+            shards = {path: stack.enter_context(database.connection(path=path)) for path in database.shard_paths()}
+            conn.execute("BEGIN IMMEDIATE")
+        else:
+            shards = {database.DB_PATH: conn}
+        triggers = {path: suspend_fts(shard) for path, shard in shards.items()}
+        with conn:
+            for i in range(users):
+                # Rows are written as version 1 of the user's data (see bump_data_version)
+                cursor = conn.execute(
+                    "INSERT INTO users (username, password_hash, data_version) VALUES (?, ?, 1)",
+                    (f"bench{i}", password_hash),
+                )
+                user_ids.append(cursor.lastrowid)
+                shard = shards[database.shard_for(cursor.lastrowid)]
+                if shard is not conn:
+                    shard.execute(
+                        "INSERT INTO users (id, username, password_hash, data_version) VALUES (?, ?, '', 1)",
+                        (cursor.lastrowid, f"bench{i}"),
+                    )
+                shard.executemany(
+                    "INSERT INTO transactions (user_id, date, description, amount_cents, category, version) "
+                    "VALUES (?, ?, ?, ?, ?, 1)",
+                    generate_rows(cursor.lastrowid, transactions, rng, days=days),
+                )
+            # Shards commit before the directory, so no account points at missing data
+            for path, shard in shards.items():
+                restore_fts(shard, triggers[path])
+                if shard is not conn:
+                    shard.commit()
+        for shard in shards.values():
+            aggregates.rebuild(shard)
+    return user_ids
+
+
+def suspend_fts(conn):
+    # Index once at the end instead of firing the FTS trigger per row.
+    # Opens the write transaction; returns the trigger's SQL, if it exists.
+    conn.execute("BEGIN IMMEDIATE")
+    trigger = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'transactions_fts_insert'"
+    ).fetchone()
+    if trigger:
+        conn.execute("DROP TRIGGER transactions_fts_insert")
+    return trigger and trigger[0]
+
+
+def restore_fts(conn, trigger):
+    import migrations
+
+    if trigger:
+        conn.execute(trigger)
+        migrations.rebuild_fts(conn)
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--transactions", type=int, default=1000, help="per user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="database file (default DATABASE_URL or finance.db)")
+    args = parser.parse_args()
+
+    import database
+    if args.db:
+        database.DB_PATH = args.db
+    database.init_db()
+    with database.connection() as conn:
+        generate(conn, args.users, args.transactions, args.seed)
+    print(f"Wrote {args.users} users x {args.transactions} transactions to {database.DB_PATH}")
+
+
+if __name__ == "__main__":
+    main_()
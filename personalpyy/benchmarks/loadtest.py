@@ -0,0 +1,217 @@
+"""Offline load test of the API and analysis functions with a JSON report.
+
+Seeds a temp database with benchmarks.datagen, then runs concurrent virtual
+users against the app in-process (httpx ASGITransport, no sockets). Each
+user logs in and performs a seeded random mix of list/create/update/delete
+requests plus calls into analysis.py. Run from the personalpyy directory:
+
+    python -m benchmarks.loadtest [--users 8] [--transactions 2000] [--requests 200]
+                                  [--output report.json]
+                                  [--baseline old.json] [--threshold 0.2]
+
+With --baseline, exits 1 if any operation's throughput dropped or its p95
+latency grew by more than --threshold (a fraction) relative to the baseline.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", os.path.join(tempfile.mkdtemp(), "loadtest.db"))
+
+# (operation, relative weight) for each virtual user's request mix
+MIX = (
+    ("GET /transactions/", 40),
+    ("POST /transactions/", 20),
+    ("PUT /transactions/{id}", 10),
+    ("DELETE /transactions/{id}", 5),
+    ("GET /summary/categories", 10),
+    ("analysis.plot_expenses_by_category", 5),
+    ("analysis.plot_balance_over_time", 5),
+    ("analysis.get_transactions_df", 5),
+)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    # Nearest rank: the smallest value with at least q% of values at or below it
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, op, seconds, ok):
+        self.latencies.setdefault(op, []).append(seconds)
+        if not ok:
+            self.errors[op] = self.errors.get(op, 0) + 1
+
+    def summary(self, elapsed):
+        results = {}
+        for op, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            results[op] = {
+                "count": len(values),
+                "errors": self.errors.get(op, 0),
+                "throughput": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        return results
+
+
+async def virtual_user(client, username, n_requests, rng, recorder):
+    import analysis
+
+    async def timed(op, coro, ok=lambda r: r.status_code == 200):
+        start = time.perf_counter()
+        try:
+            result = await coro
+            success = ok(result)
+        except Exception:
+            result, success = None, False
+        recorder.record(op, time.perf_counter() - start, success)
+        return result
+
+    resp = await timed("POST /token", client.post("/token", data={"username": username, "password": "bench"}))
+    if resp is None or resp.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+    resp = await client.get("/transactions/", params={"fields": "id,user_id"}, headers=headers)
+    rows = resp.json()
+    ids = [row["id"] for row in rows]
+    user_id = rows[0]["user_id"] if rows else None
+
+    ops, weights = zip(*MIX)
+    for op in rng.choices(ops, weights=weights, k=n_requests):
+        if op == "GET /transactions/":
+            params = {"limit": 100}
+            if ids and rng.random() < 0.5:
+                params["after_id"] = rng.choice(ids)
+            await timed(op, client.get("/transactions/", params=params, headers=headers))
+        elif op == "POST /transactions/":
+            tx = {"date": f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}", "description": "load",
+                  "amount": round(rng.uniform(-100, 100), 2), "category": rng.choice(("Dining", "Groceries", None))}
+            resp = await timed(op, client.post("/transactions/", json=tx, headers=headers))
+            if resp is not None and resp.status_code == 200:
+                ids.append(resp.json()["id"])
+        elif op == "PUT /transactions/{id}" and ids:
+            tx = {"date": "2024-06-15", "description": "edited", "amount": -12.5, "category": "Dining"}
+            await timed(op, client.put(f"/transactions/{rng.choice(ids)}", json=tx, headers=headers))
+        elif op == "DELETE /transactions/{id}" and ids:
+            tx_id = ids.pop(rng.randrange(len(ids)))
+            await timed(op, client.delete(f"/transactions/{tx_id}", headers=headers))
+        elif op == "GET /summary/categories":
+            await timed(op, client.get("/summary/categories", headers=headers))
+        elif op.startswith("analysis."):
+            fn = getattr(analysis, op.split(".", 1)[1])
+            args = () if fn is analysis.get_transactions_df else (user_id,)
+            await timed(op, asyncio.to_thread(fn, *args), ok=lambda r: r is not None)
+
+
+async def run(args):
+    import httpx
+
+    import database
+    import main
+    from benchmarks import datagen
+
+    recorder = Recorder()
+    async with main.app.router.lifespan_context(main.app):
+        with database.connection() as conn:
+            datagen.generate(conn, args.users, args.transactions, args.seed)
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            start = time.perf_counter()
+            await asyncio.gather(*(
+                virtual_user(client, f"bench{i}", args.requests, random.Random(args.seed + i), recorder)
+                for i in range(args.users)
+            ))
+            elapsed = time.perf_counter() - start
+    results = recorder.summary(elapsed)
+    total = sum(r["count"] for r in results.values())
+    return {
+        "config": {
+            "users": args.users,
+            "transactions": args.transactions,
+            "requests": args.requests,
+            "seed": args.seed,
+            "db_mode": main.DB_MODE,
+            "db_pool_size": database.DB_POOL_SIZE,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+        },
+        "elapsed_s": elapsed,
+        "throughput": total / elapsed,
+        "errors": sum(r["errors"] for r in results.values()),
+        "operations": results,
+    }
+
+
+def compare(report, baseline, threshold):
+    # Returns human-readable regressions against a previous report
+    regressions = []
+    for op, old in baseline["operations"].items():
+        new = report["operations"].get(op)
+        if new is None:
+            continue
+        if new["throughput"] < old["throughput"] * (1 - threshold):
+            regressions.append(f"{op}: throughput {old['throughput']:.1f} -> {new['throughput']:.1f}/s")
+        if new["p95_ms"] > old["p95_ms"] * (1 + threshold):
+            regressions.append(f"{op}: p95 {old['p95_ms']:.1f} -> {new['p95_ms']:.1f} ms")
+    return regressions
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--transactions", type=int, default=2000, help="seeded transactions per user")
+    parser.add_argument("--requests", type=int, default=200, help="requests per virtual user")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here (default stdout)")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    print(f"{'operation':<38}{'count':>7}{'err':>5}{'req/s':>9}{'p50':>8}{'p95':>8}{'p99':>8}", file=sys.stderr)
+    for op, r in report["operations"].items():
+        print(f"{op:<38}{r['count']:>7}{r['errors']:>5}{r['throughput']:>9.1f}"
+              f"{r['p50_ms']:>8.1f}{r['p95_ms']:>8.1f}{r['p99_ms']:>8.1f}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main_()
@@ -1,17 +1,11 @@
-import requests
 import streamlit as st
-from analysis import get_transactions_df, plot_expenses_by_category, plot_balance_over_time
-import sqlite3
-import os
-from dotenv import load_dotenv
+from api_client import API_URL, cached_get, get_session, synced_transactions
 import re
 APP_NAME = "FINT"
+# user_id is never displayed, so don't ask the API for it
+TX_FIELDS = "id,date,description,amount,category"
 
 
-load_dotenv()
-DB_PATH = os.getenv("DATABASE_URL", "finance.db")
-API_KEY = os.getenv("API_KEY")
-
 # --- Restore login state from query params if present ---
 query_params = st.query_params
 uuid_regex = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
@@ -51,6 +45,16 @@ if cols[3].button("Dashboard"):
     st.session_state.page = "dashboard"
 page = st.session_state.page
 
+
+def load_transactions():
+    # Loaded once from the Arrow export, then kept current with deltas from
+    # /transactions/changes, so a rerun only transfers what changed.
+    status_code, df, error_detail = synced_transactions(st.session_state.token, TX_FIELDS)
+    if status_code != 200:
+        st.error(f"Failed to fetch transactions: {error_detail}")
+    return df
+
+
 if page == "home":
     st.title(APP_NAME)
     st.markdown(
@@ -74,7 +78,6 @@ if page == "home":
         """,
         unsafe_allow_html=True,
     )
-    print(DB_PATH)
     if not st.session_state.token:
         st.info("Please login or register to save and view your personal transactions.")
     if st.button("Go to Dashboard"):
@@ -89,8 +92,7 @@ elif page == "login":
         login_username = st.text_input("Username", key="login_username")
         login_password = st.text_input("Password", type="password", key="login_password")
         if st.button("Login"):
-            resp = requests.post("http://127.0.0.1:8000/token", data={"username": login_username, "password": login_password})
-            print("Login response JSON:", resp.json())
+            resp = get_session().post(f"{API_URL}/token", data={"username": login_username, "password": login_password})
             if resp.status_code == 200:
                 token = resp.json()["access_token"]
                 st.session_state.token = token
@@ -110,7 +112,7 @@ elif page == "login":
         reg_username = st.text_input("Username", key="reg_username")
         reg_password = st.text_input("Password", type="password", key="reg_password")
         if st.button("Register"):
-            resp = requests.post("http://127.0.0.1:8000/register", json={"username": reg_username, "password": reg_password})
+            resp = get_session().post(f"{API_URL}/register", json={"username": reg_username, "password": reg_password})
             if resp.status_code == 200:
                 st.success("Registration successful! Please login.")
                 st.session_state.token = None
@@ -149,7 +151,7 @@ elif page == "dashboard":
                     "amount": amount,
                     "category": category
                 }
-                resp = requests.post("http://127.0.0.1:8000/transactions/", json=tx_data, headers=headers)
+                resp = get_session().post(f"{API_URL}/transactions/", json=tx_data, headers=headers)
                 if resp.status_code == 200:
                     st.success("Transaction added!")
                 else:
@@ -160,25 +162,8 @@ elif page == "dashboard":
                     st.error("Failed to add transaction: " + error_detail)
 
     # Fetch transactions via FastAPI
-    headers = {"Authorization": f"Bearer {st.session_state.token}"}
-    print("Frontend sending token:", st.session_state.token)
-    resp = requests.get("http://127.0.0.1:8000/transactions/", headers=headers)
-    if resp.status_code == 200:
-        tx_list = resp.json()
-        import pandas as pd
-        df = pd.DataFrame(tx_list)
-        # Ensure correct types for graphing
-        if "amount" in df.columns:
-            df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    else:
-        df = None
-        try:
-            error_detail = resp.json().get("detail", "Unknown error")
-        except Exception:
-            error_detail = resp.text
-        st.error(f"Failed to fetch transactions: {error_detail}")
+    df = load_transactions()
+    import pandas as pd
 
     st.header("All Transactions")
     if df is not None and not df.empty:
@@ -187,6 +172,18 @@ elif page == "dashboard":
     else:
         st.write("No data to display.")
 
+    query = st.text_input("Search transactions", placeholder="e.g. dentist, super*")
+    if query.strip():
+        status_code, hits, error_detail = cached_get(
+            "/transactions/search", st.session_state.token, params={"q": query}, kind="columns"
+        )
+        if status_code == 200 and hits and hits["id"]:
+            st.dataframe(pd.DataFrame(hits).drop(columns=["user_id"], errors="ignore"))
+        elif status_code == 200:
+            st.write("No matching transactions.")
+        else:
+            st.error(f"Search failed: {error_detail}")
+
     st.button("Refresh Data", on_click=lambda: st.rerun())
     def go_to_edit_transactions():
         st.session_state.page = "edit_transactions"
@@ -195,12 +192,13 @@ elif page == "dashboard":
 
     st.header("Expenses by Category")
     if df is not None and not df.empty and "category" in df.columns and "amount" in df.columns:
-        st.write("Debug: Transactions DataFrame", df)
         import plotly.express as px
-        cat_sum = df.dropna(subset=["category", "amount"]).groupby("category")["amount"].sum().reset_index()
-        st.write("Debug: Category Summary", cat_sum)
+        # Totals come precomputed from the API instead of a groupby over every row
+        _, categories, _ = cached_get("/summary/categories", st.session_state.token, kind="columns")
+        cat_sum = pd.DataFrame(categories or [], columns=["category", "total", "count"])
+        cat_sum = cat_sum.dropna(subset=["category"])
         if not cat_sum.empty:
-            fig1 = px.pie(cat_sum, names="category", values="amount", title="Expenses by Category")
+            fig1 = px.pie(cat_sum, names="category", values="total", title="Expenses by Category")
             st.plotly_chart(fig1)
         else:
             st.write("No category data to display.")
@@ -209,37 +207,69 @@ elif page == "dashboard":
 
     st.header("Balance Over Time")
     if df is not None and not df.empty:
-        df["date"] = pd.to_datetime(df["date"])
-        df_sorted = df.sort_values("date")
-        df_sorted["balance"] = df_sorted["amount"].cumsum()
-        fig2 = px.line(df_sorted, x="date", y="balance", title="Balance Over Time")
+        import plotly.express as px
+        cols = st.columns(2)
+        metric = cols[0].selectbox("Show", ["balance", "spend", "income"])
+        bucket = cols[1].selectbox("Per", ["day", "week", "month"])
+        # Bucketed and downsampled by the API: a few hundred points at most,
+        # however long the history
+        _, series, _ = cached_get(
+            "/analytics/timeseries", st.session_state.token, params={"metric": metric, "bucket": bucket}
+        )
+        series = series or {"dates": [], "values": []}
+        chart = pd.DataFrame({"date": pd.to_datetime(series["dates"]), metric: series["values"]})
+        fig2 = px.line(chart, x="date", y=metric, title=f"{metric.title()} per {bucket}")
         st.plotly_chart(fig2)
     else:
         st.write("No data to display.")
 
+    # Reports are built by the API's background worker; the charts arrive
+    # pre-rendered as Plotly JSON, so a rerun only redraws them
+    st.header("Monthly Report")
+    import datetime
+    from api_client import auth_headers, error_detail
+    last_month = (datetime.date.today().replace(day=1) - datetime.timedelta(days=1)).strftime("%Y-%m")
+    report_month = st.text_input("Month (YYYY-MM)", value=last_month)
+    if st.button("Generate Report"):
+        resp = get_session().post(
+            f"{API_URL}/reports/monthly", params={"month": report_month}, headers=auth_headers(st.session_state.token)
+        )
+        if resp.status_code == 202:
+            st.session_state.report_job = resp.json()["job_id"]
+        else:
+            st.error(f"Could not queue report: {error_detail(resp)}")
+    if st.session_state.get("report_job"):
+        resp = get_session().get(
+            f"{API_URL}/jobs/{st.session_state.report_job}", headers=auth_headers(st.session_state.token)
+        )
+        job = resp.json() if resp.status_code == 200 else None
+        if job is None:
+            st.session_state.report_job = None
+        elif job["status"] == "done":
+            import plotly.io as pio
+            report = job["result"]
+            st.subheader(f"Report for {report['month']}")
+            cols = st.columns(3)
+            cols[0].metric("Income", f"{report['income']:.2f}")
+            cols[1].metric("Spending", f"{report['spending']:.2f}")
+            cols[2].metric("Net", f"{report['net']:.2f}")
+            for chart in report["charts"].values():
+                st.plotly_chart(pio.from_json(chart))
+            if report["largest_expenses"]:
+                st.dataframe(pd.DataFrame(report["largest_expenses"]))
+        elif job["status"] == "failed":
+            st.error("Report generation failed.")
+        else:
+            st.info(f"Report is {job['status']}...")
+            st.button("Check Again")
+
     
 elif page == "edit_transactions":
     st.title("Edit Transactions")
 
     st.header("All Transactions")
     # Fetch transactions via FastAPI (to ensure df is available)
-    headers = {"Authorization": f"Bearer {st.session_state.token}"}
-    resp = requests.get("http://127.0.0.1:8000/transactions/", headers=headers)
-    if resp.status_code == 200:
-        import pandas as pd
-        tx_list = resp.json()
-        df = pd.DataFrame(tx_list)
-        if "amount" in df.columns:
-            df["amount"] = pd.to_numeric(df["amount"], errors="coerce")
-        if "date" in df.columns:
-            df["date"] = pd.to_datetime(df["date"], errors="coerce")
-    else:
-        df = None
-        try:
-            error_detail = resp.json().get("detail", "Unknown error")
-        except Exception:
-            error_detail = resp.text
-        st.error(f"Failed to fetch transactions: {error_detail}")
+    df = load_transactions()
 
     if df is not None and not df.empty:
         df_display = df.drop(columns=["user_id"], errors="ignore")
@@ -269,7 +299,7 @@ elif page == "edit_transactions":
                         "amount": amount,
                         "category": category
                     }
-                    resp = requests.put(f"http://127.0.0.1:8000/transactions/{tx_id}", json=tx_data, headers=headers)
+                    resp = get_session().put(f"{API_URL}/transactions/{tx_id}", json=tx_data, headers=headers)
                     if resp.status_code == 200:
                         st.success("Transaction updated!")
                     else:
@@ -281,7 +311,7 @@ elif page == "edit_transactions":
             if delete_submitted:
                 if delete_confirm:
                     headers = {"Authorization": f"Bearer {st.session_state.token}"}
-                    resp = requests.delete(f"http://127.0.0.1:8000/transactions/{tx_id}", headers=headers)
+                    resp = get_session().delete(f"{API_URL}/transactions/{tx_id}", headers=headers)
                     if resp.status_code == 200:
                         st.success("Transaction deleted!")
                         st.rerun()
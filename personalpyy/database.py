@@ -1,41 +1,246 @@
 import os
-from dotenv import load_dotenv
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pool import ConnectionPool
+import aggregates
+import metrics
+import migrations
+from settings import settings
 
-load_dotenv()
-DB_PATH = os.getenv("DATABASE_URL", "finance.db")
+DB_PATH = settings.database_url
+# Set DB_POOL_SIZE=0 to fall back to one connection per call
+DB_POOL_SIZE = settings.db_pool_size
+# With DB_SHARDS=N > 1 each user's data lives in one of N files next to
+# DATABASE_URL (finance.shard0.db, ...), picked by user id; DATABASE_URL
+# itself keeps the accounts and the job queue. Changing N for an existing
+# database is refused (see check_shard_count); users are not moved.
+DB_SHARDS = settings.db_shards
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+SHARD_ID_BITS = 40
 
-def init_db():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    # Create users table if not exists
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            token TEXT
+_pools = {}
+_pools_lock = threading.Lock()
+
+def sharded():
+    return DB_SHARDS > 1
+
+def shard_path(index):
+    if not sharded():
+        return DB_PATH
+    root, ext = os.path.splitext(DB_PATH)
+    return f"{root}.shard{index}{ext or '.db'}"
+
+def shard_paths():
+    return [shard_path(i) for i in range(max(DB_SHARDS, 1))]
+
+def database_paths():
+    # Every file in the deployment: the directory first, then the shards
+    return [DB_PATH] + (shard_paths() if sharded() else [])
+
+def shard_for(user_id):
+    # Ids are handed out sequentially by the directory database, so the
+    # modulo spreads users evenly
+    return shard_path(user_id % DB_SHARDS) if sharded() else DB_PATH
+
+def get_pool(path=None):
+    path = path or DB_PATH
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path, size=DB_POOL_SIZE)
+        return pool
+
+def close_pool():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+def get_db_connection(user_id=None, path=None):
+    # user_id routes to that user's shard; with neither argument this is the
+    # directory database (accounts, tokens, jobs). Callers still call
+    # conn.close(); for pooled connections that returns the connection to
+    # the pool instead of closing it.
+    if path is None:
+        path = DB_PATH if user_id is None else shard_for(user_id)
+    if DB_POOL_SIZE <= 0:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+    else:
+        conn = get_pool(path).acquire()
+    return metrics.instrument_connection(conn)
+
+# DB_MODE=async installs its writer here (async_routes.install), so writes
+# made on worker threads through write() - bulk imports, recurring postings
+# and background job bookkeeping - join the same queue as the transaction
+# routes instead of competing with it for the write lock
+write_through = None
+
+def write(conn, fn, *args):
+    """Run fn(conn, *args) in one write transaction and return its result.
+
+    fn must not commit. With the async writer installed, the call is queued
+    there and runs on the writer's connection; conn is then unused. Call
+    from a worker thread, never from the event loop.
+    """
+    if write_through is not None:
+        return write_through(fn, *args)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        return fn(conn, *args)
+
+# A caller must not check out a second connection from a pool it already
+# holds one from: once the pool runs dry, every holder waits on the others.
+# Pass the connection you have down instead. Holding a directory connection
+# while taking a shard one is fine, as nothing takes them in the other order.
+@contextmanager
+def connection(user_id=None, path=None):
+    conn = get_db_connection(user_id, path)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+def get_db():
+    # FastAPI dependency: one connection checked out for the whole request
+    with connection() as conn:
+        yield conn
+
+# Amounts are stored as integer cents in amount_cents; reads that serve the
+# API select this expression as "amount"
+AMOUNT_SQL = "amount_cents / 100.0"
+
+def column_sql(name):
+    return f"{AMOUNT_SQL} AS amount" if name == "amount" else name
+
+def bump_data_version(conn, user_id):
+    # Call inside the same transaction as any write to the user's transactions.
+    # Returns the new version; written rows are stamped with it (and deleted
+    # ids recorded under it) so /transactions/changes can send deltas.
+    return conn.execute(
+        "UPDATE users SET data_version = data_version + 1 WHERE id = ? RETURNING data_version", (user_id,)
+    ).fetchone()[0]
+
+def get_data_version(conn, user_id):
+    row = conn.execute("SELECT data_version FROM users WHERE id = ?", (user_id,)).fetchone()
+    return row[0] if row else 0
+
+# Write helpers shared by the sync routes and the async writer. They do not
+# commit; update/delete callers should hold BEGIN IMMEDIATE so the old row
+# read for the aggregate delta cannot change underneath them.
+
+def insert_transaction(conn, user_id, tx):
+    cents = tx.amount_cents
+    version = bump_data_version(conn, user_id)
+    cursor = conn.execute(
+        "INSERT INTO transactions (user_id, date, description, amount_cents, category, version) VALUES (?, ?, ?, ?, ?, ?)",
+        (user_id, tx.date, tx.description, cents, tx.category, version)
+    )
+    aggregates.apply_rows(conn, user_id, [(tx.date, cents, tx.category)])
+    return cursor.lastrowid
+
+def update_transaction_row(conn, user_id, tx_id, tx):
+    old = conn.execute(
+        "SELECT date, amount_cents, category FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id)
+    ).fetchone()
+    if old is None:
+        return 0
+    cents = tx.amount_cents
+    version = bump_data_version(conn, user_id)
+    conn.execute(
+        "UPDATE transactions SET date = ?, description = ?, amount_cents = ?, category = ?, version = ? "
+        "WHERE id = ? AND user_id = ?",
+        (tx.date, tx.description, cents, tx.category, version, tx_id, user_id)
+    )
+    aggregates.apply_rows(conn, user_id, [tuple(old)], sign=-1)
+    aggregates.apply_rows(conn, user_id, [(tx.date, cents, tx.category)])
+    return 1
+
+def delete_transaction_row(conn, user_id, tx_id):
+    old = conn.execute(
+        "SELECT date, amount_cents, category FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id)
+    ).fetchone()
+    if old is None:
+        return 0
+    version = bump_data_version(conn, user_id)
+    conn.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user_id))
+    conn.execute(
+        "INSERT INTO transaction_tombstones (user_id, version, tx_id, deleted_at) VALUES (?, ?, ?, ?)",
+        (user_id, version, tx_id, time.time())
+    )
+    aggregates.apply_rows(conn, user_id, [tuple(old)], sign=-1)
+    return 1
+
+def prune_tombstones(conn, before):
+    # Deletes tombstones written before the `before` timestamp, one user per
+    # transaction; returns how many. Versions only grow, so each user loses
+    # every tombstone up to their newest expired one, and tombstones_pruned
+    # records that version: /transactions/changes tells clients behind it to
+    # reload in full instead of missing the deletes.
+    expired = conn.execute(
+        "SELECT user_id, MAX(version) FROM transaction_tombstones WHERE deleted_at < ? GROUP BY user_id", (before,)
+    ).fetchall()
+    return sum(write(conn, _prune_user_tombstones, user_id, version) for user_id, version in expired)
+
+def _prune_user_tombstones(conn, user_id, version):
+    pruned = conn.execute(
+        "DELETE FROM transaction_tombstones WHERE user_id = ? AND version <= ?", (user_id, version)
+    ).rowcount
+    conn.execute("UPDATE users SET tombstones_pruned = MAX(tombstones_pruned, ?) WHERE id = ?", (version, user_id))
+    return pruned
+
+def add_user_to_shard(user_id, username):
+    # Sharded, the user's shard keeps its own users row: it holds the
+    # data_version bumped with every write and satisfies the transactions
+    # foreign key. Passwords and tokens stay in the directory. REPLACE
+    # covers an id left behind by a registration that failed halfway.
+    if not sharded():
+        return
+    with connection(user_id) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO users (id, username, password_hash) VALUES (?, ?, '')", (user_id, username)
         )
-    ''')
-    # Transactions table (with user_id foreign key)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transactions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            date TEXT NOT NULL,
-            description TEXT,
-            amount REAL NOT NULL,
-            category TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
+        conn.commit()
+
+def check_shard_count(conn):
+    # Users are placed by id modulo the shard count, so changing it would
+    # silently hide their data
+    shards = max(DB_SHARDS, 1)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("CREATE TABLE IF NOT EXISTS shard_config (shards INTEGER NOT NULL)")
+        row = conn.execute("SELECT shards FROM shard_config").fetchone()
+        if row is None:
+            if sharded() and conn.execute("SELECT 1 FROM users LIMIT 1").fetchone() is not None:
+                raise RuntimeError(f"{DB_PATH} has unsharded users; cannot start with DB_SHARDS={DB_SHARDS}")
+            conn.execute("INSERT INTO shard_config (shards) VALUES (?)", (shards,))
+        elif row[0] != shards:
+            raise RuntimeError(f"{DB_PATH} was created with DB_SHARDS={row[0]}, not {DB_SHARDS}")
+
+def init_db():
+    # Creates or upgrades the schema of the directory and every shard; all
+    # files share one schema (see migrations.py)
+    with connection() as conn:
+        migrations.migrate(conn)
+        check_shard_count(conn)
+    for index, path in enumerate(database_paths()[1:]):
+        with connection(path=path) as conn:
+            migrations.migrate(conn)
+            reserve_id_range(conn, index)
+
+def reserve_id_range(conn, index):
+    # Shard i hands out ids from i * 2**40, so transaction and rule ids stay
+    # unique across shards. Only set while the table is still empty.
+    for table in ("transactions", "recurring_transactions"):
+        conn.execute(
+            "INSERT INTO sqlite_sequence (name, seq) SELECT ?, ? "
+            "WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)",
+            (table, index << SHARD_ID_BITS, table),
         )
-    ''')
     conn.commit()
-    conn.close()
 
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,114 @@
+"""Response encodings chosen by the Accept header.
+
+Rows are encoded straight from sqlite3 rows, without building a Pydantic
+model per row:
+
+- ``json`` (application/json, the default): a list of row objects,
+  serialized with orjson when it is installed.
+- ``columns`` (application/vnd.personalpy.columns+json): one array per
+  field, ``{"id": [...], "date": [...]}``; field names are sent once and
+  pandas builds a DataFrame from it without a dict per row.
+- ``msgpack`` (application/x-msgpack): the columnar form in MessagePack.
+  Needs the optional msgpack package; without it the type is not offered.
+
+Non-row payloads (summaries, series) are sent as they are in every format.
+"""
+import json
+
+from fastapi import HTTPException, Request, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MEDIA_TYPES = {
+    "json": "application/json",
+    "columns": "application/vnd.personalpy.columns+json",
+    "msgpack": "application/x-msgpack",
+}
+# Other names clients use for the same formats
+ALIASES = {
+    "application/msgpack": "msgpack",
+    "application/vnd.msgpack": "msgpack",
+}
+
+
+def available():
+    return [fmt for fmt in MEDIA_TYPES if fmt != "msgpack" or msgpack is not None]
+
+
+def _media_ranges(accept):
+    # "a/b;q=0.5, c/d" -> [(q, position, "a/b"), ...], best first
+    ranges = []
+    for position, part in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    q = float(param[2:])
+                except ValueError:
+                    q = 0.0
+        if media_type and q > 0:
+            ranges.append((-q, position, media_type.lower()))
+    return sorted(ranges)
+
+
+def negotiate(request: Request):
+    """FastAPI dependency: the format to answer with; 406 if none is acceptable."""
+    accept = request.headers.get("accept")
+    if not accept:
+        return "json"
+    offered = available()
+    for _, _, media_type in _media_ranges(accept):
+        if media_type in ("*/*", "application/*"):
+            return "json"
+        fmt = ALIASES.get(media_type) or next((f for f, t in MEDIA_TYPES.items() if t == media_type), None)
+        if fmt in offered:
+            return fmt
+    raise HTTPException(
+        status_code=406, detail=f"Supported types: {', '.join(MEDIA_TYPES[f] for f in offered)}"
+    )
+
+
+def columnar(rows, columns):
+    # {column: [values]} from row tuples, built column by column
+    if not rows:
+        return {name: [] for name in columns}
+    return dict(zip(columns, map(list, zip(*rows))))
+
+
+def columnar_dicts(items, columns):
+    # The columnar form of a list of dicts, e.g. summary rows
+    return {name: [item[name] for item in items] for name in columns}
+
+
+def records(rows, columns):
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def shape_rows(rows, columns, fmt):
+    # Rows in the shape of the format, for embedding in a larger payload
+    return records(rows, columns) if fmt == "json" else columnar(rows, columns)
+
+
+def dumps(data, fmt):
+    if fmt == "msgpack":
+        return msgpack.packb(data, use_bin_type=True)
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def response(data, fmt, headers=None, status_code=200):
+    headers = dict(headers or {}, Vary="Accept")
+    return Response(dumps(data, fmt), status_code=status_code, media_type=MEDIA_TYPES[fmt], headers=headers)
+
+
+def rows_response(rows, columns, fmt, headers=None):
+    return response(shape_rows(rows, columns, fmt), fmt, headers)
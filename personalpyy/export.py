@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+
+from database import column_sql
+
+EXPORT_BATCH_SIZE = 1000
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+
+def iter_transaction_batches(conn, user_id, columns, clauses=(), params=(), batch_size=EXPORT_BATCH_SIZE):
+    # Reads through the request's connection, which FastAPI keeps checked out
+    # until the streamed body is sent. The query runs now, not on the first
+    # batch, so a failure is an error response instead of a truncated body.
+    where = " AND ".join(["user_id = ?"] + list(clauses))
+    sql = f"SELECT {', '.join(map(column_sql, columns))} FROM transactions WHERE {where} ORDER BY date, id"
+    cursor = conn.execute(sql, [user_id] + list(params))
+    return iter(lambda: cursor.fetchmany(batch_size), [])
+
+
+def ndjson_stream(batches, columns):
+    for rows in batches:
+        yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+
+
+def csv_stream(batches, columns):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(rows)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+
+def arrow_schema(columns):
+    import pyarrow as pa
+
+    types = {
+        "id": pa.int64(),
+        "user_id": pa.int64(),
+        "date": pa.string(),
+        "description": pa.string(),
+        "amount": pa.float64(),
+        "category": pa.string(),
+    }
+    return pa.schema([(name, types[name]) for name in columns])
+
+
+def arrow_stream(batches, columns):
+    import pyarrow as pa
+
+    schema = arrow_schema(columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for rows in batches:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # End-of-stream marker written when the writer closes
+    yield sink.getvalue()
+
+
+ENCODERS = {
+    "ndjson": ndjson_stream,
+    "csv": csv_stream,
+    "arrow": arrow_stream,
+}
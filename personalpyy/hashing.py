@@ -0,0 +1,69 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from starlette.concurrency import run_in_threadpool
+
+from metrics import BCRYPT_SECONDS, timed
+from settings import settings
+
+# bcrypt cost factor; hashes with a different cost are upgraded on next login
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+# Size of the hashing process pool; 0 hashes on the request threadpool instead
+BCRYPT_WORKERS = settings.bcrypt_workers
+
+_context = None
+_executor = None
+
+
+def get_context():
+    # Built on first use: passlib is only needed once someone logs in, and
+    # with the process pool only the pool's workers ever need it
+    global _context
+    if _context is None:
+        from passlib.context import CryptContext
+        _context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+    return _context
+
+
+def hash_password(password):
+    return get_context().hash(password)
+
+
+def verify_and_update(password, hashed_password):
+    # Returns (is_valid, new_hash); new_hash is None unless a rehash is due
+    return get_context().verify_and_update(password, hashed_password)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, not fork: the server process has live threads and sockets
+        _executor = ProcessPoolExecutor(
+            max_workers=BCRYPT_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+async def _run(operation, func, *args):
+    with timed(BCRYPT_SECONDS, (operation,)):
+        if BCRYPT_WORKERS <= 0:
+            return await run_in_threadpool(func, *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), func, *args)
+
+
+async def hash_password_async(password):
+    return await _run("hash", hash_password, password)
+
+
+async def verify_and_update_async(password, hashed_password):
+    return await _run("verify", verify_and_update, password, hashed_password)
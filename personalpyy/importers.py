@@ -0,0 +1,175 @@
+import csv
+import hashlib
+import io
+import json
+import re
+from typing import List
+
+from pydantic import TypeAdapter, ValidationError
+
+import aggregates
+from database import bump_data_version, write
+from models import TransactionCreate
+
+VALIDATE_BATCH_SIZE = 1000
+MAX_BULK_ROWS = 50000
+
+_transactions_adapter = TypeAdapter(List[TransactionCreate])
+
+_OFX_TRANSACTION = re.compile(r"<STMTTRN>(.*?)</STMTTRN>", re.IGNORECASE | re.DOTALL)
+_OFX_FIELD = re.compile(r"<([A-Z0-9.]+)>([^<\r\n]*)", re.IGNORECASE)
+
+
+def parse_csv(text):
+    # Expects a header row; column names are matched case-insensitively
+    reader = csv.DictReader(io.StringIO(text))
+    rows = []
+    for record in reader:
+        record = {(k or "").strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in record.items()}
+        rows.append({
+            "date": record.get("date"),
+            "description": record.get("description") or None,
+            "amount": record.get("amount"),
+            "category": record.get("category") or None,
+        })
+    return rows
+
+
+def _ofx_date(value):
+    # DTPOSTED is YYYYMMDD optionally followed by time and timezone
+    value = value.strip()
+    if len(value) < 8 or not value[:8].isdigit():
+        return value
+    return f"{value[:4]}-{value[4:6]}-{value[6:8]}"
+
+
+def parse_ofx(text):
+    # Handles both SGML (OFX 1.x, unclosed leaf tags) and XML (OFX 2.x)
+    rows = []
+    for block in _OFX_TRANSACTION.findall(text):
+        fields = {tag.upper(): value.strip() for tag, value in _OFX_FIELD.findall(block)}
+        rows.append({
+            "date": _ofx_date(fields.get("DTPOSTED", "")),
+            "description": fields.get("NAME") or fields.get("MEMO") or None,
+            "amount": fields.get("TRNAMT"),
+            "category": None,
+        })
+    return rows
+
+
+def validate_rows(rows, batch_size=VALIDATE_BATCH_SIZE):
+    # Validates whole batches in one pydantic-core call; a failing batch is
+    # split into per-row results using the error locations.
+    valid, errors = [], []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        try:
+            parsed = _transactions_adapter.validate_python(batch)
+            valid.extend((start + i, tx) for i, tx in enumerate(parsed))
+            continue
+        except ValidationError as exc:
+            bad = {}
+            for err in exc.errors():
+                index = err["loc"][0] if err["loc"] and isinstance(err["loc"][0], int) else None
+                if index is None:
+                    continue
+                field = ".".join(str(part) for part in err["loc"][1:])
+                bad.setdefault(index, []).append(f"{field}: {err['msg']}" if field else err["msg"])
+        for i, row in enumerate(batch):
+            if i in bad:
+                errors.append({"row": start + i, "error": "; ".join(bad[i])})
+            else:
+                valid.append((start + i, TransactionCreate(**row)))
+    return valid, errors
+
+
+def detect_format(content_type, filename=None):
+    if filename:
+        ext = filename.rsplit(".", 1)[-1].lower()
+        if ext in ("csv", "json"):
+            return ext
+        if ext in ("ofx", "qfx"):
+            return "ofx"
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type == "application/json":
+        return "json"
+    if content_type in ("text/csv", "application/csv"):
+        return "csv"
+    if content_type in ("application/x-ofx", "application/ofx"):
+        return "ofx"
+    return None
+
+
+def decode_body(data):
+    try:
+        return data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        # OFX 1.x files are commonly CP1252/Latin-1
+        return data.decode("latin-1")
+
+
+def parse_rows(data, fmt):
+    # Raises ValueError with a client-facing message on malformed input
+    text = decode_body(data)
+    if fmt == "json":
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ValueError(f"Invalid JSON: {exc}")
+        if not isinstance(rows, list):
+            raise ValueError("Expected a JSON array of transactions")
+    elif fmt == "csv":
+        rows = parse_csv(text)
+    else:
+        rows = parse_ofx(text)
+    if len(rows) > MAX_BULK_ROWS:
+        raise ValueError(f"Too many rows ({len(rows)}); the limit is {MAX_BULK_ROWS}")
+    return rows
+
+
+def row_hash(date, amount_cents, description):
+    key = f"{date}\x1f{amount_cents}\x1f{description or ''}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def existing_hashes(conn, user_id, date_from, date_to):
+    cursor = conn.execute(
+        "SELECT date, amount_cents, description FROM transactions WHERE user_id = ? AND date >= ? AND date <= ?",
+        (user_id, date_from, date_to)
+    )
+    return {row_hash(*row) for row in cursor}
+
+
+def bulk_insert(conn, user_id, transactions, dedupe=False):
+    # transactions: list of (row_index, TransactionCreate). All rows go in
+    # with one executemany inside a single transaction (one fsync), which
+    # holds the write lock from the start so the duplicate check and the
+    # insert see the same data even with concurrent imports.
+    return write(conn, _insert_rows, user_id, transactions, dedupe)
+
+
+def _insert_rows(conn, user_id, transactions, dedupe):
+    duplicates = []
+    if dedupe and transactions:
+        # Only rows already stored count: two identical rows in one file
+        # (e.g. two coffees on the same day) are both imported
+        dates = [tx.date for _, tx in transactions]
+        stored = existing_hashes(conn, user_id, min(dates), max(dates))
+        unique = []
+        for index, tx in transactions:
+            if row_hash(tx.date, tx.amount_cents, tx.description) in stored:
+                duplicates.append(index)
+            else:
+                unique.append((index, tx))
+        transactions = unique
+    if not transactions:
+        return 0, duplicates
+    version = bump_data_version(conn, user_id)
+    rows = [(user_id, tx.date, tx.description, tx.amount_cents, tx.category, version) for _, tx in transactions]
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, description, amount_cents, category, version) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    aggregates.apply_rows(conn, user_id, [(date, cents, category) for _, date, _, cents, category, _ in rows])
+    return len(transactions), duplicates
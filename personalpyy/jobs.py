@@ -0,0 +1,295 @@
+"""In-process background jobs backed by the jobs table.
+
+Jobs are rows, so queued work survives restarts and is shared by every
+process using the database. The worker started from the FastAPI startup
+hook claims due jobs with a single UPDATE ... RETURNING (atomic under
+SQLite's write lock), runs each handler on a thread of its own with its own
+connection and stores the JSON result. Failures are retried with
+exponential backoff up to JOB_MAX_ATTEMPTS. A job whose process died is
+claimed again once its lease expires, so handlers must be safe to re-run.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import metrics
+import recurring
+import reports
+from settings import settings
+
+logger = logging.getLogger(__name__)
+
+# JOBS_ENABLED=0 still lets requests queue jobs; another process runs them
+JOBS_ENABLED = settings.jobs_enabled
+JOB_CONCURRENCY = settings.job_concurrency
+# Idle workers re-check the table this often; enqueue() in this process wakes them at once
+JOB_POLL_SECONDS = settings.job_poll_seconds
+JOB_MAX_ATTEMPTS = settings.job_max_attempts
+JOB_RETRY_BASE_SECONDS = settings.job_retry_base_seconds
+JOB_LEASE_SECONDS = settings.job_lease_seconds
+JOB_RETENTION_DAYS = settings.job_retention_days
+TOMBSTONE_RETENTION_DAYS = settings.tombstone_retention_days
+RECURRING_INTERVAL_SECONDS = settings.recurring_interval_seconds
+
+JOB_COLUMNS = "id, user_id, kind, payload, status, attempts, run_at, result, error, created_at, started_at, finished_at"
+
+
+def purge_finished(conn, user_id=None, payload=None):
+    """Job handler: delete finished jobs older than JOB_RETENTION_DAYS."""
+    return {"deleted": database.write(conn, _purge_finished, time.time() - JOB_RETENTION_DAYS * 86400)}
+
+
+def _purge_finished(conn, before):
+    return conn.execute(
+        "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (before,)
+    ).rowcount
+
+
+def prune_tombstones(conn, user_id=None, payload=None):
+    """Job handler: drop tombstones older than TOMBSTONE_RETENTION_DAYS, on every shard."""
+    before = time.time() - TOMBSTONE_RETENTION_DAYS * 86400
+    if not database.sharded():
+        return {"pruned": database.prune_tombstones(conn, before)}
+    pruned = 0
+    for path in database.shard_paths():
+        with database.connection(path=path) as shard:
+            pruned += database.prune_tombstones(shard, before)
+    return {"pruned": pruned}
+
+
+# kind -> handler(conn, user_id, payload) returning a JSON-serializable
+# result. conn is the user's shard for per-user jobs and the directory
+# database for the others.
+HANDLERS = {
+    "post_recurring": recurring.post_due,
+    "monthly_report": reports.monthly_report,
+    "purge_jobs": purge_finished,
+    "prune_tombstones": prune_tombstones,
+}
+# Kinds that queue their next run (seconds later) when they finish
+PERIODIC = {
+    "post_recurring": RECURRING_INTERVAL_SECONDS,
+    "purge_jobs": 86400,
+    "prune_tombstones": 86400,
+}
+
+
+def enqueue(conn, kind, payload=None, user_id=None, run_at=None, dedupe_key=None):
+    """Queue a job and return its id; the caller commits.
+
+    If a queued job with the same dedupe_key exists it is returned instead,
+    moved earlier if this run_at is sooner. Call notify() after committing
+    so an idle worker in this process picks the job up immediately.
+    """
+    now = time.time()
+    row = conn.execute('''
+        INSERT INTO jobs (user_id, kind, payload, run_at, dedupe_key, created_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (dedupe_key) WHERE status = 'queued'
+        DO UPDATE SET run_at = MIN(run_at, excluded.run_at)
+        RETURNING id
+    ''', (user_id, kind, json.dumps(payload or {}), now if run_at is None else run_at, dedupe_key, now)).fetchone()
+    return row[0]
+
+
+def schedule_periodic(conn, kind, delay=0):
+    enqueue(conn, kind, run_at=time.time() + delay, dedupe_key=kind)
+
+
+def claim(conn):
+    # Takes the oldest due job, or a running one whose lease has expired.
+    # The dedupe key is cleared so the same work can be queued again while
+    # this run is in progress; attempts doubles as the claim token.
+    return database.write(conn, _claim, time.time())
+
+
+def _claim(conn, now):
+    return conn.execute('''
+        UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, dedupe_key = NULL
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE (status = 'queued' AND run_at <= ?) OR (status = 'running' AND started_at < ?)
+            ORDER BY run_at, id LIMIT 1
+        )
+        RETURNING id, user_id, kind, payload, attempts
+    ''', (now, now, now - JOB_LEASE_SECONDS)).fetchone()
+
+
+def complete(conn, job, result):
+    database.write(conn, _complete, job, result)
+
+
+def _complete(conn, job, result):
+    conn.execute(
+        "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ? AND attempts = ?",
+        (json.dumps(result), time.time(), job["id"], job["attempts"]),
+    )
+    if job["kind"] in PERIODIC:
+        schedule_periodic(conn, job["kind"], PERIODIC[job["kind"]])
+
+
+def fail(conn, job, error, retry=True):
+    # Back off 1x, 2x, 4x ... the base delay, with jitter so jobs that failed
+    # together do not retry together
+    final = not retry or job["attempts"] >= JOB_MAX_ATTEMPTS
+    now = time.time()
+    delay = JOB_RETRY_BASE_SECONDS * 2 ** (job["attempts"] - 1) * random.uniform(0.5, 1.5)
+    database.write(conn, _fail, job, error, final, now, delay)
+    return final
+
+
+def _fail(conn, job, error, final, now, delay):
+    conn.execute(
+        "UPDATE jobs SET status = ?, error = ?, run_at = ?, finished_at = ? WHERE id = ? AND attempts = ?",
+        ("failed" if final else "queued", error, now + delay, now if final else None, job["id"], job["attempts"]),
+    )
+    if final and job["kind"] in PERIODIC:
+        schedule_periodic(conn, job["kind"], PERIODIC[job["kind"]])
+
+
+def run_next():
+    # Claims and runs one due job; returns its id, or None if none was due.
+    # The claim, the handler and the outcome each use their own connection,
+    # so the handler can check out connections without nesting.
+    with database.connection() as conn:
+        job = claim(conn)
+    if job is None:
+        return None
+    handler = HANDLERS.get(job["kind"])
+    start = time.perf_counter()
+    error = None
+    try:
+        if handler is None:
+            raise LookupError(f"unknown job kind {job['kind']!r}")
+        with database.connection(job["user_id"]) as conn:
+            result = handler(conn, job["user_id"], json.loads(job["payload"]))
+    except Exception as exc:
+        error = exc
+    with database.connection() as conn:
+        if error is not None:
+            trace = "".join(traceback.format_exception(error, limit=5))
+            final = fail(conn, job, trace, retry=handler is not None)
+            outcome = "failed" if final else "retry"
+            logger.warning("Job %d (%s) attempt %d failed%s", job["id"], job["kind"], job["attempts"],
+                           "" if final else ", will retry", exc_info=error)
+        else:
+            complete(conn, job, result)
+            outcome = "done"
+            logger.debug("Job %d (%s) done", job["id"], job["kind"])
+    if metrics.METRICS_ENABLED:
+        metrics.JOB_SECONDS.observe((job["kind"], outcome), time.perf_counter() - start)
+    return job["id"]
+
+
+def seconds_until_due():
+    # None when nothing is queued
+    with database.connection() as conn:
+        run_at = conn.execute("SELECT MIN(run_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    return None if run_at is None else max(0.0, run_at - time.time())
+
+
+def get_job(conn, user_id, job_id):
+    return conn.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ? AND user_id = ?", (job_id, user_id)).fetchone()
+
+
+def list_jobs(conn, user_id, limit=20):
+    return conn.execute(
+        f"SELECT {JOB_COLUMNS} FROM jobs WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+    ).fetchall()
+
+
+def job_dict(row, include_result=True):
+    data = dict(row)
+    data["payload"] = json.loads(data["payload"])
+    data["result"] = json.loads(data["result"]) if include_result and data["result"] is not None else None
+    return data
+
+
+class Worker:
+    """Runs due jobs on ``concurrency`` dedicated threads.
+
+    Handlers never run on the event loop or the request thread pool, so a
+    slow report cannot hold up interactive requests.
+    """
+
+    def __init__(self, concurrency=JOB_CONCURRENCY, poll_seconds=JOB_POLL_SECONDS):
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._executor = ThreadPoolExecutor(concurrency, thread_name_prefix="job")
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self._stopping = False
+        self._loop = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        await self._loop.run_in_executor(self._executor, self._schedule_periodic)
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    def _schedule_periodic(self):
+        with database.connection() as conn:
+            with conn:
+                for kind in PERIODIC:
+                    schedule_periodic(conn, kind)
+
+    def wake(self):
+        # Callable from any thread, e.g. a sync route after enqueue()
+        if self._loop is not None and not self._stopping:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                job_id = await self._loop.run_in_executor(self._executor, run_next)
+            except Exception:
+                # e.g. the database is locked past busy_timeout; try again later
+                logger.exception("Job worker error")
+                job_id = None
+            if job_id is not None:
+                continue
+            # Sleep until the next queued job (e.g. a retry) is due, a
+            # notify(), or the poll interval for jobs queued by other processes
+            timeout = self.poll_seconds
+            try:
+                due = await self._loop.run_in_executor(self._executor, seconds_until_due)
+                if due is not None:
+                    timeout = min(timeout, due)
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def stop(self):
+        # Jobs already running are allowed to finish
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+        self._executor.shutdown(wait=True)
+
+
+worker = None
+
+
+async def start():
+    global worker
+    worker = Worker()
+    await worker.start()
+    logger.info("Started %d background job workers", worker.concurrency)
+
+
+async def stop():
+    global worker
+    if worker is not None:
+        await worker.stop()
+        worker = None
+
+
+def notify():
+    if worker is not None:
+        worker.wake()
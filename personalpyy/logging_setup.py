@@ -0,0 +1,52 @@
+import logging
+import logging.handlers
+import queue
+import random
+
+from settings import settings
+
+LOG_LEVEL = settings.log_level
+# Fraction of DEBUG records kept; INFO and above are never sampled
+LOG_DEBUG_SAMPLE_RATE = settings.log_debug_sample_rate
+
+_listener = None
+_handler = None
+
+
+class DebugSampler(logging.Filter):
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or random.random() < self.rate
+
+
+def setup_logging():
+    """Route app logging through a queue so request threads never block on I/O.
+
+    Records are enqueued by a QueueHandler on the root logger and written to
+    stderr by a QueueListener thread. Safe to call more than once.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+    log_queue = queue.SimpleQueue()
+    _handler = logging.handlers.QueueHandler(log_queue)
+    _handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+    root = logging.getLogger()
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    output = logging.StreamHandler()
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    # Flushes queued records and detaches the handler
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = _handler = None
@@ -1,156 +1,680 @@
 from fastapi import Body
 
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, Response
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from models import Transaction, TransactionCreate, UserCreate, UserLogin, User
-from database import get_db_connection, init_db
-from typing import List
-from passlib.context import CryptContext
+from starlette.concurrency import run_in_threadpool
+from models import Transaction, TransactionCreate, UserCreate, User, Recurring, RecurringCreate, to_cents
+from database import (
+    get_db, connection, init_db, close_pool, get_data_version, column_sql, sharded, add_user_to_shard,
+    insert_transaction, update_transaction_row, delete_transaction_row,
+)
+from auth_cache import TokenCache, CachedUser
+from export import ENCODERS, MEDIA_TYPES, iter_transaction_batches
+from importers import bulk_insert, detect_format, parse_rows, validate_rows
+from search import SEARCH_FIELDS, fts_query, search_query
+import encoding
+import aggregates
+import jobs
+import recurring
+import timeseries
+from typing import List, Optional
+from hashing import hash_password_async, verify_and_update_async, shutdown_executor
+from logging_setup import setup_logging, stop_logging
+import metrics
+import throttle
 import uuid
-import os
-from dotenv import load_dotenv
+import datetime
+import hashlib
+import logging
+import sys
+import time
+from settings import settings
 
 
-load_dotenv()
-DB_PATH = os.getenv("DATABASE_URL", "finance.db")
-print("Using database file:", DB_PATH)
+DB_PATH = settings.database_url
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+rate_limiter = throttle.RateLimiter(settings.rate_limit_per_second, settings.rate_limit_burst)
+login_limiter = throttle.RateLimiter(settings.login_rate_limit_per_minute / 60, settings.login_rate_limit_burst)
+coalescer = throttle.SingleFlight(enabled=settings.coalesce_reads)
+
+def known_token(authorization):
+    # Tokens that have authenticated recently; see ThrottleMiddleware
+    scheme, _, token = authorization.partition(" ")
+    return scheme.lower() == "bearer" and token in token_cache
+
+# Added first so it runs inside MetricsMiddleware, which then also times
+# rejected and coalesced requests
+app.add_middleware(
+    throttle.ThrottleMiddleware, limiter=rate_limiter, login_limiter=login_limiter, coalescer=coalescer,
+    known_token=known_token,
+)
+if metrics.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/token")
-SECRET_KEY = os.getenv("SECRET_KEY", "supersecret")
+SECRET_KEY = settings.secret_key
+# "async" serves the transaction routes from aiosqlite reads and a single writer task
+DB_MODE = settings.db_mode
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+# Clients may keep responses but must revalidate them with If-None-Match
+CACHE_CONTROL = "private, no-cache"
+MAX_PAGE_SIZE = 1000
+# Larger deltas are answered with "full": reloading via the export is cheaper
+MAX_CHANGES = settings.max_changes
+# Upper bound on the points of one /analytics/timeseries response
+MAX_SERIES_POINTS = 5000
+TRANSACTION_FIELDS = ("id", "user_id", "date", "description", "amount", "category")
+# Columns of /summary/categories, keyed by by_month
+SUMMARY_COLUMNS = {False: ("category", "total", "count"), True: ("month", "category", "total", "count")}
+token_cache = TokenCache(
+    maxsize=settings.auth_cache_size,
+    ttl=settings.auth_cache_ttl_seconds,
+)
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    valid, _ = await verify_and_update_async(plain_password, hashed_password)
+    return valid
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await hash_password_async(password)
 
-def create_access_token(user_id):
+def create_access_token(user_id, conn):
     # Generate a random token and store it in the DB for the user
     token = str(uuid.uuid4())
-    conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute("UPDATE users SET token = ? WHERE id = ?", (token, user_id))
+    cursor.execute(
+        "UPDATE users SET token = ?, token_created_at = ? WHERE id = ?",
+        (token, time.time(), user_id)
+    )
     conn.commit()
-    print(f"Set token for user {user_id}: {token}")
-    conn.close()
+    # The previous token is no longer in the DB; drop it from the cache too
+    token_cache.invalidate_user(user_id)
+    logger.info("Issued access token for user %s", user_id)
     return token
 
-def get_user_by_username(username):
-    conn = get_db_connection()
+def get_user_by_username(username, conn):
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM users WHERE username = ?", (username,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    return cursor.fetchone()
+
+TOKEN_LOOKUP_SQL = "SELECT id, username, token_created_at FROM users WHERE token = ?"
 
-def get_user_by_token(token):
-    conn = get_db_connection()
+def get_user_by_token(token, conn):
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE token = ?", (token,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    cursor.execute(TOKEN_LOOKUP_SQL, (token,))
+    return user_from_token_row(cursor.fetchone())
+
+def user_from_token_row(row):
+    if row is None or row["token_created_at"] is None:
+        return None
+    expires_at = row["token_created_at"] + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+    return CachedUser(id=row["id"], username=row["username"], expires_at=expires_at)
+
+# The async auth routes check out a connection only around their SQL, never
+# while awaiting bcrypt, so a login storm cannot drain the connection pool.
+
+def find_user(username):
+    with connection() as conn:
+        return get_user_by_username(username, conn)
+
+def update_password_hash(user_id, password_hash):
+    with connection() as conn:
+        conn.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+        conn.commit()
+
+def issue_access_token(user_id):
+    with connection() as conn:
+        return create_access_token(user_id, conn)
+
+def insert_user(username, password_hash):
+    # The directory row is committed and its connection returned before the
+    # shard row is written, so registration never holds two connections
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO users (username, password_hash, token) VALUES (?, ?, ?)", (username, password_hash, None))
+        conn.commit()
+        user_id = cursor.lastrowid
+    try:
+        add_user_to_shard(user_id, username)
+    except Exception:
+        with connection() as conn:
+            conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+            conn.commit()
+        raise
+    return user_id
 
-def authenticate_user(username, password):
-    user = get_user_by_username(username)
+async def authenticate_user(username, password):
+    user = await run_in_threadpool(find_user, username)
     if not user:
         return None
-    if not verify_password(password, user[2]):
+    valid, new_hash = await verify_and_update_async(password, user[2])
+    if not valid:
         return None
+    if new_hash is not None:
+        # Hash was made with an outdated cost or scheme; upgrade it in place
+        await run_in_threadpool(update_password_hash, user[0], new_hash)
     return user
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
-    print("Received token:", token)
+def get_current_user(token: str = Depends(oauth2_scheme), conn=Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    user = get_user_by_token(token)
-    print("User found:", user)
+    user = token_cache.get(token)
     if user is None:
-        raise credentials_exception
+        user = get_user_by_token(token, conn)
+        if user is None or user.expires_at <= time.time():
+            logger.debug("Rejected unknown or expired token")
+            raise credentials_exception
+        logger.debug("Token cache miss for user %s", user.id)
+        token_cache.put(token, user)
     return user
+
+def get_user_db(user=Depends(get_current_user), conn=Depends(get_db)):
+    # Connection to the authenticated user's shard; unsharded, the request's
+    # one connection is shared with get_current_user
+    if not sharded():
+        yield conn
+        return
+    with connection(user[0]) as user_conn:
+        yield user_conn
+
 @app.post("/register", response_model=User)
-def register(user: UserCreate):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    password_hash = get_password_hash(user.password)
+async def register(user: UserCreate):
+    password_hash = await get_password_hash(user.password)
     try:
-        cursor.execute("INSERT INTO users (username, password_hash, token) VALUES (?, ?, ?)", (user.username, password_hash, None))
-        conn.commit()
-        user_id = cursor.lastrowid
+        user_id = await run_in_threadpool(insert_user, user.username, password_hash)
     except Exception as e:
-        conn.close()
         raise HTTPException(status_code=400, detail="Username already exists")
-    conn.close()
     return User(id=user_id, username=user.username)
 
 @app.post("/token")
-def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    access_token = create_access_token(user[0])
+    access_token = await run_in_threadpool(issue_access_token, user[0])
     return {"access_token": access_token, "token_type": "bearer"}
 
+@metrics.register_collector
+def token_cache_metrics():
+    stats = token_cache.stats()
+    return [
+        ("auth_cache_hits_total", "counter", "Token cache hits", [({}, stats["hits"])]),
+        ("auth_cache_misses_total", "counter", "Token cache misses", [({}, stats["misses"])]),
+        ("auth_cache_evictions_total", "counter", "Token cache evictions", [({}, stats["evictions"])]),
+        ("auth_cache_size", "gauge", "Tokens currently cached", [({}, stats["size"])]),
+        ("auth_cache_hit_ratio", "gauge", "Hits over lookups since start", [({}, stats["hit_rate"])]),
+    ]
+
+@metrics.register_collector
+def throttle_metrics():
+    requests, logins, coalescing = rate_limiter.stats(), login_limiter.stats(), coalescer.stats()
+    return [
+        ("rate_limited_requests_total", "counter", "Requests answered 429 by the rate limiter",
+         [({"limiter": "token"}, requests["limited"]), ({"limiter": "login"}, logins["limited"])]),
+        ("coalesced_requests_total", "counter", "Reads served from an identical in-flight request",
+         [({}, coalescing["coalesced"])]),
+        ("coalesce_leaders_total", "counter", "Reads that ran and whose response could be shared",
+         [({}, coalescing["leaders"])]),
+        ("rate_limit_buckets", "gauge", "Clients with a token bucket", [({}, requests["buckets"] + logins["buckets"])]),
+    ]
+
+if metrics.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics_endpoint():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.on_event("startup")
-def startup():
+async def startup():
+    setup_logging()
+    logger.info("Using database file: %s", DB_PATH)
     init_db()
+    if jobs.JOBS_ENABLED:
+        await jobs.start()
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Running jobs finish before the pool they use is closed
+    await jobs.stop()
+    close_pool()
+    shutdown_executor()
+    stop_logging()
 
 
 @app.post("/transactions/", response_model=Transaction)
-def add_transaction(tx: TransactionCreate, user=Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO transactions (user_id, date, description, amount, category) VALUES (?, ?, ?, ?, ?)",
-        (user[0], tx.date, tx.description, tx.amount, tx.category)
-    )
+def add_transaction(tx: TransactionCreate, user=Depends(get_current_user), conn=Depends(get_user_db)):
+    tx_id = insert_transaction(conn, user[0], tx)
     conn.commit()
-    tx_id = cursor.lastrowid
-    conn.close()
-    return Transaction(id=tx_id, user_id=user[0], **tx.dict())
+    return tx.stored(tx_id, user[0])
+
+
+def transaction_filters(
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    category: Optional[str] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+):
+    # Returns extra WHERE clauses and their params; dates are inclusive ISO
+    # strings, amount bounds are compared in cents
+    clauses, params = [], []
+    if date_from is not None:
+        clauses.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("date <= ?")
+        params.append(date_to)
+    if category is not None:
+        clauses.append("category = ?")
+        params.append(category)
+    try:
+        if min_amount is not None:
+            clauses.append("amount_cents >= ?")
+            params.append(to_cents(min_amount))
+        if max_amount is not None:
+            clauses.append("amount_cents <= ?")
+            params.append(to_cents(max_amount))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return clauses, params
+
+def data_etag(request: Request, user_id, version, variant=None):
+    # Responses vary by path and query string, so both are part of the tag,
+    # as is the negotiated encoding (variant) for routes that have one.
+    # The version is read before the data: a write in between yields newer
+    # data under an older tag, which only costs the client one extra fetch.
+    query = "&".join(sorted(request.url.query.split("&")))
+    digest = hashlib.sha1(f"{user_id}:{request.url.path}?{query}#{variant}".encode()).hexdigest()[:16]
+    return f'"{version}-{digest}"'
+
+def etag_matches(request: Request, etag):
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return "*" in tags or etag in tags
+
+def conditional(request: Request, user, conn, variant=None):
+    # Returns (etag, 304 response or None) for a read of the user's data
+    return conditional_for_version(request, user, get_data_version(conn, user[0]), variant)
+
+def conditional_for_version(request: Request, user, version, variant=None):
+    etag = data_etag(request, user[0], version, variant)
+    if etag_matches(request, etag):
+        headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+        if variant is not None:
+            headers["Vary"] = "Accept"
+        return etag, Response(status_code=304, headers=headers)
+    return etag, None
+
+def parse_fields(fields: Optional[str] = None):
+    if fields is None:
+        return None
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in TRANSACTION_FIELDS]
+    if unknown or not selected:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return selected
+
+
+def import_transactions(conn, user_id, data, fmt, dedupe):
+    rows = parse_rows(data, fmt)
+    valid, errors = validate_rows(rows)
+    inserted, duplicates = bulk_insert(conn, user_id, valid, dedupe=dedupe)
+    return {
+        "received": len(rows),
+        "inserted": inserted,
+        "duplicates": duplicates,
+        "errors": errors,
+    }
+
+@app.post("/transactions/bulk")
+async def bulk_import_transactions(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(json|csv|ofx)$"),
+    dedupe: bool = False,
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Body is a JSON array, a CSV/OFX document, or a multipart upload in a
+    # "file" field. Invalid rows are reported, the rest are still inserted.
+    content_type = request.headers.get("content-type", "")
+    filename = None
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Expected an uploaded file in the 'file' field")
+        filename = upload.filename
+        content_type = upload.content_type
+        data = await upload.read()
+    else:
+        data = await request.body()
+    fmt = format or detect_format(content_type, filename)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Could not determine import format; pass ?format=json|csv|ofx")
+    try:
+        return await run_in_threadpool(import_transactions, conn, user[0], data, fmt, dedupe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+CURSOR_LOOKUP_SQL = "SELECT date FROM transactions WHERE id = ? AND user_id = ?"
 
+def list_query(user_id, filters, fields, after=None, limit=None):
+    # after is the (date, id) of the cursor row; one extra row is fetched to
+    # tell whether another page follows
+    clauses, params = filters
+    where = ["user_id = ?"] + clauses
+    params = [user_id] + params
+    if after is not None:
+        where.append("(date, id) > (?, ?)")
+        params += list(after)
+    columns = fields or TRANSACTION_FIELDS
+    select = list(dict.fromkeys(list(columns) + ["id"]))
+    sql = f"SELECT {', '.join(map(column_sql, select))} FROM transactions WHERE {' AND '.join(where)} ORDER BY date, id"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params
+
+def list_response(rows, fields, limit, etag, fmt="json"):
+    # Encoded straight from the rows: the SQL already returns the
+    # Transaction fields with their API types
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = str(rows[-1]["id"])
+    return encoding.rows_response(rows, fields or TRANSACTION_FIELDS, fmt, headers)
 
 @app.get("/transactions/", response_model=List[Transaction])
-def list_transactions(user=Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM transactions WHERE user_id = ?", (user[0],))
-    rows = cursor.fetchall()
-    conn.close()
-    return [Transaction(**dict(row)) for row in rows]
+def list_transactions(
+    request: Request,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    filters=Depends(transaction_filters),
+    fields=Depends(parse_fields),
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Rows come back in (date, id) order, served by idx_transactions_user_date.
+    # after_id is the keyset cursor: the id of the last row of the previous page.
+    etag, not_modified = conditional(request, user, conn, fmt)
+    if not_modified is not None:
+        return not_modified
+    after = None
+    if after_id is not None:
+        cursor_row = conn.execute(CURSOR_LOOKUP_SQL, (after_id, user[0])).fetchone()
+        if cursor_row is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        after = (cursor_row["date"], after_id)
+    sql, params = list_query(user[0], filters, fields, after, limit)
+    rows = conn.execute(sql, params).fetchall()
+    return list_response(rows, fields, limit, etag, fmt)
+
+
+@app.get("/transactions/search", response_model=List[Transaction])
+def search_transactions(
+    request: Request,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Ranked full-text search over description and category. Words are ANDed,
+    # "word*" is a prefix match; the next page's offset is in X-Next-Offset.
+    match = fts_query(q, user[0])
+    if match is None:
+        raise HTTPException(status_code=400, detail="Query has no searchable words")
+    etag, not_modified = conditional(request, user, conn, fmt)
+    if not_modified is not None:
+        return not_modified
+    sql, params = search_query(user[0], match, limit, offset)
+    rows = conn.execute(sql, params).fetchall()
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Offset"] = str(offset + limit)
+    return encoding.rows_response(rows, SEARCH_FIELDS, fmt, headers)
+
+
+@app.get("/transactions/export")
+def export_transactions(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv|arrow)$"),
+    filters=Depends(transaction_filters),
+    fields=Depends(parse_fields),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Streams the whole (filtered) history in fetchmany batches. X-Data-Version
+    # is the starting point for /transactions/changes.
+    version = get_data_version(conn, user[0])
+    etag, not_modified = conditional_for_version(request, user, version)
+    if not_modified is not None:
+        return not_modified
+    columns = fields or TRANSACTION_FIELDS
+    clauses, params = filters
+    batches = iter_transaction_batches(conn, user[0], columns, clauses, params)
+    return StreamingResponse(
+        ENCODERS[format](batches, columns),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="transactions.{format}"',
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL,
+            "X-Data-Version": str(version),
+        },
+    )
+
+
+def changes_columns(fields):
+    # Deltas always carry the id, which clients match rows on
+    return list(dict.fromkeys(list(fields or TRANSACTION_FIELDS) + ["id"]))
+
+def changes_query(user_id, since, fields, limit):
+    columns = changes_columns(fields)
+    sql = f'''
+        SELECT {', '.join(map(column_sql, columns))} FROM transactions
+        WHERE user_id = ? AND version > ? ORDER BY date, id LIMIT ?
+    '''
+    return sql, [user_id, since, limit + 1]
+
+@app.get("/transactions/changes")
+def transaction_changes(
+    request: Request,
+    since: int = Query(..., ge=0),
+    fields=Depends(parse_fields),
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Rows inserted or updated and ids deleted after data version `since`,
+    # read from one snapshot so `version` is exactly the state they bring
+    # the client to. "full": true means the client should reload from
+    # /transactions/export instead (a version this database never had, one
+    # older than the pruned tombstones, or more than MAX_CHANGES changed
+    # rows and deleted ids together).
+    conn.execute("BEGIN")
+    try:
+        version = get_data_version(conn, user[0])
+        etag, not_modified = conditional_for_version(request, user, version, fmt)
+        if not_modified is not None:
+            return not_modified
+        columns = changes_columns(fields)
+        body = {"version": version, "full": False, "upserts": encoding.shape_rows([], columns, fmt), "deleted": []}
+        pruned = conn.execute("SELECT tombstones_pruned FROM users WHERE id = ?", (user[0],)).fetchone()
+        if since > version or (pruned is not None and since < pruned[0]):
+            body["full"] = True
+        elif since < version:
+            sql, params = changes_query(user[0], since, fields, MAX_CHANGES)
+            rows = conn.execute(sql, params).fetchall()
+            deleted = [] if len(rows) > MAX_CHANGES else [row[0] for row in conn.execute(
+                "SELECT tx_id FROM transaction_tombstones WHERE user_id = ? AND version > ? LIMIT ?",
+                (user[0], since, MAX_CHANGES + 1 - len(rows)),
+            )]
+            if len(rows) + len(deleted) > MAX_CHANGES:
+                body["full"] = True
+            else:
+                body["upserts"] = encoding.shape_rows(rows, columns, fmt)
+                body["deleted"] = deleted
+    finally:
+        conn.rollback()
+    return encoding.response(body, fmt, {"ETag": etag, "Cache-Control": CACHE_CONTROL})
 
 
 @app.delete("/transactions/{tx_id}")
-def delete_transaction(tx_id: str, user=Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (tx_id, user[0]))
+def delete_transaction(tx_id: str, user=Depends(get_current_user), conn=Depends(get_user_db)):
+    # Read the old row under the write lock so the aggregate delta is exact
+    conn.execute("BEGIN IMMEDIATE")
+    affected = delete_transaction_row(conn, user[0], tx_id)
     conn.commit()
-    affected = cursor.rowcount
-    conn.close()
     if affected == 0:
         raise HTTPException(status_code=404, detail="Transaction not found")
     return {"detail": "Transaction deleted"}
 
 # Update transaction endpoint
 @app.put("/transactions/{tx_id}", response_model=Transaction)
-def update_transaction(tx_id: int, tx: TransactionCreate = Body(...), user=Depends(get_current_user)):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE transactions SET date = ?, description = ?, amount = ?, category = ? WHERE id = ? AND user_id = ?",
-        (tx.date, tx.description, tx.amount, tx.category, tx_id, user[0])
-    )
+def update_transaction(tx_id: int, tx: TransactionCreate = Body(...), user=Depends(get_current_user), conn=Depends(get_user_db)):
+    conn.execute("BEGIN IMMEDIATE")
+    affected = update_transaction_row(conn, user[0], tx_id, tx)
     conn.commit()
-    affected = cursor.rowcount
-    conn.close()
     if affected == 0:
         raise HTTPException(status_code=404, detail="Transaction not found or not owned by user")
-    return Transaction(id=tx_id, user_id=user[0], **tx.dict())
+    return tx.stored(tx_id, user[0])
+
+
+@app.get("/summary/categories")
+def summary_categories(
+    request: Request,
+    month_from: Optional[str] = None,
+    month_to: Optional[str] = None,
+    by_month: bool = False,
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # Served from category_monthly_totals; months are YYYY-MM, inclusive
+    etag, not_modified = conditional(request, user, conn, fmt)
+    if not_modified is not None:
+        return not_modified
+    data = aggregates.category_totals(conn, user[0], month_from, month_to, by_month)
+    if fmt != "json":
+        data = encoding.columnar_dicts(data, SUMMARY_COLUMNS[by_month])
+    return encoding.response(data, fmt, {"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+@app.get("/summary/balance")
+def summary_balance(
+    request: Request,
+    bucket: str = Query("day", pattern="^(day|month)$"),
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    etag, not_modified = conditional(request, user, conn, fmt)
+    if not_modified is not None:
+        return not_modified
+    data = aggregates.balance_series(conn, user[0], bucket)
+    if fmt != "json":
+        data = encoding.columnar_dicts(data, ("date", "balance"))
+    return encoding.response(data, fmt, {"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+@app.get("/analytics/timeseries")
+def analytics_timeseries(
+    request: Request,
+    bucket: str = Query("day", pattern="^(day|week|month)$"),
+    metric: str = Query("balance", pattern="^(balance|spend|income)$"),
+    category: Optional[str] = None,
+    date_from: Optional[datetime.date] = None,
+    date_to: Optional[datetime.date] = None,
+    max_points: int = Query(timeseries.DEFAULT_MAX_POINTS, ge=3, le=MAX_SERIES_POINTS),
+    fmt=Depends(encoding.negotiate),
+    user=Depends(get_current_user),
+    conn=Depends(get_user_db),
+):
+    # One value per bucket (end-of-bucket balance, or the bucket's total
+    # spend or income), downsampled to at most max_points for charting.
+    # Already columnar, so every format sends the same structure.
+    etag, not_modified = conditional(request, user, conn, fmt)
+    if not_modified is not None:
+        return not_modified
+    try:
+        data = timeseries.timeseries(
+            conn, user[0], bucket, metric, category,
+            date_from and date_from.isoformat(), date_to and date_to.isoformat(), max_points,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return encoding.response(data, fmt, {"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+@app.post("/recurring", response_model=Recurring, status_code=201)
+def create_recurring(
+    rule: RecurringCreate, user=Depends(get_current_user), conn=Depends(get_user_db), db=Depends(get_db)
+):
+    # Occurrences up to today are posted right away by the background worker,
+    # later ones by its periodic run. The job queue is in the directory
+    # database, which is the same connection unless sharded.
+    rule_id = recurring.create_rule(conn, user[0], rule)
+    conn.commit()
+    jobs.enqueue(db, "post_recurring", dedupe_key="post_recurring")
+    db.commit()
+    jobs.notify()
+    return recurring.rule_dict(recurring.get_rule(conn, user[0], rule_id))
+
+@app.get("/recurring", response_model=List[Recurring])
+def list_recurring(user=Depends(get_current_user), conn=Depends(get_user_db)):
+    return [recurring.rule_dict(row) for row in recurring.list_rules(conn, user[0])]
+
+@app.delete("/recurring/{rule_id}")
+def delete_recurring(rule_id: int, user=Depends(get_current_user), conn=Depends(get_user_db)):
+    affected = recurring.delete_rule(conn, user[0], rule_id)
+    conn.commit()
+    if affected == 0:
+        raise HTTPException(status_code=404, detail="Recurring transaction not found")
+    return {"detail": "Recurring transaction deleted"}
+
+
+@app.post("/reports/monthly", status_code=202)
+def request_monthly_report(
+    month: str = Query(..., pattern=r"^\d{4}-(0[1-9]|1[0-2])$"),
+    user=Depends(get_current_user),
+    conn=Depends(get_db),
+):
+    # Built by the background worker; poll the job for the result. Asking
+    # again while the same report is still queued returns the queued job.
+    job_id = jobs.enqueue(
+        conn, "monthly_report", {"month": month}, user_id=user[0], dedupe_key=f"monthly_report:{user[0]}:{month}"
+    )
+    conn.commit()
+    jobs.notify()
+    return JSONResponse(
+        {"job_id": job_id, "status": f"/jobs/{job_id}"}, status_code=202, headers={"Location": f"/jobs/{job_id}"}
+    )
+
+@app.get("/jobs")
+def list_jobs(limit: int = Query(20, ge=1, le=100), user=Depends(get_current_user), conn=Depends(get_db)):
+    # Status only; fetch a single job for its result
+    return [jobs.job_dict(row, include_result=False) for row in jobs.list_jobs(conn, user[0], limit)]
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: int, user=Depends(get_current_user), conn=Depends(get_db)):
+    row = jobs.get_job(conn, user[0], job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return jobs.job_dict(row)
+
+
+if DB_MODE == "async":
+    if sharded():
+        raise RuntimeError("DB_MODE=async does not support DB_SHARDS > 1")
+    import async_routes
+    async_routes.install(app, sys.modules[__name__], read_pool_size=settings.async_read_pool_size)
@@ -0,0 +1,229 @@
+"""In-process latency/throughput metrics in Prometheus text format.
+
+Everything here is a no-op unless METRICS_ENABLED is set: the middleware is
+not installed, connections are not wrapped and /metrics is not registered.
+"""
+import bisect
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from settings import settings
+
+METRICS_ENABLED = settings.metrics_enabled
+
+# Seconds; covers sub-millisecond SQL up to slow bcrypt/exports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (+Inf last), sum
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in sorted(snapshot):
+            base = _labels(self.labelnames, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{{{base}{',' if base else ''}le=\"{le}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative}")
+        return lines
+
+
+def _labels(names, values):
+    return ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status"),
+)
+SQL_SECONDS = Histogram(
+    "sql_statement_duration_seconds", "Time spent in execute/executemany by statement kind", ("statement",),
+)
+BCRYPT_SECONDS = Histogram(
+    "bcrypt_duration_seconds", "Password hash/verify time including pool queueing", ("operation",),
+)
+JOB_SECONDS = Histogram(
+    "job_duration_seconds", "Background job run time by kind and outcome", ("kind", "outcome"),
+    buckets=DEFAULT_BUCKETS + (30.0, 60.0, 300.0),
+)
+HISTOGRAMS = (HTTP_SECONDS, SQL_SECONDS, BCRYPT_SECONDS, JOB_SECONDS)
+
+# Callables returning (name, type, help, [(labels dict, value)]) for values
+# that other modules already count, e.g. the token cache
+_collectors = []
+
+
+def register_collector(fn):
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                base = _labels(labels.keys(), labels.values())
+                lines.append(f"{name}{{{base}}} {value}" if base else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+@contextmanager
+def timed(histogram, labels):
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(labels, time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency per (method, route template, status).
+
+    Uses the matched route's path template, not the raw URL, so ids in the
+    path do not create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_SECONDS.observe((scope["method"], path, status[0]), time.perf_counter() - start)
+
+
+# Statement label: leading verb plus the first table it touches
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE|TABLE)\s+(\w+)", re.IGNORECASE)
+_statement_labels = {}
+
+
+def statement_label(sql):
+    label = _statement_labels.get(sql)
+    if label is None:
+        words = sql.split(None, 1)
+        verb = words[0].upper() if words else "?"
+        match = _TABLE.search(sql)
+        label = f"{verb} {match.group(1)}" if match else verb
+        if len(_statement_labels) < 4096:
+            _statement_labels[sql] = label
+    return label
+
+
+class TimedCursor:
+    """sqlite3 cursor proxy timing execute/executemany.
+
+    Only the statement's first step is timed; rows fetched afterwards are
+    not, which matches how long the statement held the database.
+    """
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, params=()):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, params)
+        finally:
+            SQL_SECONDS.observe((statement_label(sql),), time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq)
+        finally:
+            SQL_SECONDS.observe((statement_label(sql),), time.perf_counter() - start)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        # e.g. row_factory must reach the real cursor
+        if name == "_cursor":
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._cursor, name, value)
+
+
+class TimedConnection:
+    """Proxy around a (possibly pooled) sqlite3 connection; close() still
+    goes to the wrapped connection, so pooled connections are returned."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return TimedCursor(self._conn.cursor())
+
+    def execute(self, sql, params=()):
+        return TimedCursor(self._conn.cursor()).execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return TimedCursor(self._conn.cursor()).executemany(sql, seq)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def instrument_connection(conn):
+    return TimedConnection(conn) if METRICS_ENABLED else conn
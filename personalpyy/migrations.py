@@ -0,0 +1,496 @@
+"""Versioned schema migrations.
+
+Each migration has a version, runs at most once per database and is
+recorded in schema_version. Migrations are also written to be idempotent,
+so databases created before this table existed are adopted without
+changes. Usage:
+
+    python migrations.py [migrate|status]
+"""
+import logging
+import time
+from collections import namedtuple
+
+import aggregates
+
+logger = logging.getLogger(__name__)
+
+# transactional: run inside one BEGIN IMMEDIATE ... COMMIT together with the
+#   schema_version insert. Chunked backfills set it to False and commit per
+#   chunk themselves, so they must be safe to re-run after an interruption.
+# analyze: refresh planner statistics once the run finishes (new indexes).
+Migration = namedtuple("Migration", "version name apply transactional analyze")
+
+# Pause between backfill chunks so other writers can take the lock
+BACKFILL_PAUSE_SECONDS = 0.01
+# Rows per transaction when a backfill walks a table by id
+BACKFILL_ROWS = 5000
+
+TRANSACTIONS_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        date TEXT NOT NULL,
+        description TEXT,
+        amount_cents INTEGER NOT NULL,
+        category TEXT,
+        FOREIGN KEY(user_id) REFERENCES users(id)
+    )
+'''
+
+
+def create_users(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            token TEXT,
+            token_created_at REAL,
+            data_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def users_token_columns(conn):
+    # Older databases predate token_created_at; existing tokens get a fresh
+    # lifetime from now instead of being expired on upgrade.
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(users)")]
+    if "token" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN token TEXT")
+    if "token_created_at" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN token_created_at REAL")
+        conn.execute("UPDATE users SET token_created_at = ? WHERE token IS NOT NULL", (time.time(),))
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_users_token ON users(token)")
+    if "data_version" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0")
+
+
+def create_transactions(conn):
+    conn.execute(TRANSACTIONS_SCHEMA)
+
+
+CENTS_UPSERT = '''
+    INSERT OR REPLACE INTO transactions_cents (id, user_id, date, description, amount_cents, category)
+    VALUES (new.id, new.user_id, new.date, new.description, CAST(ROUND(new.amount * 100) AS INTEGER), new.category);
+'''
+
+
+def amount_cents(conn, progress=None):
+    # Older databases store amount as REAL. SQLite cannot change a column's
+    # type, so the rows are copied into a new table with the amounts rounded
+    # to cents, a range of ids per transaction, and the new table replaces
+    # the old one at the end. Triggers on the old table mirror writes made
+    # in the meantime, and the copy skips ids they have already written.
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not has_column(conn, "transactions", "amount"):
+            return
+        conn.execute(TRANSACTIONS_SCHEMA.replace("transactions", "transactions_cents", 1))
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS transactions_cents_insert AFTER INSERT ON transactions BEGIN
+                {CENTS_UPSERT}
+            END
+        ''')
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS transactions_cents_update AFTER UPDATE ON transactions BEGIN
+                DELETE FROM transactions_cents WHERE id = old.id;
+                {CENTS_UPSERT}
+            END
+        ''')
+        conn.execute('''
+            CREATE TRIGGER IF NOT EXISTS transactions_cents_delete AFTER DELETE ON transactions BEGIN
+                DELETE FROM transactions_cents WHERE id = old.id;
+            END
+        ''')
+
+    def copy(bounds):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have finished the switch meanwhile
+            if has_column(conn, "transactions", "amount"):
+                conn.execute('''
+                    INSERT OR IGNORE INTO transactions_cents (id, user_id, date, description, amount_cents, category)
+                    SELECT id, user_id, date, description, CAST(ROUND(amount * 100) AS INTEGER), category
+                    FROM transactions WHERE id > ? AND id <= ?
+                ''', bounds)
+
+    backfill(conn, "amount_cents", id_chunks(conn, "transactions"), copy, progress)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not has_column(conn, "transactions", "amount"):
+            return
+        # Keep the AUTOINCREMENT high-water mark so deleted ids are not reused
+        seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'transactions'").fetchone()
+        # Drops the mirroring triggers with it
+        conn.execute("DROP TABLE transactions")
+        conn.execute("ALTER TABLE transactions_cents RENAME TO transactions")
+        if seq is not None:
+            conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'transactions'", (seq[0],))
+        # Aggregates from before the switch are in REAL units; rebuilt by the next migration
+        aggregates.drop_tables(conn)
+
+
+def transactions_user_date_index(conn):
+    # Serves per-user listing in (date, id) order and date range filters
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions(user_id, date, id)")
+
+
+def aggregate_tables(conn, progress=None):
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        aggregates.create_tables(conn)
+    # Rebuilt even if the tables already existed, so an interrupted run is
+    # completed on the next start. One user per chunk: writes that land
+    # meanwhile update the aggregates of users not yet rebuilt, and the
+    # rebuild then recomputes them from scratch.
+    user_ids = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM transactions ORDER BY user_id")]
+    backfill(conn, "aggregates", user_ids, lambda user_id: aggregates.rebuild(conn, user_id), progress)
+
+
+FTS_TRIGGERS = ("transactions_fts_insert", "transactions_fts_delete", "transactions_fts_update")
+# Row ids the index covers while fts_backfill exists
+FTS_GATE = "WHEN {row}.id <= (SELECT indexed_through FROM fts_backfill) OR {row}.id > (SELECT max_id FROM fts_backfill)"
+
+
+def transactions_fts(conn, progress=None):
+    # Contentless FTS5 index over description and category. The owner column
+    # holds "u<user_id>" so the per-user filter is applied inside the index.
+    # Deleting from a contentless table needs the old values, which the
+    # triggers have. Existing rows are indexed a range of ids per
+    # transaction; until that is done fts_backfill records how far it got,
+    # and the triggers skip rows between there and the last id at the start,
+    # which the backfill indexes with their current values when it reaches
+    # them. Each row is therefore indexed exactly once.
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+                description, category, owner, content='', tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        building = has_table(conn, "fts_backfill")
+        if not building and has_trigger(conn, "transactions_fts_insert"):
+            return
+        if not building:
+            conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')")
+            conn.execute("CREATE TABLE fts_backfill (indexed_through INTEGER NOT NULL, max_id INTEGER NOT NULL)")
+            conn.execute("INSERT INTO fts_backfill SELECT 0, COALESCE(MAX(id), 0) FROM transactions")
+            create_fts_triggers(conn, FTS_GATE)
+        indexed_through, max_id = conn.execute("SELECT indexed_through, max_id FROM fts_backfill").fetchone()
+
+    def index(bounds):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Resumes where this or another process stopped
+            if not has_table(conn, "fts_backfill"):
+                return
+            row = conn.execute("SELECT indexed_through FROM fts_backfill").fetchone()
+            if row[0] >= bounds[1]:
+                return
+            conn.execute('''
+                INSERT INTO transactions_fts (rowid, description, category, owner)
+                SELECT id, description, category, 'u' || user_id FROM transactions WHERE id > ? AND id <= ?
+            ''', (max(row[0], bounds[0]), bounds[1]))
+            conn.execute("UPDATE fts_backfill SET indexed_through = ?", (bounds[1],))
+
+    backfill(conn, "transactions_fts", id_chunks(conn, "transactions", indexed_through, max_id), index, progress)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not has_table(conn, "fts_backfill"):
+            return
+        for name in FTS_TRIGGERS:
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        create_fts_triggers(conn)
+        conn.execute("DROP TABLE fts_backfill")
+
+
+def create_fts_triggers(conn, gate=""):
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_insert AFTER INSERT ON transactions
+        {gate.format(row="new")} BEGIN
+            INSERT INTO transactions_fts (rowid, description, category, owner)
+            VALUES (new.id, new.description, new.category, 'u' || new.user_id);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_delete AFTER DELETE ON transactions
+        {gate.format(row="old")} BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category, owner)
+            VALUES ('delete', old.id, old.description, old.category, 'u' || old.user_id);
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS transactions_fts_update
+        AFTER UPDATE OF description, category, user_id ON transactions
+        {gate.format(row="old")} BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description, category, owner)
+            VALUES ('delete', old.id, old.description, old.category, 'u' || old.user_id);
+            INSERT INTO transactions_fts (rowid, description, category, owner)
+            VALUES (new.id, new.description, new.category, 'u' || new.user_id);
+        END
+    ''')
+
+
+def rebuild_fts(conn):
+    # One bulk insert is far cheaper than the per-row trigger, so bulk
+    # loaders may suspend the insert trigger and call this afterwards.
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('delete-all')")
+    conn.execute('''
+        INSERT INTO transactions_fts (rowid, description, category, owner)
+        SELECT id, description, category, 'u' || user_id FROM transactions
+    ''')
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+
+
+def create_jobs(conn):
+    # Background job queue (see jobs.py). dedupe_key is unique among queued
+    # jobs only, so a finished job does not block the next one of its kind.
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL DEFAULT '{}',
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_at REAL NOT NULL,
+            dedupe_key TEXT,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs(status, run_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(user_id, id)")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key) WHERE status = 'queued'"
+    )
+
+
+def create_recurring_transactions(conn):
+    # Rules posted by the post_recurring job; next_date is the first
+    # occurrence not yet posted, computed from start_date and posted
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS recurring_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            description TEXT,
+            amount_cents INTEGER NOT NULL,
+            category TEXT,
+            interval TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            next_date TEXT,
+            posted INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+    ''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_next_date ON recurring_transactions(next_date)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_recurring_user ON recurring_transactions(user_id, id)")
+
+
+def transaction_versions(conn, progress=None):
+    # Each row carries the user's data_version of its last write and deletes
+    # leave a tombstone, so clients can ask for changes since a version.
+    # Existing rows are stamped with a fresh version so that since=0 always
+    # covers them, one user per transaction: adding a column with a default
+    # is instant, and unstamped rows are the ones still at version 0.
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if not has_column(conn, "transactions", "version"):
+            conn.execute("ALTER TABLE transactions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS transaction_tombstones (
+                user_id INTEGER NOT NULL,
+                version INTEGER NOT NULL,
+                tx_id INTEGER NOT NULL,
+                PRIMARY KEY (user_id, version, tx_id)
+            ) WITHOUT ROWID
+        ''')
+
+    def stamp(user_id):
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            version = conn.execute(
+                "UPDATE users SET data_version = data_version + 1 WHERE id = ? RETURNING data_version", (user_id,)
+            ).fetchone()
+            if version is not None:
+                conn.execute(
+                    "UPDATE transactions SET version = ? WHERE user_id = ? AND version = 0", (version[0], user_id)
+                )
+
+    user_ids = [row[0] for row in conn.execute("SELECT DISTINCT user_id FROM transactions WHERE version = 0")]
+    backfill(conn, "transaction_versions", user_ids, stamp, progress)
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_version ON transactions(user_id, version)")
+
+
+def tombstone_retention(conn):
+    # Tombstones are pruned after TOMBSTONE_RETENTION_DAYS (jobs.py), and
+    # users.tombstones_pruned keeps the newest version pruned. Tombstones
+    # from before this migration have no time and are the first to go.
+    if not has_column(conn, "transaction_tombstones", "deleted_at"):
+        conn.execute("ALTER TABLE transaction_tombstones ADD COLUMN deleted_at REAL NOT NULL DEFAULT 0")
+    if not has_column(conn, "users", "tombstones_pruned"):
+        conn.execute("ALTER TABLE users ADD COLUMN tombstones_pruned INTEGER NOT NULL DEFAULT 0")
+
+
+MIGRATIONS = (
+    Migration(1, "create users", create_users, True, False),
+    Migration(2, "users token and data_version columns", users_token_columns, True, False),
+    Migration(3, "create transactions", create_transactions, True, False),
+    Migration(4, "transactions amount in integer cents", amount_cents, False, False),
+    Migration(5, "transactions (user_id, date, id) index", transactions_user_date_index, True, True),
+    Migration(6, "per-user aggregate tables", aggregate_tables, False, True),
+    Migration(7, "full-text index on description and category", transactions_fts, False, False),
+    Migration(8, "background job queue", create_jobs, True, True),
+    Migration(9, "recurring transaction rules", create_recurring_transactions, True, True),
+    Migration(10, "transaction versions and tombstones", transaction_versions, False, True),
+    Migration(11, "tombstone retention", tombstone_retention, True, False),
+)
+
+
+def has_column(conn, table, column):
+    return column in [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+
+def has_trigger(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone() is not None
+
+
+def id_chunks(conn, table, after=0, through=None, size=None):
+    """Split the ids in (after, through] into ranges of ``size`` rows.
+
+    Returns (after, last) pairs, each covering the ids greater than the
+    first and up to the second, in order. ``size`` defaults to
+    BACKFILL_ROWS and ``through`` to the largest id; rows inserted later
+    are the caller's to handle.
+    """
+    size = size or BACKFILL_ROWS
+    if through is None:
+        through = conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+    if through <= after:
+        return []
+    ends = [row[0] for row in conn.execute(f'''
+        SELECT id FROM (SELECT id, ROW_NUMBER() OVER (ORDER BY id) AS n FROM {table} WHERE id > ? AND id <= ?)
+        WHERE n % ? = 0
+    ''', (after, through, size))]
+    if not ends or ends[-1] != through:
+        ends.append(through)
+    return list(zip([after] + ends[:-1], ends))
+
+
+def log_progress(name, done, total):
+    logger.info("%s: %d/%d", name, done, total)
+
+
+def backfill(conn, name, items, apply, progress=None, chunk_size=1, pause=BACKFILL_PAUSE_SECONDS):
+    """Call ``apply`` for each item, ``chunk_size`` items per transaction.
+
+    The write lock is released between chunks, so a long backfill does not
+    block the API. ``apply`` may manage its own transaction when chunk_size
+    is 1; otherwise it runs inside one BEGIN IMMEDIATE per chunk.
+    """
+    progress = progress or log_progress
+    total = len(items)
+    for start in range(0, total, chunk_size):
+        chunk = items[start:start + chunk_size]
+        if chunk_size == 1:
+            apply(chunk[0])
+        else:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                for item in chunk:
+                    apply(item)
+        done = min(start + chunk_size, total)
+        if done == total or (done // chunk_size) % 50 == 0:
+            progress(name, done, total)
+        if pause:
+            time.sleep(pause)
+
+
+def ensure_version_table(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at REAL NOT NULL
+        )
+    ''')
+    conn.commit()
+
+
+def applied_versions(conn):
+    ensure_version_table(conn)
+    return {row[0] for row in conn.execute("SELECT version FROM schema_version")}
+
+
+def pending(conn):
+    applied = applied_versions(conn)
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def migrate(conn, progress=None):
+    """Apply pending migrations in order; returns the versions applied.
+
+    Safe to run from several processes at once: each transactional migration
+    re-checks its version under the write lock before applying.
+    """
+    applied = []
+    analyze = False
+    for migration in pending(conn):
+        start = time.perf_counter()
+        record = ("INSERT OR IGNORE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)",
+                  (migration.version, migration.name, time.time()))
+        if migration.transactional:
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (migration.version,)).fetchone():
+                    continue
+                migration.apply(conn)
+                conn.execute(*record)
+        else:
+            migration.apply(conn, progress)
+            with conn:
+                conn.execute(*record)
+        logger.info("Applied migration %d (%s) in %.2fs", migration.version, migration.name,
+                    time.perf_counter() - start)
+        applied.append(migration.version)
+        analyze = analyze or migration.analyze
+    if analyze:
+        # Give the planner statistics for the new indexes
+        conn.execute("ANALYZE")
+        conn.commit()
+    return applied
+
+
+if __name__ == "__main__":
+    import sys
+
+    from database import connection, database_paths
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command not in ("migrate", "status"):
+        print(__doc__.strip().splitlines()[-1].strip())
+        sys.exit(2)
+    for path in database_paths():
+        with connection(path=path) as conn:
+            if command == "status":
+                applied = applied_versions(conn)
+                print(path)
+                for m in MIGRATIONS:
+                    print(f"{m.version:>4}  {'applied' if m.version in applied else 'pending':<8} {m.name}")
+            else:
+                def print_progress(name, done, total):
+                    print(f"  {name}: {done}/{total}")
+                versions = migrate(conn, progress=print_progress)
+                print(f"{path}: applied {versions}" if versions else f"{path}: up to date")
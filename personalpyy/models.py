@@ -1,8 +1,25 @@
-from pydantic import BaseModel
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from pydantic import BaseModel, field_validator
 from typing import Optional
 
-from pydantic import BaseModel
-from typing import Optional
+# One trillion per transaction; keeps SUM over any realistic history well
+# inside SQLite's signed 64-bit INTEGER
+MAX_CENTS = 10**14
+
+def to_cents(amount):
+    # Amounts are stored as integer cents; str() keeps the decimal digits the
+    # client sent (1.1 -> "1.1", not 1.1000000000000000888)
+    try:
+        cents = int(Decimal(str(amount)).scaleb(2).to_integral_value(ROUND_HALF_UP))
+    except (InvalidOperation, OverflowError, ValueError):
+        raise ValueError("amount must be a finite number")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError("amount is out of range")
+    return cents
+
+def from_cents(cents):
+    return cents / 100
 
 class UserCreate(BaseModel):
     username: str
@@ -29,3 +46,62 @@ class TransactionCreate(BaseModel):
     description: Optional[str] = None
     amount: float
     category: Optional[str] = None
+
+    @field_validator("amount")
+    @classmethod
+    def check_amount(cls, value):
+        to_cents(value)
+        return value
+
+    @property
+    def amount_cents(self):
+        return to_cents(self.amount)
+
+    def stored(self, id, user_id):
+        # The Transaction as written, with the amount rounded to cents, so a
+        # write answers with what a later read returns
+        return Transaction(id=id, user_id=user_id, **dict(self.dict(), amount=from_cents(self.amount_cents)))
+
+class RecurringCreate(BaseModel):
+    description: Optional[str] = None
+    amount: float
+    category: Optional[str] = None
+    interval: str  # weekly, monthly or yearly
+    start_date: str  # ISO format: YYYY-MM-DD
+    end_date: Optional[str] = None
+
+    @field_validator("amount")
+    @classmethod
+    def check_amount(cls, value):
+        to_cents(value)
+        return value
+
+    @field_validator("interval")
+    @classmethod
+    def check_interval(cls, value):
+        if value not in ("weekly", "monthly", "yearly"):
+            raise ValueError("interval must be weekly, monthly or yearly")
+        return value
+
+    @field_validator("start_date", "end_date")
+    @classmethod
+    def check_date(cls, value):
+        if value is not None:
+            date.fromisoformat(value)
+        return value
+
+    @property
+    def amount_cents(self):
+        return to_cents(self.amount)
+
+class Recurring(BaseModel):
+    id: int
+    user_id: int
+    description: Optional[str] = None
+    amount: float
+    category: Optional[str] = None
+    interval: str
+    start_date: str
+    end_date: Optional[str] = None
+    next_date: Optional[str] = None  # None once the rule has ended
+    posted: int
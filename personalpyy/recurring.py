@@ -0,0 +1,122 @@
+"""Recurring transaction rules (rent, subscriptions).
+
+A rule's n-th occurrence is computed from its start date, so a monthly rule
+starting on the 31st posts on the last day of shorter months and returns to
+the 31st afterwards. The post_recurring job (see jobs.py) posts every
+occurrence up to today, catching up on any that were missed while the
+server was down.
+"""
+import calendar
+import datetime
+
+from database import connection, insert_transaction, shard_paths, sharded, write
+from models import TransactionCreate, from_cents
+
+RULE_COLUMNS = "id, user_id, description, amount_cents, category, interval, start_date, end_date, next_date, posted"
+
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(start, interval, n):
+    # Date of the n-th occurrence (0 is the start date itself)
+    if interval == "weekly":
+        return start + datetime.timedelta(weeks=n)
+    return add_months(start, n if interval == "monthly" else 12 * n)
+
+
+def next_date(start_date, end_date, interval, posted):
+    # ISO date of the next unposted occurrence, or None once past end_date
+    day = occurrence(datetime.date.fromisoformat(start_date), interval, posted).isoformat()
+    return None if end_date is not None and day > end_date else day
+
+
+def create_rule(conn, user_id, rule):
+    cursor = conn.execute(
+        '''
+        INSERT INTO recurring_transactions
+            (user_id, description, amount_cents, category, interval, start_date, end_date, next_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        (user_id, rule.description, rule.amount_cents, rule.category, rule.interval, rule.start_date,
+         rule.end_date, next_date(rule.start_date, rule.end_date, rule.interval, 0)),
+    )
+    return cursor.lastrowid
+
+
+def list_rules(conn, user_id):
+    return conn.execute(
+        f"SELECT {RULE_COLUMNS} FROM recurring_transactions WHERE user_id = ? ORDER BY id", (user_id,)
+    ).fetchall()
+
+
+def get_rule(conn, user_id, rule_id):
+    return conn.execute(
+        f"SELECT {RULE_COLUMNS} FROM recurring_transactions WHERE id = ? AND user_id = ?", (rule_id, user_id)
+    ).fetchone()
+
+
+def delete_rule(conn, user_id, rule_id):
+    # Transactions already posted by the rule are kept
+    return conn.execute(
+        "DELETE FROM recurring_transactions WHERE id = ? AND user_id = ?", (rule_id, user_id)
+    ).rowcount
+
+
+def rule_dict(row):
+    data = dict(row)
+    data["amount"] = from_cents(data.pop("amount_cents"))
+    return data
+
+
+def post_rule(conn, rule_id, today):
+    # Posts the rule's due occurrences and advances next_date in one
+    # transaction, so a retried or concurrent run never posts twice.
+    # Returns the number of transactions posted.
+    return write(conn, _post_rule, rule_id, today)
+
+
+def _post_rule(conn, rule_id, today):
+    rule = conn.execute(f"SELECT {RULE_COLUMNS} FROM recurring_transactions WHERE id = ?", (rule_id,)).fetchone()
+    if rule is None:
+        return 0
+    posted, day = rule["posted"], rule["next_date"]
+    while day is not None and day <= today:
+        tx = TransactionCreate(
+            date=day, description=rule["description"], amount=from_cents(rule["amount_cents"]),
+            category=rule["category"],
+        )
+        insert_transaction(conn, rule["user_id"], tx)
+        posted += 1
+        day = next_date(rule["start_date"], rule["end_date"], rule["interval"], posted)
+    conn.execute(
+        "UPDATE recurring_transactions SET posted = ?, next_date = ? WHERE id = ?", (posted, day, rule_id)
+    )
+    return posted - rule["posted"]
+
+
+def post_due(conn, user_id=None, payload=None, today=None):
+    """Job handler: post every due occurrence of every rule, on every shard."""
+    today = today or datetime.date.today().isoformat()
+    if not sharded():
+        # conn is the only database; checking out another would nest
+        return _post_due(conn, today)
+    rules = posted = 0
+    for path in shard_paths():
+        with connection(path=path) as shard:
+            result = _post_due(shard, today)
+        rules += result["rules"]
+        posted += result["posted"]
+    return {"rules": rules, "posted": posted}
+
+
+def _post_due(conn, today):
+    rule_ids = [
+        row[0] for row in conn.execute(
+            "SELECT id FROM recurring_transactions WHERE next_date <= ? ORDER BY id", (today,)
+        )
+    ]
+    return {"rules": len(rule_ids), "posted": sum(post_rule(conn, rule_id, today) for rule_id in rule_ids)}
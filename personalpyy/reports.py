@@ -0,0 +1,80 @@
+"""Monthly summary reports, generated by the background worker.
+
+The result is plain JSON: totals, per-category spending, the largest
+expenses and the month's running balance, plus Plotly figures already
+serialized with fig.to_json() so clients only have to render them.
+"""
+import calendar
+
+import aggregates
+from database import column_sql
+from models import from_cents
+
+TOP_EXPENSES = 5
+
+
+def month_bounds(month):
+    # "2024-02" -> ("2024-02-01", "2024-02-29"); raises ValueError on bad input
+    year, number = map(int, month.split("-"))
+    return f"{month}-01", f"{month}-{calendar.monthrange(year, number)[1]:02d}"
+
+
+def monthly_report(conn, user_id, payload):
+    """Job handler: build the report for payload["month"] (YYYY-MM)."""
+    month = payload["month"]
+    first, last = month_bounds(month)
+    totals = conn.execute('''
+        SELECT COUNT(*) AS count,
+               COALESCE(SUM(CASE WHEN amount_cents > 0 THEN amount_cents END), 0) AS income,
+               COALESCE(SUM(CASE WHEN amount_cents < 0 THEN amount_cents END), 0) AS spending
+        FROM transactions WHERE user_id = ? AND date BETWEEN ? AND ?
+    ''', (user_id, first, last)).fetchone()
+    categories = aggregates.category_totals(conn, user_id, month, month)
+    largest = conn.execute(f'''
+        SELECT id, date, description, {column_sql("amount")}, category FROM transactions
+        WHERE user_id = ? AND date BETWEEN ? AND ? AND amount_cents < 0
+        ORDER BY amount_cents, id LIMIT ?
+    ''', (user_id, first, last, TOP_EXPENSES)).fetchall()
+    # Running balance at the end of each day of the month with transactions,
+    # starting from the closing balance of the previous one
+    opening = conn.execute(
+        "SELECT COALESCE(SUM(net_cents), 0) FROM daily_balances WHERE user_id = ? AND date < ?", (user_id, first)
+    ).fetchone()[0]
+    balance, running = [], opening
+    for row in conn.execute(
+        "SELECT date, net_cents FROM daily_balances WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+        (user_id, first, last),
+    ):
+        running += row["net_cents"]
+        balance.append({"date": row["date"], "balance": from_cents(running)})
+    spending = [
+        {"category": c["category"] or "Uncategorized", "total": -c["total"]}
+        for c in categories if c["total"] < 0
+    ]
+    return {
+        "month": month,
+        "count": totals["count"],
+        "income": from_cents(totals["income"]),
+        "spending": from_cents(-totals["spending"]),
+        "net": from_cents(totals["income"] + totals["spending"]),
+        "opening_balance": from_cents(opening),
+        "closing_balance": from_cents(running),
+        "categories": categories,
+        "largest_expenses": [dict(row) for row in largest],
+        "balance": balance,
+        "charts": charts(month, spending, balance),
+    }
+
+
+def charts(month, spending, balance):
+    # Imported here: plotly is only needed by the worker, not at API startup
+    import plotly.express as px
+
+    figures = {}
+    if spending:
+        figures["spending_by_category"] = px.pie(
+            spending, names="category", values="total", title=f"Spending by Category, {month}"
+        ).to_json()
+    if balance:
+        figures["balance"] = px.line(balance, x="date", y="balance", title=f"Balance, {month}").to_json()
+    return figures
@@ -0,0 +1,41 @@
+import re
+
+from database import column_sql
+
+SEARCH_FIELDS = ("id", "user_id", "date", "description", "amount", "category")
+# bm25 column weights: description, category, owner (filter only)
+BM25_WEIGHTS = (2.0, 1.0, 0.0)
+
+# Words, optionally ending in * for a prefix match
+_TERM = re.compile(r"(\w+)(\*?)", re.UNICODE)
+
+
+def fts_query(q, user_id):
+    """Turn user input into an FTS5 MATCH expression, or None if it has no terms.
+
+    Every word must match (AND) in description or category; "star*" matches
+    words starting with "star". Words are quoted, so FTS5 operators and
+    syntax in the input are treated as plain text.
+    """
+    terms = [f'"{word}"{star}' for word, star in _TERM.findall(q)]
+    if not terms:
+        return None
+    return f'owner : "u{user_id}" AND {{description category}} : ({" AND ".join(terms)})'
+
+
+def search_query(user_id, match, limit, offset=0):
+    # Ranks inside the FTS index first, then joins only the page of hits.
+    # One extra row is fetched to tell whether another page follows.
+    weights = ", ".join(map(str, BM25_WEIGHTS))
+    columns = ", ".join(f"t.{column_sql(f)}" for f in SEARCH_FIELDS)
+    sql = f'''
+        SELECT {columns}
+        FROM (
+            SELECT rowid, bm25(transactions_fts, {weights}) AS rank
+            FROM transactions_fts WHERE transactions_fts MATCH ?
+            ORDER BY rank, rowid LIMIT ? OFFSET ?
+        ) AS hits
+        JOIN transactions t ON t.id = hits.rowid AND t.user_id = ?
+        ORDER BY hits.rank, t.id
+    '''
+    return sql, [match, limit + 1, offset, user_id]
@@ -0,0 +1,40 @@
+"""Run the API with several worker processes.
+
+Each uvicorn worker is a separate process with its own connection pools,
+token cache and job worker, sharing only the SQLite files. Schema
+migrations run once here, before any worker starts. Usage:
+
+    python serve.py [--workers N] [--host 127.0.0.1] [--port 8000]
+"""
+import argparse
+import os
+
+import uvicorn
+
+from settings import settings
+
+
+def main_():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=settings.web_concurrency)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    # Split the bcrypt pool between the workers instead of giving each one a
+    # pool sized for the whole machine. The workers parse their settings from
+    # the environment (already merged with .env), so overrides go there.
+    os.environ.setdefault("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2 // args.workers)))
+    # A new login only evicts the replaced token from the cache of the process
+    # that served it; a short TTL bounds how long the others still accept it
+    if args.workers > 1:
+        os.environ.setdefault("AUTH_CACHE_TTL_SECONDS", "30")
+
+    import database
+    database.init_db()
+    database.close_pool()
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main_()
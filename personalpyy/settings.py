@@ -0,0 +1,64 @@
+"""Configuration, parsed once from the environment and .env.
+
+Every module reads its settings from the shared ``settings`` object instead
+of calling os.getenv itself, so .env is loaded once per process and each
+variable is parsed in one place. Modules still copy the values they use
+into their own constants (DB_PATH, JOB_CONCURRENCY, ...), which tests and
+benchmarks may override.
+"""
+import os
+
+from dotenv import load_dotenv
+
+
+def _bool(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class Settings:
+    def __init__(self):
+        # Storage (database.py)
+        self.database_url = os.getenv("DATABASE_URL", "finance.db")
+        self.db_pool_size = int(os.getenv("DB_POOL_SIZE", "8"))
+        self.db_shards = int(os.getenv("DB_SHARDS", "1"))
+        self.db_mode = os.getenv("DB_MODE", "sync")
+        self.async_read_pool_size = int(os.getenv("ASYNC_READ_POOL_SIZE", "4"))
+        # API (main.py)
+        self.secret_key = os.getenv("SECRET_KEY", "supersecret")
+        self.max_changes = int(os.getenv("MAX_CHANGES", "5000"))
+        self.auth_cache_size = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+        self.auth_cache_ttl_seconds = int(os.getenv("AUTH_CACHE_TTL_SECONDS", "300"))
+        self.web_concurrency = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+        # Rate limiting and read coalescing (throttle.py)
+        self.rate_limit_per_second = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+        self.rate_limit_burst = int(os.getenv("RATE_LIMIT_BURST", "40"))
+        self.login_rate_limit_per_minute = float(os.getenv("LOGIN_RATE_LIMIT_PER_MINUTE", "30"))
+        self.login_rate_limit_burst = int(os.getenv("LOGIN_RATE_LIMIT_BURST", "10"))
+        self.coalesce_reads = _bool("COALESCE_READS", "1")
+        # Password hashing (hashing.py)
+        self.bcrypt_rounds = int(os.getenv("BCRYPT_ROUNDS", "12"))
+        self.bcrypt_workers = int(os.getenv("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        # DataFrames (analysis.py)
+        self.analysis_cache_size = int(os.getenv("ANALYSIS_CACHE_SIZE", "16"))
+        self.analysis_workers = int(os.getenv("ANALYSIS_WORKERS", "0"))
+        # Observability (metrics.py, logging_setup.py)
+        self.metrics_enabled = _bool("METRICS_ENABLED", "")
+        self.log_level = os.getenv("LOG_LEVEL", "INFO").upper()
+        self.log_debug_sample_rate = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+        # Background jobs (jobs.py)
+        self.jobs_enabled = _bool("JOBS_ENABLED", "1")
+        self.job_concurrency = int(os.getenv("JOB_CONCURRENCY", "2"))
+        self.job_poll_seconds = float(os.getenv("JOB_POLL_SECONDS", "5"))
+        self.job_max_attempts = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+        self.job_retry_base_seconds = float(os.getenv("JOB_RETRY_BASE_SECONDS", "2"))
+        self.job_lease_seconds = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+        self.job_retention_days = float(os.getenv("JOB_RETENTION_DAYS", "30"))
+        self.tombstone_retention_days = float(os.getenv("TOMBSTONE_RETENTION_DAYS", "30"))
+        self.recurring_interval_seconds = float(os.getenv("RECURRING_INTERVAL_SECONDS", "3600"))
+        # Dashboard (dashboard.py, api_client.py)
+        self.api_url = os.getenv("API_URL", "http://127.0.0.1:8000")
+
+
+# Variables already set in the environment win over .env
+load_dotenv()
+settings = Settings()
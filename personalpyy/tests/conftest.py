@@ -0,0 +1,50 @@
+import functools
+import itertools
+import os
+import sys
+import tempfile
+
+# Settings are read once at import, so the environment is set up before any
+# app module is imported
+os.environ["DATABASE_URL"] = os.path.join(tempfile.mkdtemp(), "test.db")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("BCRYPT_WORKERS", "0")
+os.environ.setdefault("JOBS_ENABLED", "0")
+os.environ.setdefault("RATE_LIMIT_PER_SECOND", "0")
+os.environ.setdefault("LOGIN_RATE_LIMIT_PER_MINUTE", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+from pool import ConnectionPool
+
+_usernames = itertools.count()
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def small_pool(monkeypatch):
+    # One connection per database, and a short wait, so a request that holds
+    # one connection while asking for another fails fast instead of hanging
+    monkeypatch.setattr(database, "DB_POOL_SIZE", 1)
+    monkeypatch.setattr(database, "ConnectionPool", functools.partial(ConnectionPool, timeout=2))
+    database.close_pool()
+    yield
+    database.close_pool()
+
+
+@pytest.fixture
+def auth(client):
+    username, password = f"user{next(_usernames)}", "secret"
+    client.post("/register", json={"username": username, "password": password}).raise_for_status()
+    resp = client.post("/token", data={"username": username, "password": password})
+    resp.raise_for_status()
+    return {"Authorization": f"Bearer {resp.json()['access_token']}"}
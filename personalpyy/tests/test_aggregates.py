@@ -0,0 +1,60 @@
+import aggregates
+import database
+
+
+def user_id_of(client, auth):
+    return client.get("/transactions/", params={"fields": "user_id"}, headers=auth).json()[0]["user_id"]
+
+
+def test_writes_keep_aggregates_consistent(client, auth):
+    add = {"date": "2024-01-10", "description": "Rent", "amount": -900, "category": "home"}
+    tx_id = client.post("/transactions/", json=add, headers=auth).json()["id"]
+    client.post("/transactions/", json=dict(add, date="2024-01-31", amount=0.1, category=None), headers=auth)
+    client.post("/transactions/", json=dict(add, date="2024-02-01", amount=0.2, category=None), headers=auth)
+    csv = "date,description,amount,category\n2024-01-10,Pay,2500.55,income\n2024-02-02,Pay,2500.55,income\n"
+    client.post("/transactions/bulk", params={"format": "csv"}, content=csv, headers=auth).raise_for_status()
+    # Moving a row to another month and category updates both sides
+    client.put(f"/transactions/{tx_id}", json=dict(add, date="2024-02-10", category="rent"), headers=auth)
+    deleted = client.post("/transactions/", json=dict(add, category="oops"), headers=auth).json()["id"]
+    client.delete(f"/transactions/{deleted}", headers=auth).raise_for_status()
+
+    with database.connection() as conn:
+        assert aggregates.check_consistency(conn) == []
+    by_month = client.get("/summary/categories", params={"by_month": "true"}, headers=auth).json()
+    assert [(row["month"], row["category"], row["total"], row["count"]) for row in by_month] == [
+        ("2024-01", None, 0.1, 1), ("2024-01", "income", 2500.55, 1),
+        ("2024-02", None, 0.2, 1), ("2024-02", "income", 2500.55, 1), ("2024-02", "rent", -900.0, 1),
+    ]
+    balance = client.get("/summary/balance", params={"bucket": "month"}, headers=auth).json()
+    # Exact in cents: 0.1 + 0.2 does not drift
+    assert balance == [{"date": "2024-01", "balance": 2500.65}, {"date": "2024-02", "balance": 4101.4}]
+
+
+def test_check_reports_drift_and_rebuild_repairs_it(client, auth):
+    client.post("/transactions/", json={"date": "2024-05-01", "amount": 5, "category": "gift"}, headers=auth)
+    user_id = user_id_of(client, auth)
+    with database.connection(user_id) as conn:
+        conn.execute("UPDATE daily_balances SET net_cents = net_cents + 1 WHERE user_id = ?", (user_id,))
+        conn.execute("DELETE FROM category_monthly_totals WHERE user_id = ?", (user_id,))
+        conn.commit()
+        assert sorted(aggregates.check_consistency(conn)) == [
+            f"category_monthly_totals ({user_id}, '2024-05', 'gift'): expected (500, 1), found (0, 0)",
+            f"daily_balances ({user_id}, '2024-05-01'): expected (500, 1), found (501, 1)",
+        ]
+        aggregates.rebuild(conn, user_id)
+        assert aggregates.check_consistency(conn) == []
+
+
+def test_removing_rows_deletes_empty_aggregates(client, auth):
+    client.post("/transactions/", json={"date": "2024-06-01", "amount": 1}, headers=auth)
+    user_id = user_id_of(client, auth)
+    with database.connection(user_id) as conn:
+        aggregates.apply_rows(conn, user_id, [("2024-07-01", 250, "x"), ("2024-07-01", -50, None)])
+        aggregates.apply_rows(conn, user_id, [("2024-07-01", 250, "x"), ("2024-07-01", -50, None)], sign=-1)
+        months = conn.execute(
+            "SELECT month FROM category_monthly_totals WHERE user_id = ?", (user_id,)
+        ).fetchall()
+        days = conn.execute("SELECT date FROM daily_balances WHERE user_id = ?", (user_id,)).fetchall()
+        conn.rollback()
+    assert [row[0] for row in months] == ["2024-06"]
+    assert [row[0] for row in days] == ["2024-06-01"]
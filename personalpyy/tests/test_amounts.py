@@ -0,0 +1,30 @@
+import pytest
+
+from models import MAX_CENTS, from_cents, to_cents
+
+
+@pytest.mark.parametrize("amount, cents", [(1.005, 101), (1.1, 110), (-2.675, -268), (0.1 + 0.2, 30), (12, 1200)])
+def test_to_cents_rounds_half_up(amount, cents):
+    assert to_cents(amount) == cents
+    assert from_cents(cents) == cents / 100
+
+
+def test_write_responses_match_stored_amount(client, auth):
+    tx = {"date": "2024-06-01", "description": "rounding", "amount": 1.005, "category": "food"}
+    created = client.post("/transactions/", json=tx, headers=auth).json()
+    assert created["amount"] == 1.01
+    updated = client.put(f"/transactions/{created['id']}", json=dict(tx, amount=2.675), headers=auth).json()
+    assert updated["amount"] == 2.68
+    listed = client.get("/transactions/", headers=auth).json()
+    assert [row["amount"] for row in listed if row["id"] == created["id"]] == [2.68]
+
+
+@pytest.mark.parametrize("amount", [float("nan"), float("inf"), "abc", MAX_CENTS / 100 + 0.01])
+def test_to_cents_rejects_non_finite_and_out_of_range(amount):
+    with pytest.raises(ValueError):
+        to_cents(amount)
+
+
+def test_out_of_range_amount_is_rejected(client, auth):
+    tx = {"date": "2024-06-01", "amount": 1e300}
+    assert client.post("/transactions/", json=tx, headers=auth).status_code == 422
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+import analysis
+
+ROWS = [
+    ("2024-01-05", "Rent", -900, "home"),
+    ("2024-01-02", "Salary", 2500.5, "income"),
+    ("2024-02-01", "Lunch", -12.25, None),
+    ("2024-02-03", "Groceries", -40.1, "home"),
+]
+
+
+@pytest.fixture
+def user_id(client, auth):
+    for date, description, amount, category in ROWS:
+        tx = {"date": date, "description": description, "amount": amount, "category": category}
+        client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+    return client.get("/transactions/", params={"fields": "user_id"}, headers=auth).json()[0]["user_id"]
+
+
+def test_load_transactions_types_columns(user_id, monkeypatch):
+    # Chunks of two rows, so category codes have to carry across chunks
+    monkeypatch.setattr(analysis, "LOAD_BATCH_SIZE", 2)
+    analysis.clear_frame_cache()
+    df = analysis.load_transactions(user_id, columns=("date", "description", "amount", "amount_cents", "category"))
+    assert df["date"].dtype == np.dtype("datetime64[s]")
+    assert (df["amount"].dtype, df["amount_cents"].dtype) == (np.float64, np.int64)
+    assert list(df["description"]) == ["Salary", "Rent", "Lunch", "Groceries"]
+    assert list(df["amount_cents"]) == [250050, -90000, -1225, -4010]
+    assert list(df["category"].astype(object).fillna("-")) == ["income", "home", "-", "home"]
+    assert list(df["category"].cat.categories) == ["income", "home"]
+
+
+def test_load_transactions_window_and_unknown_columns(user_id):
+    df = analysis.load_transactions(user_id, date_from="2024-02-01", date_to="2024-02-02", columns=("id", "amount"))
+    assert list(df.columns) == ["id", "amount"]
+    assert list(df["amount"]) == [-12.25]
+    empty = analysis.load_transactions(user_id, date_from="2030-01-01", columns=("date", "amount", "category"))
+    assert len(empty) == 0 and empty["amount"].dtype == np.float64
+    with pytest.raises(ValueError):
+        analysis.load_transactions(user_id, columns=("id", "password_hash"))
+
+
+def test_frame_cache_follows_data_version(client, auth, user_id):
+    analysis.clear_frame_cache()
+    first = analysis.load_transactions(user_id)
+    assert len(analysis._frame_cache) == 1
+    # A copy is returned, so callers cannot alter the cached frame
+    first.drop(first.index, inplace=True)
+    assert len(analysis.load_transactions(user_id)) == 4
+    assert len(analysis._frame_cache) == 1
+    tx = {"date": "2024-03-01", "description": "Cinema", "amount": -9, "category": "fun"}
+    client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+    assert len(analysis.load_transactions(user_id)) == 5
+    assert len(analysis._frame_cache) == 2
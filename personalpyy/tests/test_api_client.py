@@ -0,0 +1,59 @@
+import pytest
+import streamlit as st
+
+import api_client
+
+
+@pytest.fixture
+def api(client, monkeypatch):
+    # Points the dashboard client at the in-process app and records statuses
+    statuses = []
+
+    class Session:
+        def get(self, url, **kwargs):
+            resp = client.get(url, **kwargs)
+            statuses.append(resp.status_code)
+            return resp
+
+    monkeypatch.setattr(api_client, "API_URL", "")
+    monkeypatch.setattr(api_client, "get_session", Session)
+    st.session_state.clear()
+    yield statuses
+    st.session_state.clear()
+
+
+def test_repeat_get_is_not_modified(api, client, auth):
+    token = auth["Authorization"].split()[1]
+    client.post("/transactions/", json={"date": "2024-03-01", "amount": 4, "category": "food"}, headers=auth)
+    first = api_client.cached_get("/summary/categories", token)
+    second = api_client.cached_get("/summary/categories", token)
+    assert api == [200, 304]
+    assert first == second
+    assert first[1][0]["category"] == "food"
+
+
+def test_get_after_eviction(api, client, auth, monkeypatch):
+    monkeypatch.setattr(api_client, "MAX_CACHED_RESPONSES", 1)
+    token = auth["Authorization"].split()[1]
+    client.post("/transactions/", json={"date": "2024-03-01", "amount": 4, "category": "food"}, headers=auth)
+    api_client.cached_get("/summary/categories", token)
+    api_client.cached_get("/summary/balance", token)
+    status, data, error = api_client.cached_get("/summary/categories", token)
+    assert (status, error) == (200, None)
+    assert data[0]["category"] == "food"
+    assert api == [200, 200, 200]
+
+
+def test_synced_transactions_revalidates_unchanged_delta(api, client, auth):
+    token = auth["Authorization"].split()[1]
+    client.post("/transactions/", json={"date": "2024-03-01", "amount": 4, "category": "food"}, headers=auth)
+    for _ in range(3):
+        status, df, error = api_client.synced_transactions(token, "id,date,amount,category")
+    assert (status, error, len(df)) == (200, None, 1)
+    # Export, first delta since its version, then the same request revalidated
+    assert api == [200, 200, 304]
+    client.post("/transactions/", json={"date": "2024-03-02", "amount": 5, "category": "fun"}, headers=auth)
+    for _ in range(3):
+        status, df, error = api_client.synced_transactions(token, "id,date,amount,category")
+    assert len(df) == 2
+    assert api[3:] == [200, 200, 304]
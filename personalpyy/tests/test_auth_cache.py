@@ -0,0 +1,12 @@
+import main
+import metrics
+
+
+def test_cache_counters_are_only_in_metrics(client, auth):
+    # The first use of a token fills the cache, the second is a hit
+    client.get("/transactions/", headers=auth).raise_for_status()
+    hits = main.token_cache.stats()["hits"]
+    client.get("/transactions/", headers=auth).raise_for_status()
+    assert main.token_cache.stats()["hits"] == hits + 1
+    assert client.get("/auth/cache/stats", headers=auth).status_code == 404
+    assert f"auth_cache_hits_total {hits + 1}\n" in metrics.render()
@@ -0,0 +1,42 @@
+import database
+import jobs
+import main
+
+
+def add(client, auth, count):
+    ids = []
+    for day in range(1, count + 1):
+        tx = {"date": f"2024-04-{day:02d}", "description": "x", "amount": day, "category": "food"}
+        ids.append(client.post("/transactions/", json=tx, headers=auth).json()["id"])
+    return ids
+
+
+def changes(client, auth, since):
+    resp = client.get("/transactions/changes", params={"since": since}, headers=auth)
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_deletes_count_towards_max_changes(client, auth, monkeypatch):
+    ids = add(client, auth, 3)
+    version = changes(client, auth, 0)["version"]
+    for tx_id in ids:
+        client.delete(f"/transactions/{tx_id}", headers=auth).raise_for_status()
+    monkeypatch.setattr(main, "MAX_CHANGES", 2)
+    assert changes(client, auth, version)["full"] is True
+    monkeypatch.setattr(main, "MAX_CHANGES", 3)
+    body = changes(client, auth, version)
+    assert body["full"] is False
+    assert sorted(body["deleted"]) == sorted(ids)
+
+
+def test_pruned_tombstones_force_full_reload(client, auth, monkeypatch):
+    ids = add(client, auth, 2)
+    before_delete = changes(client, auth, 0)["version"]
+    client.delete(f"/transactions/{ids[0]}", headers=auth).raise_for_status()
+    after_delete = changes(client, auth, 0)["version"]
+    monkeypatch.setattr(jobs, "TOMBSTONE_RETENTION_DAYS", -1)
+    with database.connection() as conn:
+        assert jobs.prune_tombstones(conn)["pruned"] >= 1
+    assert changes(client, auth, before_delete)["full"] is True
+    assert changes(client, auth, after_delete) == {"version": after_delete, "full": False, "upserts": [], "deleted": []}
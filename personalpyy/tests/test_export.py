@@ -0,0 +1,24 @@
+import csv
+import io
+
+
+def add_transactions(client, auth, count):
+    for day in range(1, count + 1):
+        tx = {"date": f"2024-01-{day:02d}", "description": f"tx{day}", "amount": day, "category": "food"}
+        client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+
+
+def test_export_with_one_connection(small_pool, client, auth):
+    add_transactions(client, auth, 3)
+    resp = client.get("/transactions/export", params={"format": "csv"}, headers=auth)
+    assert resp.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(resp.text)))
+    assert [row["description"] for row in rows] == ["tx1", "tx2", "tx3"]
+
+
+def test_export_releases_connection(small_pool, client, auth):
+    add_transactions(client, auth, 1)
+    for _ in range(3):
+        resp = client.get("/transactions/export", headers=auth)
+        assert resp.status_code == 200
+        assert resp.text.count("\n") == 1
@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+import async_db
+import database
+
+CSV = "date,description,amount,category\n2024-02-01,Coffee,3.50,food\n2024-02-02,Books,12,fun\n2024-02-03,Bad,lots,x\n"
+
+
+def test_bulk_import_with_one_connection(small_pool, client, auth):
+    resp = client.post("/transactions/bulk", params={"format": "csv"}, content=CSV, headers=auth)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert (body["received"], body["inserted"], len(body["errors"])) == (3, 2, 1)
+    rows = client.get("/transactions/", headers=auth).json()
+    assert sorted(row["description"] for row in rows) == ["Books", "Coffee"]
+
+
+def test_bulk_import_goes_through_async_writer(client, auth, monkeypatch):
+    # DB_MODE=async installs the writer's thread-safe submit as write_through;
+    # the import then commits in one writer batch instead of on the pool
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    async def start_writer():
+        writer = async_db.WriteQueue(database.DB_PATH)
+        await writer.start()
+        return writer
+
+    writer = asyncio.run_coroutine_threadsafe(start_writer(), loop).result()
+    monkeypatch.setattr(database, "write_through", writer.submit_threadsafe)
+    try:
+        resp = client.post("/transactions/bulk", params={"format": "csv"}, content=CSV, headers=auth)
+    finally:
+        asyncio.run_coroutine_threadsafe(writer.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    assert resp.json()["inserted"] == 2
+    assert (writer.batches, writer.writes) == (1, 1)
+    assert len(client.get("/transactions/", headers=auth).json()) == 2
+
+
+def test_dedupe_skips_stored_rows_only(client, auth):
+    same_day = "date,description,amount\n2024-03-01,Coffee,3.50\n2024-03-01,Coffee,3.50\n"
+    resp = client.post("/transactions/bulk", params={"format": "csv", "dedupe": "true"}, content=same_day, headers=auth)
+    assert (resp.json()["inserted"], resp.json()["duplicates"]) == (2, [])
+    resp = client.post("/transactions/bulk", params={"format": "csv", "dedupe": "true"}, content=same_day, headers=auth)
+    assert (resp.json()["inserted"], len(resp.json()["duplicates"])) == (0, 2)
@@ -0,0 +1,60 @@
+import datetime
+
+import database
+import jobs
+import recurring
+
+
+def test_monthly_rule_keeps_its_day_of_month():
+    start = datetime.date(2024, 1, 31)
+    days = [recurring.occurrence(start, "monthly", n).isoformat() for n in range(4)]
+    assert days == ["2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30"]
+    assert recurring.occurrence(datetime.date(2024, 2, 29), "yearly", 1) == datetime.date(2025, 2, 28)
+    assert recurring.next_date("2024-01-01", "2024-01-14", "weekly", 1) == "2024-01-08"
+    assert recurring.next_date("2024-01-01", "2024-01-14", "weekly", 2) is None
+
+
+def test_enqueue_dedupes_queued_jobs(client):
+    with database.connection() as conn:
+        first = jobs.enqueue(conn, "purge_jobs", run_at=2e9, dedupe_key="test-dedupe")
+        again = jobs.enqueue(conn, "purge_jobs", run_at=1.5e9, dedupe_key="test-dedupe")
+        run_at = conn.execute("SELECT run_at FROM jobs WHERE id = ?", (first,)).fetchone()[0]
+        conn.execute("DELETE FROM jobs WHERE id = ?", (first,))
+        conn.commit()
+    assert (again, run_at) == (first, 1.5e9)
+
+
+def run_due_jobs():
+    while jobs.run_next() is not None:
+        pass
+
+
+def test_post_recurring_catches_up_once(client, auth):
+    start = (datetime.date.today() - datetime.timedelta(weeks=2)).isoformat()
+    rule = {"description": "Gym", "amount": -20, "category": "health", "interval": "weekly", "start_date": start}
+    resp = client.post("/recurring", json=rule, headers=auth)
+    assert resp.status_code == 201
+    run_due_jobs()
+    posted = [tx for tx in client.get("/transactions/", headers=auth).json() if tx["description"] == "Gym"]
+    assert [tx["amount"] for tx in posted] == [-20, -20, -20]
+    # A second run finds nothing due
+    with database.connection() as conn:
+        jobs.enqueue(conn, "post_recurring", dedupe_key="post_recurring")
+        conn.commit()
+    run_due_jobs()
+    [stored] = client.get("/recurring", headers=auth).json()
+    assert stored["posted"] == 3
+    assert len([tx for tx in client.get("/transactions/", headers=auth).json() if tx["description"] == "Gym"]) == 3
+
+
+def test_unknown_job_kind_fails_without_retry(client):
+    with database.connection() as conn:
+        job_id = jobs.enqueue(conn, "no_such_kind")
+        conn.commit()
+    run_due_jobs()
+    with database.connection() as conn:
+        status, attempts, error = conn.execute(
+            "SELECT status, attempts, error FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+    assert (status, attempts) == ("failed", 1)
+    assert "unknown job kind 'no_such_kind'" in error
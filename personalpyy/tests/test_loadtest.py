@@ -0,0 +1,45 @@
+import random
+
+import aggregates
+import database
+from benchmarks import datagen, loadtest
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert [loadtest.percentile(values, q) for q in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert loadtest.percentile([7], 99) == 7
+    assert loadtest.percentile([], 50) is None
+
+
+def test_compare_flags_regressions_beyond_threshold():
+    baseline = {"operations": {
+        "GET /a": {"throughput": 100.0, "p95_ms": 10.0},
+        "GET /b": {"throughput": 100.0, "p95_ms": 10.0},
+        "GET /gone": {"throughput": 100.0, "p95_ms": 10.0},
+    }}
+    report = {"operations": {
+        "GET /a": {"throughput": 85.0, "p95_ms": 11.5},
+        "GET /b": {"throughput": 70.0, "p95_ms": 13.0},
+    }}
+    assert loadtest.compare(report, baseline, 0.2) == [
+        "GET /b: throughput 100.0 -> 70.0/s", "GET /b: p95 10.0 -> 13.0 ms",
+    ]
+
+
+def test_generated_rows_are_deterministic():
+    first = list(datagen.generate_rows(1, 200, random.Random(3)))
+    assert first == list(datagen.generate_rows(1, 200, random.Random(3)))
+    assert all("2023-01-02" <= date <= "2024-12-31" for _, date, _, _, _ in first)
+    assert all(isinstance(cents, int) for _, _, _, cents, _ in first)
+
+
+def test_generate_writes_users_rows_and_aggregates(client):
+    with database.connection() as conn:
+        user_ids = datagen.generate(conn, 2, 50, seed=1, password_hash="unused")
+        assert aggregates.check_consistency(conn) == []
+        counts = conn.execute(
+            "SELECT user_id, COUNT(*), MAX(version) FROM transactions WHERE user_id IN (?, ?) GROUP BY user_id",
+            user_ids,
+        ).fetchall()
+    assert [tuple(row) for row in counts] == [(user_ids[0], 50, 1), (user_ids[1], 50, 1)]
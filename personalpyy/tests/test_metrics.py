@@ -0,0 +1,46 @@
+import sqlite3
+
+import metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram("op_seconds", "Op time", ("op",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(("read",), value)
+    assert histogram.render()[2:] == [
+        'op_seconds_bucket{op="read",le="0.1"} 2',
+        'op_seconds_bucket{op="read",le="1.0"} 3',
+        'op_seconds_bucket{op="read",le="+Inf"} 4',
+        'op_seconds_sum{op="read"} 2.65',
+        'op_seconds_count{op="read"} 4',
+    ]
+
+
+def test_label_values_are_escaped():
+    assert metrics._labels(("route",), ('/a"b\\c',)) == 'route="/a\\"b\\\\c"'
+
+
+def test_statement_label():
+    assert metrics.statement_label("select id FROM transactions WHERE user_id = ?") == "SELECT transactions"
+    assert metrics.statement_label("  INSERT INTO jobs (kind) VALUES (?)") == "INSERT jobs"
+    assert metrics.statement_label("BEGIN IMMEDIATE") == "BEGIN"
+
+
+def test_timed_connection_observes_statements(monkeypatch):
+    histogram = metrics.Histogram("sql_seconds", "SQL time", ("statement",))
+    monkeypatch.setattr(metrics, "SQL_SECONDS", histogram)
+    conn = metrics.TimedConnection(sqlite3.connect(":memory:"))
+    conn.execute("CREATE TABLE t (x)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(1,), (2,)])
+    assert conn.execute("SELECT SUM(x) FROM t").fetchone() == (3,)
+    conn.close()
+    assert sorted(histogram._series) == [("CREATE t",), ("INSERT t",), ("SELECT t",)]
+
+
+def test_render_includes_collectors(monkeypatch):
+    monkeypatch.setattr(metrics, "_collectors", [])
+    monkeypatch.setattr(metrics, "HISTOGRAMS", ())
+    metrics.register_collector(lambda: [("pool_in_use", "gauge", "Busy connections", [({"pool": "main"}, 2), ({}, 3)])])
+    assert metrics.render() == (
+        "# HELP pool_in_use Busy connections\n# TYPE pool_in_use gauge\npool_in_use{pool=\"main\"} 2\npool_in_use 3\n"
+    )
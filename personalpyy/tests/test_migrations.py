@@ -0,0 +1,106 @@
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import migrations
+
+OLD_SCHEMA = """
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password_hash TEXT NOT NULL,
+                    token TEXT, token_created_at REAL, data_version INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, date TEXT NOT NULL,
+                           description TEXT, amount REAL NOT NULL, category TEXT,
+                           FOREIGN KEY(user_id) REFERENCES users(id));
+INSERT INTO users (username, password_hash) VALUES ('a', 'x'), ('b', 'x');
+"""
+
+
+@pytest.fixture
+def old_db(tmp_path, monkeypatch):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.executescript(OLD_SCHEMA)
+    conn.executemany(
+        "INSERT INTO transactions (user_id, date, description, amount, category) VALUES (?, ?, ?, ?, 'food')",
+        [(1 + i % 2, f"2024-01-{i % 28 + 1:02d}", f"coffee {i}", 0.1 * i) for i in range(1, 21)],
+    )
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(migrations, "BACKFILL_ROWS", 3)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    yield path, conn
+    conn.close()
+
+
+def on_pause(monkeypatch, callback):
+    # backfill() sleeps between chunks; run callback there instead
+    monkeypatch.setattr(migrations, "time", SimpleNamespace(sleep=callback, time=time.time,
+                                                            perf_counter=time.perf_counter))
+
+
+def fts_ids(conn, word):
+    return sorted(row[0] for row in conn.execute(
+        "SELECT rowid FROM transactions_fts WHERE transactions_fts MATCH ?", (word,)))
+
+
+def test_chunked_migrations_keep_concurrent_writes(old_db, monkeypatch):
+    path, conn = old_db
+    writer = sqlite3.connect(path, isolation_level=None)
+    done = set()
+
+    def write_between_chunks(seconds):
+        # Once while amount_cents is copying, once while the index is built
+        if migrations.has_table(writer, "transactions_cents") and "cents" not in done:
+            done.add("cents")
+            writer.execute("UPDATE transactions SET description = 'tea', amount = 2 WHERE id = 20")
+            writer.execute("DELETE FROM transactions WHERE id = 19")
+            writer.execute("INSERT INTO transactions (user_id, date, description, amount, category) "
+                           "VALUES (1, '2024-02-01', 'late coffee', 3, 'food')")
+        if migrations.has_table(writer, "fts_backfill") and "fts" not in done:
+            done.add("fts")
+            writer.execute("UPDATE transactions SET description = 'juice' WHERE id = 18")
+            writer.execute("UPDATE transactions SET description = 'soda' WHERE id = 2")
+            writer.execute("DELETE FROM transactions WHERE id = 17")
+
+    on_pause(monkeypatch, write_between_chunks)
+    migrations.migrate(conn)
+    writer.close()
+
+    rows = {row["id"]: row for row in conn.execute("SELECT * FROM transactions")}
+    assert set(rows) == set(range(1, 17)) | {18, 20, 21}
+    assert rows[20]["amount_cents"] == 200 and rows[20]["description"] == "tea"
+    assert rows[21]["amount_cents"] == 300
+    assert rows[5]["amount_cents"] == 50
+    assert all(row["version"] > 0 for row in rows.values())
+    assert fts_ids(conn, "coffee") == sorted(tx_id for tx_id, row in rows.items() if "coffee" in row["description"])
+    assert (fts_ids(conn, "juice"), fts_ids(conn, "soda"), fts_ids(conn, "tea")) == ([18], [2], [20])
+    # The delete trigger is back to covering every row
+    conn.execute("DELETE FROM transactions WHERE id = 18")
+    assert fts_ids(conn, "juice") == []
+    assert done == {"cents", "fts"}
+    assert not migrations.has_table(conn, "transactions_cents")
+    assert not migrations.has_table(conn, "fts_backfill")
+
+
+class Interrupted(Exception):
+    pass
+
+
+def test_interrupted_fts_backfill_resumes(old_db, monkeypatch):
+    path, conn = old_db
+
+    def stop_during_fts(seconds):
+        if migrations.has_table(conn, "fts_backfill"):
+            raise Interrupted
+
+    on_pause(monkeypatch, stop_during_fts)
+    with pytest.raises(Interrupted):
+        migrations.migrate(conn)
+    assert conn.execute("SELECT indexed_through FROM fts_backfill").fetchone()[0] == 3
+    conn.execute("INSERT INTO transactions (user_id, date, description, amount_cents, category) "
+                 "VALUES (2, '2024-02-01', 'coffee beans', 900, 'food')")
+    on_pause(monkeypatch, lambda seconds: None)
+    assert migrations.migrate(conn)[0] == 7
+    assert fts_ids(conn, "coffee") == list(range(1, 22))
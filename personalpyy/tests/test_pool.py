@@ -0,0 +1,18 @@
+import datetime
+
+import jobs
+
+
+def test_register_with_one_connection(small_pool, client, auth):
+    resp = client.get("/transactions/", headers=auth)
+    assert resp.status_code == 200
+
+
+def test_recurring_job_with_one_connection(small_pool, client, auth):
+    today = datetime.date.today().isoformat()
+    rule = {"description": "Rent", "amount": -500, "category": "housing", "start_date": today, "interval": "monthly"}
+    client.post("/recurring", json=rule, headers=auth).raise_for_status()
+    while jobs.run_next() is not None:
+        pass
+    rows = client.get("/transactions/", headers=auth).json()
+    assert [row["description"] for row in rows] == ["Rent"]
@@ -0,0 +1,46 @@
+import pytest
+
+from search import fts_query
+
+
+@pytest.mark.parametrize("q, terms", [
+    ("coffee", '"coffee"'),
+    ("Coffee  shop", '"Coffee" AND "shop"'),
+    ("star*", '"star"*'),
+    ('"a" OR b NEAR(c)', '"a" AND "OR" AND "b" AND "NEAR" AND "c"'),
+    ("café-au-lait", '"café" AND "au" AND "lait"'),
+])
+def test_fts_query_quotes_every_word(q, terms):
+    assert fts_query(q, 7) == f'owner : "u7" AND {{description category}} : ({terms})'
+
+
+@pytest.mark.parametrize("q", ["", "   ", '"*"', "- ( ) :"])
+def test_fts_query_without_words(q):
+    assert fts_query(q, 7) is None
+
+
+def test_search_matches_words_and_prefixes(client, auth):
+    for description, category in [("Corner coffee shop", "food"), ("Coffee beans", "groceries"), ("Train", "travel")]:
+        tx = {"date": "2024-03-01", "description": description, "amount": -3, "category": category}
+        client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+
+    def search(q):
+        resp = client.get("/transactions/search", params={"q": q}, headers=auth)
+        resp.raise_for_status()
+        return sorted(row["description"] for row in resp.json())
+
+    assert search("coffee") == ["Coffee beans", "Corner coffee shop"]
+    assert search("coffee shop") == ["Corner coffee shop"]
+    assert search("groc*") == ["Coffee beans"]
+    assert search('coffee OR "train') == []
+    assert client.get("/transactions/search", params={"q": "***"}, headers=auth).status_code == 400
+
+
+def test_search_is_per_user(client, auth):
+    tx = {"date": "2024-03-01", "description": "Private invoice", "amount": 10, "category": "work"}
+    client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+    other = {"username": "search-other", "password": "secret"}
+    client.post("/register", json=other).raise_for_status()
+    token = client.post("/token", data=other).json()["access_token"]
+    resp = client.get("/transactions/search", params={"q": "invoice"}, headers={"Authorization": f"Bearer {token}"})
+    assert resp.json() == []
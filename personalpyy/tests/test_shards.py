@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+import database
+from models import TransactionCreate
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_PATH", str(tmp_path / "finance.db"))
+    monkeypatch.setattr(database, "DB_SHARDS", 3)
+    database.close_pool()
+    database.init_db()
+    yield
+    database.close_pool()
+
+
+def test_users_are_routed_by_id(shards):
+    root = os.path.dirname(database.DB_PATH)
+    assert database.shard_paths() == [os.path.join(root, f"finance.shard{i}.db") for i in range(3)]
+    assert [database.shard_for(user_id) for user_id in (3, 4, 8)] == [
+        database.shard_paths()[0], database.shard_paths()[1], database.shard_paths()[2],
+    ]
+    assert database.database_paths() == [database.DB_PATH] + database.shard_paths()
+
+
+def test_shards_hand_out_disjoint_ids(shards):
+    tx = TransactionCreate(date="2024-01-01", description="x", amount=1)
+    ids = {}
+    for user_id in (3, 4, 5):
+        database.add_user_to_shard(user_id, f"shard-user{user_id}")
+        with database.connection(user_id) as conn:
+            ids[user_id] = database.insert_transaction(conn, user_id, tx)
+            conn.commit()
+    assert ids == {3: 1, 4: (1 << database.SHARD_ID_BITS) + 1, 5: (2 << database.SHARD_ID_BITS) + 1}
+    # Ids are reserved only while empty, so restarting keeps them going
+    database.init_db()
+    with database.connection(4) as conn:
+        assert database.insert_transaction(conn, 4, tx) == ids[4] + 1
+        conn.rollback()
+
+
+def test_shard_count_cannot_change(shards, monkeypatch):
+    monkeypatch.setattr(database, "DB_SHARDS", 4)
+    with pytest.raises(RuntimeError, match="created with DB_SHARDS=3, not 4"):
+        database.init_db()
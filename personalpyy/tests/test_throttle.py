@@ -0,0 +1,109 @@
+import asyncio
+
+import main
+import metrics
+import throttle
+
+
+def limit(monkeypatch, limiter, rate, burst):
+    monkeypatch.setattr(limiter, "rate", rate)
+    monkeypatch.setattr(limiter, "burst", burst)
+    limiter.clear()
+
+
+def test_login_limit_ignores_authorization_header(client, monkeypatch):
+    limit(monkeypatch, main.login_limiter, 1 / 60, 2)
+    form = {"username": "nobody", "password": "wrong"}
+    statuses = [client.post("/token", data=form, headers={"Authorization": "Bearer x"}).status_code
+                for _ in range(3)]
+    assert statuses == [400, 400, 429]
+    assert client.post("/token", data=form).status_code == 429
+
+
+def test_unknown_tokens_share_a_bucket(client, auth, monkeypatch):
+    assert client.get("/transactions/", headers=auth).status_code == 200
+    limit(monkeypatch, main.rate_limiter, 0.01, 3)
+    statuses = [client.get("/transactions/", headers={"Authorization": f"Bearer made-up-{i}"}).status_code
+                for i in range(4)]
+    assert statuses == [401, 401, 401, 429]
+    assert main.rate_limiter.stats()["buckets"] == 1
+    # A cached token keeps its own bucket
+    assert client.get("/transactions/", headers=auth).status_code == 200
+
+
+def test_single_flight_join_finish_forget():
+    async def scenario():
+        flights = throttle.SingleFlight()
+        first, leader = flights.join(("t1", "/a"))
+        second, follower_leads = flights.join(("t1", "/a"))
+        assert (leader, follower_leads, second is first) == (True, False, True)
+        other, _ = flights.join(("t2", "/a"))
+        flights.forget("t1")
+        # A read after the write starts its own flight; the detached one still finishes
+        third, leader = flights.join(("t1", "/a"))
+        assert leader and third is not first
+        flights.finish(("t1", "/a"), first, "old")
+        assert (await second, flights.stats()) == ("old", {"leaders": 3, "coalesced": 1, "in_flight": 2})
+        flights.finish(("t1", "/a"), third, "new")
+        flights.finish(("t2", "/a"), other, None)
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def request(path, method="GET", token="t1"):
+    return {
+        "type": "http", "method": method, "path": path, "query_string": b"",
+        "headers": [(b"authorization", f"Bearer {token}".encode())], "client": ("127.0.0.1", 1),
+    }
+
+
+async def call(middleware, scope):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    await middleware(scope, receive, send)
+    return messages[-1]["body"]
+
+
+def test_identical_reads_share_one_response():
+    async def scenario():
+        calls, gate = [], asyncio.Event()
+
+        async def app(scope, receive, send):
+            calls.append(scope["method"])
+            body = str(len(calls)).encode()
+            if scope["method"] == "GET":
+                await gate.wait()
+            await send({"type": "http.response.start", "status": 200, "headers": []})
+            await send({"type": "http.response.body", "body": body})
+
+        middleware = throttle.ThrottleMiddleware(
+            app, throttle.RateLimiter(0, 1), throttle.RateLimiter(0, 1), throttle.SingleFlight(), lambda a: True,
+        )
+        burst = [asyncio.create_task(call(middleware, request("/summary/categories"))) for _ in range(3)]
+        other = asyncio.create_task(call(middleware, request("/summary/categories", token="t2")))
+        await asyncio.sleep(0)
+        # A write ends sharing: the next identical read runs again
+        await call(middleware, request("/transactions/", method="POST"))
+        after = asyncio.create_task(call(middleware, request("/summary/categories")))
+        await asyncio.sleep(0)
+        gate.set()
+        bodies = await asyncio.gather(*burst, other, after)
+        assert calls == ["GET", "GET", "POST", "GET"]
+        assert bodies == [b"1", b"1", b"1", b"2", b"4"]
+        assert middleware.coalescer.stats() == {"leaders": 3, "coalesced": 2, "in_flight": 0}
+
+    asyncio.run(scenario())
+
+
+def test_throttle_counters_are_only_in_metrics(client, auth):
+    assert client.get("/throttle/stats", headers=auth).status_code == 404
+    rendered = metrics.render()
+    assert 'rate_limited_requests_total{limiter="login"}' in rendered
+    assert "coalesced_requests_total " in rendered
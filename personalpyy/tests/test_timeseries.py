@@ -0,0 +1,29 @@
+def test_timeseries_skips_unreadable_dates(client, auth):
+    for date, amount in (("2024-05-01", 10), ("05/01/2024", 99), ("2024-05-03", -4)):
+        tx = {"date": date, "amount": amount, "category": "food"}
+        client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+    resp = client.get("/analytics/timeseries", headers=auth)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["dates"] == ["2024-05-01", "2024-05-02", "2024-05-03"]
+    assert body["values"] == [10, 10, 6]
+
+
+def test_timeseries_skips_compact_and_out_of_range_dates(client, auth):
+    for date, amount in (("2024-05-01", 10), ("20240501", 99), ("1066-10-14", 7), ("2024-05-02", -4)):
+        tx = {"date": date, "amount": amount, "category": "food"}
+        client.post("/transactions/", json=tx, headers=auth).raise_for_status()
+    for bucket, dates in (("day", ["2024-05-01", "2024-05-02"]), ("month", ["2024-05-01"])):
+        resp = client.get("/analytics/timeseries", params={"bucket": bucket}, headers=auth)
+        assert resp.status_code == 200
+        assert resp.json()["dates"] == dates
+
+
+def test_timeseries_refuses_too_many_buckets(client, auth):
+    params = {"date_from": "0001-01-01", "date_to": "9999-12-31"}
+    resp = client.get("/analytics/timeseries", params=params, headers=auth)
+    assert resp.status_code == 422
+    params = {"date_from": "1900-01-01", "date_to": "2100-12-31", "bucket": "month", "max_points": 10}
+    resp = client.get("/analytics/timeseries", params=params, headers=auth)
+    assert resp.status_code == 200
+    assert resp.json()["buckets"] == 201 * 12
@@ -0,0 +1,221 @@
+"""Per-client rate limiting and single-flight coalescing of identical reads.
+
+ThrottleMiddleware runs in front of the routes:
+
+- Logins and registrations draw from a bucket per client address, whatever
+  headers they carry. Other requests with a token known to be valid draw
+  from that token's bucket; those with any other Authorization header share
+  a bucket per client address, so made-up tokens neither escape the limit
+  nor crowd real ones out of the LRU. An empty bucket is answered with 429
+  and Retry-After before any route or SQL runs.
+- An authenticated GET of a read endpoint (COALESCE_PATHS) that is
+  identical to one already in flight (same token, path, query, Accept and
+  If-None-Match) waits for that request and is sent the same response, so
+  a burst of reruns costs one query and one encoding. Only requests that
+  overlap share; nothing is cached afterwards, and a write by the same
+  token ends sharing for requests that arrive after it completes.
+
+State is per process: with several workers each applies its own limits.
+Everything here runs on the event loop thread, so no locks are needed.
+"""
+import asyncio
+import json
+import math
+import time
+from collections import OrderedDict
+
+# Reads whose responses are built in one piece; the export streams and is
+# not buffered
+COALESCE_PATHS = frozenset({
+    "/transactions/",
+    "/transactions/search",
+    "/transactions/changes",
+    "/summary/categories",
+    "/summary/balance",
+    "/analytics/timeseries",
+})
+LOGIN_PATHS = frozenset({"/token", "/register"})
+
+
+class RateLimiter:
+    """Token buckets keyed by client, refilled lazily at ``rate`` per second.
+
+    Each key may spend up to ``burst`` requests at once and ``rate`` per
+    second after that. Buckets are kept in an LRU of ``maxsize`` keys, so
+    unknown tokens cannot grow it without bound; an evicted key starts over
+    with a full bucket. A rate of 0 disables limiting.
+    """
+
+    def __init__(self, rate, burst, maxsize=10000):
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()
+        self.allowed = 0
+        self.limited = 0
+
+    def acquire(self, key):
+        # Returns 0 if the request may proceed, else seconds until it could
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+        else:
+            tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+            self.allowed += 1
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        self._buckets.clear()
+
+    def stats(self):
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "buckets": len(self._buckets),
+            "rate": self.rate,
+            "burst": self.burst,
+        }
+
+
+class SingleFlight:
+    """In-flight reads by key, each a future of the leader's response.
+
+    The future resolves to (ASGI messages, matched route), or None when the
+    leader failed, in which case each follower runs its own request.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def join(self, key):
+        # Returns (future, True) for a new flight the caller leads, or the
+        # flight already under way and False
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return future, False
+        future = self._flights[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        return future, True
+
+    def finish(self, key, future, result):
+        # forget() may have detached the flight already; its waiters still
+        # get the result
+        if self._flights.get(key) is future:
+            del self._flights[key]
+        future.set_result(result)
+
+    def forget(self, token):
+        # Later identical reads start a new flight instead of joining one that
+        # may have read the data before this token's write
+        for key in [key for key in self._flights if key[0] == token]:
+            del self._flights[key]
+
+    def stats(self):
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._flights)}
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_json(send, status, body, headers=()):
+    data = json.dumps(body).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode()),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+class ThrottleMiddleware:
+    """ASGI middleware applying ``limiter``, ``login_limiter`` and ``coalescer``.
+
+    ``known_token(authorization)`` says whether an Authorization header holds
+    a token that authenticated recently (the token cache), without a query.
+    """
+
+    def __init__(self, app, limiter, login_limiter, coalescer, known_token):
+        self.app = app
+        self.limiter = limiter
+        self.login_limiter = login_limiter
+        self.coalescer = coalescer
+        self.known_token = known_token
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        path, method = scope["path"], scope["method"]
+        authorization = _header(scope, b"authorization")
+        client = scope.get("client")
+        address = client[0] if client else None
+        if path in LOGIN_PATHS:
+            wait = self.login_limiter.acquire(address)
+        elif authorization is not None:
+            wait = self.limiter.acquire(authorization if self.known_token(authorization) else address)
+        else:
+            wait = 0.0
+        if wait:
+            return await _send_json(send, 429, {"detail": "Too many requests"},
+                                    [(b"retry-after", str(math.ceil(wait)).encode())])
+        if authorization is None or not self.coalescer.enabled:
+            return await self.app(scope, receive, send)
+        if method != "GET":
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                self.coalescer.forget(authorization)
+        if path not in COALESCE_PATHS:
+            return await self.app(scope, receive, send)
+
+        key = (authorization, path, scope["query_string"], _header(scope, b"accept"),
+               _header(scope, b"if-none-match"))
+        future, leader = self.coalescer.join(key)
+        if leader:
+            return await self._lead(scope, receive, send, key, future)
+        # shield: a follower that goes away must not cancel the others' flight
+        result = await asyncio.shield(future)
+        if result is None:
+            return await self.app(scope, receive, send)
+        messages, route = result
+        if route is not None:
+            # For MetricsMiddleware, which labels requests by matched route
+            scope["route"] = route
+        for message in messages:
+            await send(message)
+
+    async def _lead(self, scope, receive, send, key, future):
+        messages = []
+
+        async def send_wrapper(message):
+            messages.append(message)
+            await send(message)
+
+        result = None
+        try:
+            await self.app(scope, receive, send_wrapper)
+            if messages and not messages[-1].get("more_body", False):
+                result = (messages, scope.get("route"))
+        finally:
+            self.coalescer.finish(key, future, result)
@@ -0,0 +1,209 @@
+"""Time-bucketed series for charts, downsampled on the server.
+
+SQL sums the user's amounts per day (daily_balances when the whole balance
+is wanted, otherwise transactions). NumPy then cuts the days at bucket
+edges with one cumulative sum, so empty days, weeks or months come out as
+zero (or as the unchanged balance) without a row per bucket. Series longer
+than max_points are reduced with Largest-Triangle-Three-Buckets, which
+keeps the peaks and dips that averaging would flatten, so the payload is
+bounded however long the history is.
+"""
+import datetime
+import re
+
+from models import from_cents
+
+BUCKETS = ("day", "week", "month")
+METRICS = ("balance", "spend", "income")
+DEFAULT_MAX_POINTS = 500
+# Buckets one series may span before downsampling (about 137 years of days);
+# wider ranges are refused rather than allocated
+MAX_BUCKETS = 50000
+# Stored dates outside these years are treated as unreadable. numpy reads
+# "20240501" as the year 20240501, which would span billions of days.
+MIN_YEAR, MAX_YEAR = 1900, 2200
+_ISO_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+# Per-day value of each metric, in cents; spend is positive
+_METRIC_SQL = {
+    "balance": ("amount_cents", ""),
+    "spend": ("-amount_cents", "amount_cents < 0"),
+    "income": ("amount_cents", "amount_cents > 0"),
+}
+
+
+def daily_values(conn, user_id=None, metric="balance", category=None, date_from=None, date_to=None):
+    """Rows of (date, cents) for every day with transactions, plus the opening balance.
+
+    The opening balance (everything before date_from) is only computed for
+    metric="balance" and is 0 otherwise.
+    """
+    if metric == "balance" and category is None:
+        # Already summed per day by the aggregate table
+        table, value, clauses = "daily_balances", "net_cents", []
+    else:
+        value, condition = _METRIC_SQL[metric]
+        table, clauses = "transactions", [condition] if condition else []
+    params = []
+    if user_id is not None:
+        clauses.append("user_id = ?")
+        params.append(user_id)
+    if category is not None:
+        clauses.append("category = ?")
+        params.append(category)
+    opening = 0
+    if metric == "balance" and date_from is not None:
+        where = " AND ".join(clauses + ["date < ?"])
+        opening = conn.execute(f"SELECT COALESCE(SUM({value}), 0) FROM {table} WHERE {where}",
+                               params + [date_from]).fetchone()[0]
+    if date_from is not None:
+        clauses.append("date >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("date <= ?")
+        params.append(date_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = conn.execute(
+        f"SELECT date, SUM({value}) FROM {table} {where} GROUP BY date ORDER BY date", params
+    ).fetchall()
+    return [tuple(row) for row in rows], opening
+
+
+def bucket_starts(first, last, bucket):
+    # First day of every bucket from the one holding first to the one holding last
+    import numpy as np
+
+    if bucket == "month":
+        return np.arange(first.astype("M8[M]"), last.astype("M8[M]") + 1).astype("M8[D]")
+    if bucket == "week":
+        # Weeks start on Monday; 1970-01-01 was a Thursday
+        first = first - (first.astype("int64") + 3) % 7
+        return np.arange(first, last + 1, 7)
+    return np.arange(first, last + 1)
+
+
+def _iso_day(date):
+    if isinstance(date, str) and _ISO_DATE.fullmatch(date):
+        try:
+            datetime.date.fromisoformat(date)
+            return date
+        except ValueError:
+            pass
+    return "NaT"
+
+
+def parse_days(dates):
+    # Dates are stored as text and are YYYY-MM-DD unless written by something
+    # else; anything else, or a year outside MIN_YEAR..MAX_YEAR, becomes NaT
+    import numpy as np
+
+    try:
+        days = np.array(dates, dtype="M8[D]")
+    except ValueError:
+        days = None
+    # numpy also reads "2024", "2024-05" and "20240501", none of them 10 long
+    if days is None or any(len(date) != 10 for date in dates):
+        days = np.array([_iso_day(date) for date in dates], dtype="M8[D]")
+    low, high = np.datetime64(f"{MIN_YEAR}-01-01", "D"), np.datetime64(f"{MAX_YEAR}-12-31", "D")
+    days[(days < low) | (days > high)] = np.datetime64("NaT")
+    return days
+
+
+def bucket_count(first, last, bucket):
+    if bucket == "month":
+        return int((last.astype("M8[M]") - first.astype("M8[M]")).astype("int64")) + 1
+    days = int((last - first).astype("int64")) + 1
+    return -(-days // 7) + 1 if bucket == "week" else days
+
+
+def bucket_series(rows, bucket="day", cumulative=False, opening=0, date_from=None, date_to=None):
+    """Sum (date, cents) rows into buckets; returns (bucket start days, cents).
+
+    With cumulative=True each value is the running total (plus opening) at
+    the end of its bucket. The buckets span date_from..date_to when given,
+    otherwise the first to the last row; ValueError if that is more than
+    MAX_BUCKETS buckets.
+    """
+    import numpy as np
+
+    days = parse_days([row[0] for row in rows])
+    values = np.array([row[1] for row in rows], dtype=np.int64)
+    if np.isnat(days).any():
+        # Rows whose date cannot be read are left out, as analysis.py does
+        keep = ~np.isnat(days)
+        order = np.argsort(days[keep], kind="stable")
+        days, values = days[keep][order], values[keep][order]
+    if not len(days) and (date_from is None or date_to is None):
+        return days, values
+    first = np.datetime64(date_from, "D") if date_from is not None else days[0]
+    last = np.datetime64(date_to, "D") if date_to is not None else days[-1]
+    if last < first:
+        return days[:0], values[:0]
+    count = bucket_count(first, last, bucket)
+    if count > MAX_BUCKETS:
+        raise ValueError(f"Range spans {count} {bucket} buckets; at most {MAX_BUCKETS} are allowed")
+    starts = bucket_starts(first, last, bucket)
+    # Running total up to the end of each bucket: every row before the next
+    # bucket's first day
+    running = np.concatenate(([0], np.cumsum(values)))
+    ends = np.searchsorted(days, starts[1:], side="left")
+    totals = running[np.append(ends, len(days))]
+    if cumulative:
+        return starts, opening + totals
+    return starts, np.diff(totals, prepend=0)
+
+
+def lttb(x, y, max_points):
+    """Indices of at most ``max_points`` points that keep the shape of (x, y).
+
+    Largest-Triangle-Three-Buckets: the first and last points are kept; the
+    rest are split into max_points - 2 buckets and from each the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket is kept.
+    """
+    import numpy as np
+
+    n = len(x)
+    if max_points >= n or max_points < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x, next_y = x[end:edges[i + 2]].mean(), y[end:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[n - 1], y[n - 1]
+        px, py = x[previous], y[previous]
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((px - next_x) * (y[start:end] - py) - (px - x[start:end]) * (next_y - py))
+        previous = start + int(area.argmax())
+        keep[i + 1] = previous
+    return keep
+
+
+def series(rows, opening=0, bucket="day", metric="balance", date_from=None, date_to=None,
+           max_points=DEFAULT_MAX_POINTS):
+    """Bucketed, downsampled series ready to serve.
+
+    Returns {"buckets": number of buckets before downsampling, "dates":
+    [...], "values": [...]} with values in currency units.
+    """
+    starts, cents = bucket_series(rows, bucket, metric == "balance", opening, date_from, date_to)
+    keep = lttb(starts.astype("int64"), cents, max_points)
+    return {
+        "buckets": len(starts),
+        "dates": [str(day) for day in starts[keep]],
+        "values": [from_cents(int(value)) for value in cents[keep]],
+    }
+
+
+def timeseries(conn, user_id, bucket="day", metric="balance", category=None, date_from=None, date_to=None,
+               max_points=DEFAULT_MAX_POINTS):
+    rows, opening = daily_values(conn, user_id, metric, category, date_from, date_to)
+    data = series(rows, opening, bucket, metric, date_from, date_to, max_points)
+    return dict(bucket=bucket, metric=metric, category=category, **data)